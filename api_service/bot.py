@@ -8,10 +8,13 @@ from signal import signal, SIGINT
 from traceback import format_exc as trace
 from requests.exceptions import ReadTimeout
 from pprint import pformat as pf
+from threading import RLock
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from .report_store import UserReportStore
 from .markup	   import kb_initial, kb_choose_tag, kb_values, report_keyboard
 from .bot_config   import TEXTS, INFO, OK, ERROR, TAG_LABELS, SAVE_FILES_DIR, QUERY_MIN_LIMIT
+from .bot_config   import REPORT_PREFETCH, REPORT_RENDER_WORKERS
 
 secrets = json.load(open('secrets.json'))
 BOT_TOKEN, ADMIN_IDS = secrets['BOT_TOKEN'], set(secrets['ADMIN_IDS']) # set - на всякий случай. вдруг много админов.
@@ -58,6 +61,10 @@ class BotCore:
 		self.fm = file_manager
 		# хранилище отчётов
 		self.store = UserReportStore()
+		# страницы отчётов рисуются при открытии, следующие REPORT_PREFETCH - заранее в фоне
+		self.render_pool = ThreadPoolExecutor(max_workers=REPORT_RENDER_WORKERS)
+		self.renders = {} # (путь файла, page_index) -> Future отрисовки, пока она идёт
+		self.renders_lock = RLock()
 
 
 		# --- Хендлеры ---
@@ -388,36 +395,78 @@ class BotCore:
 			self.bot.send_message(user_id, TEXTS["no_results"])
 			return
 
-		# рендерим каждую страницу и сохраняем в store
-		for idx, item in enumerate(results):
-			# 1) генерируем уникальное имя и путь
-			img_name = f"{report_id}_{idx}.png"
-			output_path = Path(self.store.img_dir) / img_name
-
-			# 2) рендерим страницу в нужную папку
-			self.fm.renderToPic(item["path"], page_index=item["page"] - 1, output_path=output_path)
-
-			# 3) обводим найденные coords, если есть
-			for coord in item.get("coords", []):
-				self.fm.drawRectangle(output_path, coord, output_path)
-
-			# 4) собираем теги из БД
-			tags = self.db[item["doc_id"]]["tags"]
-
-			# 5) сохраняем имя файла и теги в sqlite
-			self.store.add_page(report_id, idx, img_name, tags, item["doc_id"])
+		# в отчёт сохраняются только найденные страницы (файл, страница, координаты) и теги,
+		# картинки берутся из общего кеша страниц (FileManager.renderCached) при открытии
+		tags = self.db.tagsOf(item["doc_id"] for item in results)
+		hits = [{**item, "tags": tags.get(item["doc_id"], {})} for item in results]
+		self.store.add_hits(report_id, hits)
 
 		# отправляем первую страницу
 		self._send_report(user_id, report_id, 0, None)
 
 
+	def _render(self, path, page_index, background=False):
+		'''
+		Страница файла для highlightPage (из кеша или отрисованная, если её там нет) без повторов:
+		если отрисовка уже идёт (подгрузка заранее, другой отчёт), ждём её, а не рисуем второй раз.
+		background=True - в фоне, возвращается Future
+		'''
+		key = (path, page_index)
+		with self.renders_lock:
+			future = self.renders.get(key)
+			owner = future is None
+			if owner:
+				future = Future()
+				self.renders[key] = future
+
+		if owner:
+			if background:
+				self.render_pool.submit(self._renderJob, key, future, True)
+			else:
+				self._renderJob(key, future, False)
+		return future if background else future.result()
+
+	def _renderJob(self, key, future, background):
+		path, page_index = key
+		try:
+			if background:
+				# подгрузка заранее - страница нужна в кеше
+				future.set_result(self.fm.renderCached(path, page_index=page_index))
+			else:
+				# страницу ждёт пользователь - рисуется в память, в кеш пишется в фоне
+				future.set_result(self.fm.renderPage(path, page_index=page_index))
+		except Exception as e:
+			print(f"BotCore._renderJob {ERROR}: {key}\n{e}")
+			future.set_exception(e)
+		finally:
+			with self.renders_lock:
+				self.renders.pop(key, None)
+
+	def _prefetch(self, report_id, page_idx, total):
+		'''следующие REPORT_PREFETCH страниц отчёта рисуются в фоне, пока пользователь смотрит текущую'''
+		for idx in range(page_idx + 1, min(page_idx + 1 + REPORT_PREFETCH, total)):
+			page = self.store.get_page(report_id, idx)
+			if page and page["path"]:
+				self._render(page["path"], page["page"] - 1, background=True)
+
+
 	def _send_report(self, chat_id, report_id, page_idx, message_id=None):
 		page = self.store.get_page(report_id, page_idx)
 		if not page:
 			return
 
-		# путь до файла на диске
-		img_path = Path(self.store.img_dir) / page["img_path"]
+		if page["path"]:
+			# страница из кеша или из памяти, обводка найденного - поверх неё,
+			# в Telegram уходят байты картинки без записи на диск
+			base = self._render(page["path"], page["page"] - 1)
+			if base is None:
+				return
+			photo = self.fm.highlightPage(base, page["coords"], hit_size=page["hit_size"])
+		else:
+			# отчёт, созданный до общего кеша страниц: картинка с обводкой уже лежит на диске
+			if not (page["img_path"] and os.path.exists(page["img_path"])):
+				return
+			photo = Path(page["img_path"]).read_bytes()
 
 		# собираем подпись со ссылкой на запрос и теги
 		lines = [
@@ -435,7 +484,6 @@ class BotCore:
 				.report_keyboard(report_id, page_idx, page["total"], page["doc_id"])
 
 		# отправка или редактирование
-		photo = open(img_path, "rb")
 		if message_id:
 			media = InputMediaPhoto(photo, caption=caption)
 			self.bot.edit_message_media(
@@ -452,6 +500,9 @@ class BotCore:
 				reply_markup=kb
 			)
 
+		# пока пользователь смотрит эту страницу - рисуем следующие
+		self._prefetch(report_id, page_idx, page["total"])
+
 
 	def start(self, no_fall=False):
 		if not no_fall:
@@ -1,6 +1,8 @@
 
 QUERY_MIN_LIMIT = 3
 SAVE_FILES_DIR = "./files/"
+REPORT_PREFETCH = 2 # сколько следующих страниц отчёта отрисовывается заранее, пока пользователь листает
+REPORT_RENDER_WORKERS = 2 # потоков фоновой отрисовки страниц отчётов
 
 # color
 INFO = "\033[96m<INFO>\033[0m"
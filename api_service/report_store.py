@@ -36,6 +36,13 @@ class UserReportStore:
           doc_id TEXT,
           PRIMARY KEY(report_id, page_idx)
         )''')
+        # отчёт хранит найденные страницы (файл, номер страницы, координаты), картинки берутся
+        # из общего кеша страниц; img_name - картинка с обводкой у отчётов, созданных до этого
+        columns = {row[1] for row in c.execute('PRAGMA table_info(pages)')}
+        # hit_size - слов в одном вхождении (coords делится на вхождения для обводки)
+        for column, column_type in (("path", "TEXT"), ("page", "INTEGER"), ("coords_json", "TEXT"), ("hit_size", "INTEGER")):
+            if column not in columns:
+                c.execute(f'ALTER TABLE pages ADD COLUMN {column} {column_type}')
 
         # таблица для хранения фильтров и последнего запроса пользователя
         c.execute('''
@@ -124,17 +131,33 @@ class UserReportStore:
         )
         self.conn.commit()
 
-    def get_page(self, report_id: str, page_idx: int): # FIXME: структура громоздкая, переделать, упростить и достичь быстрой подгрузки при перелистывании
+    def add_hits(self, report_id: str, hits: list):
+        """
+        Сохраняет все результаты поиска одним запросом, без картинок.
+        hits - [{"doc_id", "path", "page", "coords", "hit_size", "tags"}, ...] в порядке страниц отчёта
+        """
+        rows = [
+            (report_id, idx, json.dumps(hit["tags"], ensure_ascii=False), hit["doc_id"],
+             str(hit["path"]), hit["page"], json.dumps(hit.get("coords", [])), hit.get("hit_size"))
+            for idx, hit in enumerate(hits)
+        ]
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO pages(report_id, page_idx, tags_json, doc_id, path, page, coords_json, hit_size) VALUES(?,?,?,?,?,?,?,?)',
+            rows
+        )
+        self.conn.commit()
+
+    def get_page(self, report_id: str, page_idx: int):
         c = self.conn.cursor()
-        # получаем имя картинки и теги
+        # получаем имя картинки (только у старых отчётов), теги и саму найденную страницу
         c.execute(
-            'SELECT img_name, tags_json, doc_id FROM pages WHERE report_id=? AND page_idx=?',
+            'SELECT img_name, tags_json, doc_id, path, page, coords_json, hit_size FROM pages WHERE report_id=? AND page_idx=?',
             (report_id, page_idx)
         )
         row = c.fetchone()
         if not row: return None
 
-        img_name, tags_json, doc_id = row
+        img_name, tags_json, doc_id, path, page, coords_json, hit_size = row
         tags = json.loads(tags_json)
 
         # общее число страниц
@@ -153,12 +176,16 @@ class UserReportStore:
         query = qr[0] if qr else ""
 
         return {
-            "img_path": os.path.join(self.img_dir, img_name),
+            "img_path": os.path.join(self.img_dir, img_name) if img_name else None,
             "tags": tags,
             "page_idx": page_idx,
             "total": total,
             "query": query,
-            'doc_id': doc_id
+            'doc_id': doc_id,
+            "path": path,
+            "page": page,
+            "coords": json.loads(coords_json) if coords_json else [],
+            "hit_size": hit_size
         }
     
 
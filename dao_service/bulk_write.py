@@ -0,0 +1,146 @@
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from pymongo.errors import PyMongoError
+
+from .dao_config import OK, ERROR, INFO
+from .dao_config import DB_WRITE_BATCH
+
+
+'''
+пакетная запись документов
+
+insertMany пишет документы пачками по DB_WRITE_BATCH: на пачку - один insert_many родителей,
+один insert_many страниц, один insert_many записей индекса и одно обновление статистики,
+вместо нескольких запросов на каждый документ. все вставки неупорядоченные (ordered=False):
+ошибка одного документа не останавливает остальные.
+
+результат - по записи на каждый документ, в том же порядке: (doc_id, None) или (None, ошибка).
+документ, у которого упала запись страниц или индекса, удаляется целиком (del DB[doc_id]).
+если пачка упала не BulkWriteError (DocumentTooLarge, InvalidDocument, обрыв связи...), она
+дописывается по одному документу. исключения из insertMany не выходят.
+'''
+
+
+class BulkWriter:
+	# При использовании предполагается, что self.collection, self.pages и self.page_storage уже определены,
+	# а _fillDoc, _prepareDoc, _splitDoc, _pageRecords, indexDocs и __delitem__ доступны (DataBase)
+
+	@staticmethod
+	def _failedIndexes(error) -> dict:
+		'''{номер записи в пачке: сообщение} из BulkWriteError'''
+		return {err["index"]: err.get("errmsg", str(err)) for err in error.details.get("writeErrors", [])}
+
+	@staticmethod
+	def _insertRecords(collection, records) -> dict:
+		'''
+		insert_many записей, {номер записи: сообщение} для не записанных.
+		Пачка упала целиком (не BulkWriteError) - записи вставляются по одной,
+		уже записанные до ошибки пропускаются
+		'''
+		try:
+			collection.insert_many(records, ordered=False)
+			return {}
+		except BulkWriteError as e:
+			return BulkWriter._failedIndexes(e)
+		except Exception as e:
+			print(f'BulkWriter._insertRecords {ERROR}: пачка {collection.name} не записана ({type(e).__name__}), запись по одной')
+		failed = {}
+		for position, record in enumerate(records):
+			try:
+				if collection.find_one({"_id": record["_id"]}, {"_id": 1}) is None:
+					collection.insert_one(record)
+			except Exception as e:
+				failed[position] = f'{type(e).__name__}: {e}'
+		return failed
+
+	def insertMany(self, docs, batch_size=DB_WRITE_BATCH) -> list:
+		'''
+		Создаёт документы пачками. docs - результаты парсеров (как для DB(data)).
+		Возвращает [(doc_id, None) или (None, ошибка), ...] в порядке docs
+		'''
+		results = [(None, 'не записан')] * len(docs)
+		for start in range(0, len(docs), batch_size):
+			try:
+				batch = self._insertBatch(docs[start:start + batch_size])
+			except Exception as e:
+				# не должно случаться (_insertBatch ловит ошибки по документам), но пачка не роняет остальные
+				print(f'BulkWriter.insertMany {ERROR}: пачка не записана: {e}')
+				batch = [(None, f'{type(e).__name__}: {e}')] * len(docs[start:start + batch_size])
+			for offset, result in enumerate(batch):
+				results[start + offset] = result
+		if any(doc_id for doc_id, _ in results):
+			self._bumpGeneration()
+		return results
+
+	def _insertBatch(self, docs) -> list:
+		results = [None] * len(docs)
+		prepared = [] # (номер документа, родитель, pages, words)
+		for index, data in enumerate(docs):
+			try:
+				# автоочистка текста, дата, очистка пустых слов, токены и порядок чтения
+				self._fillDoc(data)
+				self._prepareDoc(data)
+				parent, pages, words = self._splitDoc(data) if self.page_storage else (data, data["pages"], data["words"])
+				# id заранее - ошибки вставки сопоставляются документам по номеру (id из дампа сохраняется)
+				parent["_id"] = ObjectId(parent["_id"]) if parent.get("_id") else ObjectId()
+				prepared.append((index, parent, pages, words))
+			except Exception as e:
+				results[index] = (None, f'{type(e).__name__}: {e}')
+
+		# родители
+		failed = self._insertRecords(self.collection, [parent for _, parent, _, _ in prepared]) if prepared else {}
+		written = []
+		for position, (index, parent, pages, words) in enumerate(prepared):
+			if position in failed:
+				results[index] = (None, failed[position])
+			else:
+				written.append((index, str(parent["_id"]), pages, words))
+
+		# страницы и индекс - одной пачкой на все документы
+		broken = {} # doc_id -> ошибка
+		if self.page_storage and written:
+			records, owners = [], []
+			for _, doc_id, pages, words in written:
+				try:
+					doc_records = self._pageRecords(doc_id, pages, words)
+				except Exception as e:
+					broken[doc_id] = f'{type(e).__name__}: {e}'
+					continue
+				for record in doc_records:
+					record["_id"] = ObjectId() # id заранее - при записи по одной уже записанные пропускаются
+				records += doc_records
+				owners += [doc_id] * len(doc_records)
+			if records:
+				for position, message in self._insertRecords(self.pages, records).items():
+					broken.setdefault(owners[position], message)
+		try:
+			self.indexDocs([(doc_id, words) for _, doc_id, _, words in written if doc_id not in broken])
+		except Exception as e:
+			# индекс пачки записан не полностью - документы пачки переиндексируются по одному
+			print(f'BulkWriter._insertBatch {ERROR}: индекс пачки: {e}')
+			for _, doc_id, _, words in written:
+				if doc_id in broken: continue
+				try:
+					self.unindexDoc(doc_id)
+					self.indexDoc(doc_id, words)
+				except Exception as doc_error:
+					broken[doc_id] = f'{type(doc_error).__name__}: {doc_error}'
+
+		for index, doc_id, _, _ in written:
+			if doc_id in broken:
+				self._dropPartial(doc_id) # недописанный документ не должен находиться поиском
+				results[index] = (None, broken[doc_id])
+			else:
+				results[index] = (doc_id, None)
+
+		for doc_id, error in results:
+			if error: print(f'BulkWriter.insertMany {ERROR}: {error}')
+		print(f'BulkWriter.insertMany {OK}: записано {sum(doc_id is not None for doc_id, _ in results)}/{len(docs)} документов')
+		return results
+
+	def _dropPartial(self, doc_id):
+		'''удаляет частично записанный документ (родитель, страницы, индекс); ошибка удаления не прерывает пачку'''
+		try:
+			del self[doc_id]
+		except Exception as e:
+			print(f'BulkWriter._dropPartial {ERROR}: {doc_id} не удалён: {e}')
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 # ============= color configs =============
 INFO = "\033[96m<INFO>\033[0m"
 OK = "\033[92m<OK>\033[0m"
@@ -10,4 +12,45 @@ DB_NAME = "dao_service"
 DB_INDEX_NAME = "lectures"
 CONN_TIMEOUT = 3000 # milliseconds
 
-KMP_MODULE_PATH = './dao_service/kmp_module.cpp'
+# ============= C++ kmp configs =============
+CFD = Path(__file__).resolve().parent # (current file directory)
+KMP_MODULE_PATH = CFD / 'kmp_module.cpp'
+KMP_BUILD_DIR = CFD / 'build' # кеш собранных библиотек kmp_module_<хеш>.so
+KMP_CXX_FLAGS = ['-O2', '-std=c++17', '-shared', '-fPIC', '-DKMP_SHARED_LIBRARY']
+
+# ============= search index configs =============
+DB_POSTINGS_SUFFIX = "_postings" # коллекция позиционного индекса: <collection_name>_postings
+SEARCH_USE_INDEX = True # False - всегда искать старым сканированием (regex + kmp)
+DB_PAGES_SUFFIX = "_pages" # коллекция страниц документов: <collection_name>_pages
+PAGE_STORAGE = True # True - страницы новых документов хранятся отдельными записями
+KMP_BATCH_PAGES = 2000 # сколько страниц сканирования отдаётся в kmpSearchBatch за один вызов
+SEARCH_ENGINE = 'cpp' # движок сканирования: 'cpp' (kmpSearch_batch), 'python' (kmpSearch_python), 'numpy' (хеши слов)
+SEARCH_ITER_DOCS = 20 # DataBase.search_iter: сколько найденных индексом документов читается из базы за раз
+SEARCH_ITER_FIRST_PAGES = 50 # DataBase.search_iter: первая пачка сканирования (дальше растёт до KMP_BATCH_PAGES)
+MATCH_SUBSTRING = False # True - старое поведение kmp: слово страницы содержит слово фразы ('br' найдётся в 'break')
+
+# ============= search cache configs =============
+QUERY_CACHE = True # кеш результатов DataBase.search (см. query_cache.py)
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024 # бюджет памяти кеша (примерная оценка размера результатов)
+QUERY_CACHE_TTL = 600 # seconds - время жизни записи кеша
+DB_META_SUFFIX = "_meta" # служебная коллекция (поколение коллекции для кеша): <collection_name>_meta
+DB_MANIFEST_SUFFIX = "_manifest" # проиндексированные файлы (путь, размер, mtime, hash) для FileManager.syncPath
+DB_WRITE_BATCH = 100 # документов в одной пачке записи (BulkWriter.insertMany, rebase)
+DB_EXPORT_BATCH = 50 # JsonHandler.exportToJson: документов, которые курсор получает с сервера за раз
+JSON_READ_CHUNK = 1024 * 1024 # JsonHandler.importFromJson: сколько символов JSON-массива читается за раз
+
+# ============= ranking configs =============
+SEARCH_RANK = True # True - результаты поиска по индексу сортируются по оценке BM25 (см. ranking.py)
+DB_PAGELEN_SUFFIX = "_pagelen" # длины страниц: <collection_name>_pagelen
+DB_TERMS_SUFFIX = "_terms" # на скольких страницах встречается токен: <collection_name>_terms
+BM25_K1 = 1.2 # насыщение частоты слова на странице
+BM25_B = 0.75 # нормировка по длине страницы (0 - без нормировки)
+RANK_PHRASE_WEIGHT = 1.0 # вес числа точных вхождений всей фразы (для фраз из нескольких слов)
+RANK_FILENAME_BOOST = 1.5 # бонус, если слова фразы есть в имени файла
+RANK_SUBJECT_BOOST = 1.0 # бонус, если слова фразы есть в предмете (tags.subject)
+
+# ============= fuzzy search configs =============
+FUZZY_SEARCH = True # True - слова фразы ищутся с учётом ошибок OCR (см. fuzzy_search.py), только поиск по индексу
+FUZZY_DISTANCE_STEPS = ((5, 1), (9, 2)) # (длина слова от, допустимое число правок): короче 5 букв - только замена латинских двойников
+FUZZY_MAX_VARIANTS = 50 # сколько слов словаря максимум подставляется вместо одного слова фразы
+FUZZY_REFRESH = 60 # seconds - как часто можно перестраивать словарь в памяти после изменений базы
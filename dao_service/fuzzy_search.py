@@ -0,0 +1,182 @@
+import time, threading
+import numpy as np
+
+from .dao_config import OK, ERROR, INFO
+from .dao_config import FUZZY_DISTANCE_STEPS, FUZZY_MAX_VARIANTS, FUZZY_REFRESH
+from .stopwatch import stopWatch as sw
+
+
+'''
+нечёткий поиск для текста после OCR
+
+частые ошибки Tesseract: латинская буква вместо похожей русской ("биoлогию" с латинской o),
+пропущенная/лишняя/заменённая буква. перед поиском по индексу каждый токен фразы
+раскрывается в набор слов словаря (все токены базы), похожих на него:
+
+- латинские двойники русских букв в словах с кириллицей приводятся к кириллице (foldToken)
+- триграммный индекс словаря: кандидаты - слова, у которых достаточно общих триграмм
+  (каждая правка портит не больше 3 триграмм), и длина отличается не больше допустимого
+- кандидаты проверяются расстоянием Левенштейна с ограничением FUZZY_DISTANCE_STEPS
+- MATCH_SUBSTRING: токен раскрывается в слова словаря, которые его содержат
+
+словарь держится в памяти процесса и перестраивается в фоне, когда коллекция поменялась
+(поколение из <collection_name>_meta), но не чаще раза в FUZZY_REFRESH секунд.
+сам токен фразы в варианты попадает всегда, так что точное совпадение находится и по старому словарю
+'''
+
+# латинские буквы и цифры, которые OCR путает с русскими
+_HOMOGLYPHS = str.maketrans({
+	'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+	'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', '0': 'о', '3': 'з'
+})
+
+
+def foldToken(token):
+	'''Слово с кириллицей -> латинские двойники заменены русскими буквами, остальные слова как есть'''
+	if any('а' <= ch <= 'я' for ch in token):
+		return token.translate(_HOMOGLYPHS)
+	return token
+
+
+def _trigrams(word, pad=True):
+	if pad: word = f'  {word} '
+	return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def _editDistance(a, b, limit):
+	'''Расстояние Левенштейна или limit + 1, если оно больше limit'''
+	if abs(len(a) - len(b)) > limit: return limit + 1
+	previous = list(range(len(b) + 1))
+	for i, ch_a in enumerate(a, start=1):
+		current = [i]
+		for j, ch_b in enumerate(b, start=1):
+			current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch_a != ch_b)))
+		if min(current) > limit: return limit + 1
+		previous = current
+	return previous[-1]
+
+
+def maxDistance(token):
+	'''Допустимое число правок для токена такой длины'''
+	distance = 0
+	for min_length, steps in FUZZY_DISTANCE_STEPS:
+		if len(token) >= min_length: distance = steps
+	return distance
+
+
+class TrigramIndex:
+	'''Триграммный индекс по словарю: триграмма -> номера слов (np.int32)'''
+
+	def __init__(self, terms):
+		self.terms = list(terms)
+		self.folded = [foldToken(term) for term in self.terms]
+		self.lengths = np.array([len(word) for word in self.folded], dtype=np.int32)
+
+		grams = {}
+		for term_id, word in enumerate(self.folded):
+			for gram in _trigrams(word):
+				grams.setdefault(gram, []).append(term_id)
+		self.grams = {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()}
+
+	def __len__(self):
+		return len(self.terms)
+
+	def similar(self, token, max_distance) -> list:
+		'''Слова словаря на расстоянии не больше max_distance (после foldToken), ближайшие первыми'''
+		folded = foldToken(token)
+		query_grams = _trigrams(folded)
+		postings = [self.grams[gram] for gram in query_grams if gram in self.grams]
+		if not postings: return []
+
+		# фильтр: число общих триграмм (q-граммная лемма) и разница длин
+		shared = np.bincount(np.concatenate(postings), minlength=len(self.terms))
+		need = max(len(query_grams) - 3 * max_distance, 1)
+		candidates = np.flatnonzero(shared >= need)
+		candidates = candidates[np.abs(self.lengths[candidates] - len(folded)) <= max_distance]
+
+		found = []
+		for term_id in candidates.tolist():
+			distance = _editDistance(folded, self.folded[term_id], max_distance)
+			if distance <= max_distance:
+				found.append((distance, self.terms[term_id]))
+		found.sort()
+		return [term for _, term in found]
+
+	def containing(self, token) -> list:
+		'''Слова словаря, содержащие token (после foldToken)'''
+		folded = foldToken(token)
+		grams = _trigrams(folded, pad=False)
+		if grams:
+			postings = sorted((self.grams.get(gram, np.empty(0, dtype=np.int32)) for gram in grams), key=len)
+			candidates = postings[0]
+			for ids in postings[1:]:
+				candidates = np.intersect1d(candidates, ids, assume_unique=True)
+			candidates = candidates.tolist()
+		else:
+			# токен короче триграммы - только перебором
+			candidates = range(len(self.terms))
+		return [self.terms[term_id] for term_id in candidates if folded in self.folded[term_id]]
+
+
+class FuzzyTerms:
+	# При использовании предполагается, что self.terms, self.postings, self.meta уже определены
+
+	_vocab = None
+	_vocab_generation = None
+	_vocab_built = 0.0
+	_vocab_rebuilding = False
+	_vocab_lock = threading.Lock()
+
+	def _vocabulary(self):
+		'''Все токены базы: из таблицы частот (Bm25Ranking), без неё - из индекса'''
+		if self.statsReady():
+			return [rec["_id"] for rec in self.terms.find({}, {"_id": 1})]
+		return self.postings.distinct("token")
+
+	def _buildVocab(self, generation):
+		time_point = sw()
+		try:
+			vocab = TrigramIndex(self._vocabulary())
+		except Exception as e:
+			print(f'FuzzyTerms._buildVocab {ERROR}: {e}')
+			vocab = None
+		with self._vocab_lock:
+			if vocab is not None:
+				self._vocab, self._vocab_generation = vocab, generation
+				print(f'FuzzyTerms._buildVocab {OK}: словарь {len(vocab)} слов, построен за {sw(time_point)}')
+			self._vocab_built = time.monotonic()
+			self._vocab_rebuilding = False
+
+	def vocabIndex(self) -> TrigramIndex:
+		'''
+		Триграммный индекс словаря. Первый раз строится сразу,
+		после изменений базы - в фоне (не чаще FUZZY_REFRESH), пока поиск идёт по старому словарю.
+		'''
+		generation = self._currentGeneration()
+		with self._vocab_lock:
+			vocab = self._vocab
+			stale = vocab is not None and generation != self._vocab_generation
+			rebuild = stale and not self._vocab_rebuilding and time.monotonic() - self._vocab_built >= FUZZY_REFRESH
+			if rebuild:
+				self._vocab_rebuilding = True
+		if vocab is None:
+			self._buildVocab(generation)
+			return self._vocab or TrigramIndex([])
+		if rebuild:
+			threading.Thread(target=self._buildVocab, args=(generation,), daemon=True).start()
+		return vocab
+
+	def expandTokens(self, tokens, substring=False) -> dict:
+		'''
+		{token: [варианты из словаря]} для каждого токена фразы.
+		Сам токен всегда первый; substring=True - слова словаря, содержащие токен.
+		'''
+		vocab = self.vocabIndex()
+		variants = {}
+		for token in dict.fromkeys(tokens):
+			if substring:
+				found = vocab.containing(token)
+			else:
+				found = vocab.similar(token, maxDistance(token))
+			variants[token] = [token] + [term for term in found if term != token][:FUZZY_MAX_VARIANTS]
+		return variants
@@ -0,0 +1,173 @@
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+
+from .dao_config import OK, ERROR, INFO
+
+
+'''
+позиционный инвертированный индекс
+
+одна запись индекса = один токен на одной странице одного документа:
+{"token": "биологию", "doc_id": ObjectId(...), "page": 2, "positions": [0, 4, 6]}
+- page - индекс страницы документа (с нуля)
+- positions - номера слов страницы в порядке чтения (см. UtilityDBTools._prepareDoc)
+
+фраза ищется пересечением списков вхождений:
+слово j фразы должно стоять на позиции start + j той же страницы
+
+индекс полный (им можно искать), если в <collection_name>_meta есть {"_id": "index"}:
+запись появляется, когда коллекция индексируется с пустой, или после rebuildIndex()
+'''
+
+
+class InvertedIndex:
+	# При использовании предполагается, что self.collection, self.postings и self.meta уже определены
+
+	_INDEX_ID = "index"
+
+	def _ensurePostingsIndex(self):
+		# составной индекс покрывает и поиск по токену, и сужение по документам
+		self.postings.create_index([("token", ASCENDING), ("doc_id", ASCENDING), ("page", ASCENDING)])
+		self.postings.create_index([("doc_id", ASCENDING)])
+
+	@staticmethod
+	def _pagePostings(words) -> dict:
+		'''words - список слов страницы в порядке чтения -> {token: [позиции]}'''
+		res = {}
+		for pos, word in enumerate(words):
+			res.setdefault(word, []).append(pos)
+		return res
+
+	def indexReady(self) -> bool:
+		'''В индексе все документы коллекции (а не только добавленные после появления индекса)'''
+		return self.meta.find_one({"_id": self._INDEX_ID}) is not None
+
+	def _markIndexReady(self):
+		self.meta.update_one({"_id": self._INDEX_ID}, {"$set": {"ready": True}}, upsert=True)
+
+	def indexDoc(self, doc_id, pages_words):
+		'''
+		Добавляет документ в индекс.
+		pages_words - список страниц, каждая страница - список слов в порядке чтения
+		'''
+		return self.indexDocs([(doc_id, pages_words)])
+
+	def indexDocs(self, docs_words):
+		'''
+		Добавляет в индекс сразу несколько документов (одна пачка записей на все).
+		docs_words - [(doc_id, pages_words), ...]
+		'''
+		records, docs_postings = [], []
+		for doc_id, pages_words in docs_words:
+			doc_oid = ObjectId(str(doc_id))
+			pages_postings = []
+			for page_index, words in enumerate(pages_words):
+				page_postings = self._pagePostings(words)
+				pages_postings.append((page_index, len(words), page_postings))
+				for token, positions in page_postings.items():
+					records.append({
+						"token": token,
+						"doc_id": doc_oid,
+						"page": page_index,
+						"positions": positions
+					})
+			docs_postings.append((doc_oid, pages_postings))
+		if records:
+			self.postings.insert_many(records, ordered=False)
+		# длины страниц и частоты токенов для ранжирования (Bm25Ranking)
+		self._addStats(docs_postings)
+		return len(records)
+
+	def unindexDoc(self, doc_id):
+		'''Удаляет все записи документа из индекса'''
+		doc_oid = ObjectId(str(doc_id))
+		# одна запись индекса = токен на одной странице, т.е. вклад документа в df токена
+		tokens_df = {}
+		for rec in self.postings.find({"doc_id": doc_oid}, {"_id": 0, "token": 1}):
+			tokens_df[rec["token"]] = tokens_df.get(rec["token"], 0) + 1
+		res = self.postings.delete_many({"doc_id": doc_oid})
+		self._removeStats(doc_oid, tokens_df)
+		return res.deleted_count
+
+	def lookupPhrase(self, tokens, term_freqs=None, variants=None) -> dict:
+		'''
+		Позиционное пересечение списков вхождений для фразы tokens.
+		Возвращает {doc_id(str): {page_index: [стартовые позиции фразы]}}
+		term_freqs - словарь, если передан, заполняется для найденных страниц:
+		{(doc_id(str), page_index): {token: сколько раз токен встречается на странице}}
+		variants - {token: [слова словаря]} (FuzzyTerms.expandTokens):
+		слово фразы совпадает с любым из своих вариантов
+		'''
+		if not tokens: return {}
+		unique = list(dict.fromkeys(tokens))
+		variants = {token: (variants or {}).get(token) or [token] for token in unique}
+
+		def tokenQuery(token):
+			alternatives = variants[token]
+			return {"token": alternatives[0] if len(alternatives) == 1 else {"$in": alternatives}}
+
+		# начинаем с самого редкого токена, чтобы следующие запросы сужались по doc_id
+		if self.use_rank:
+			# готовая таблица частот вместо подсчёта по индексу
+			df = self.termDf({term for token in unique for term in variants[token]})
+			freq = {token: sum(df[term] for term in variants[token]) for token in unique}
+		else:
+			freq = {token: self.postings.count_documents(tokenQuery(token)) for token in unique}
+		if not all(freq.values()): return {}
+
+		projection = {"_id": 0, "doc_id": 1, "page": 1, "positions": 1}
+		postings = {} # token -> {(doc_id, page): set(positions)}
+		keys = None
+		for token in sorted(unique, key=freq.get):
+			query = tokenQuery(token)
+			if keys is not None:
+				query["doc_id"] = {"$in": list({doc_id for doc_id, _ in keys})}
+
+			found = {}
+			for rec in self.postings.find(query, projection):
+				key = (rec["doc_id"], rec["page"])
+				if keys is None or key in keys:
+					found.setdefault(key, set()).update(rec["positions"])
+			if not found: return {}
+
+			postings[token] = found
+			keys = found.keys()
+
+		# проверка позиций: слово j фразы стоит на start + j
+		first, rest = postings[tokens[0]], list(enumerate(tokens[1:], start=1))
+		result = {}
+		for doc_id, page_index in sorted(keys):
+			starts = [
+				start for start in sorted(first[(doc_id, page_index)])
+				if all(start + j in postings[token][(doc_id, page_index)] for j, token in rest)
+			]
+			if starts:
+				result.setdefault(str(doc_id), {})[page_index] = starts
+				if term_freqs is not None:
+					term_freqs[(str(doc_id), page_index)] = {
+						token: len(postings[token][(doc_id, page_index)]) for token in unique
+					}
+		return result
+
+	def rebuildIndex(self):
+		'''
+		Полностью перестраивает индекс по документам коллекции.
+		Нужна один раз для баз, заполненных до появления индекса
+		(или до появления статистики для ранжирования).
+		'''
+		print(f'InvertedIndex.rebuildIndex {INFO}: перестроение индекса...')
+		self.postings.delete_many({})
+		self._clearStats()
+		docs_counter, records_counter = 0, 0
+		for doc in self.collection.find({}, {"paged": 1, "pages": 1, "words": 1, "reading_order": 1}):
+			try:
+				pages_words = [words for _, _, words in self._iterDocPages(doc)]
+				records_counter += self.indexDoc(doc["_id"], pages_words)
+				docs_counter += 1
+			except Exception as e:
+				print(f'InvertedIndex.rebuildIndex {ERROR}: {doc["_id"]}\n{e}')
+		self._markIndexReady()
+		self._bumpGeneration()
+		self.use_index = self.index_requested
+		self.use_rank = self.rank # статистика для ранжирования перестроена вместе с индексом
+		print(f'InvertedIndex.rebuildIndex {OK}: документов {docs_counter}, записей индекса {records_counter}')
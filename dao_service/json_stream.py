@@ -0,0 +1,133 @@
+import json, gzip
+from pathlib import Path
+
+from .dao_config import JSON_READ_CHUNK
+
+
+'''
+потоковое чтение и запись дампов коллекции (JsonHandler.exportToJson / importFromJson)
+
+формат - по расширению файла:
+- .ndjson / .jsonl - один документ на строку
+- .json - JSON-массив документов (старый формат), пишется и читается по одному документу
+- .gz в конце (dump.ndjson.gz, dump.json.gz) - то же, сжатое gzip
+
+в памяти одновременно находится один документ (при записи) или кусок файла
+JSON_READ_CHUNK + один документ (при чтении), независимо от размера дампа
+'''
+
+
+def dumpFormat(file_path) -> tuple:
+	'''(ndjson ли формат, сжат ли gzip)'''
+	suffixes = [suffix.lower() for suffix in Path(file_path).suffixes]
+	compressed = bool(suffixes) and suffixes[-1] == '.gz'
+	if compressed: suffixes = suffixes[:-1]
+	return (bool(suffixes) and suffixes[-1] in ('.ndjson', '.jsonl')), compressed
+
+
+def openDump(file_path, mode):
+	'''текстовый файл дампа ('r' или 'w'), с gzip - если имя кончается на .gz'''
+	_, compressed = dumpFormat(file_path)
+	if compressed:
+		return gzip.open(file_path, mode + 't', encoding='utf-8')
+	return open(file_path, mode, encoding='utf-8')
+
+
+class DumpWriter:
+	'''Пишет документы по одному: with DumpWriter(path) as writer: writer.write(doc)'''
+
+	def __init__(self, file_path):
+		self.ndjson, _ = dumpFormat(file_path)
+		self.file = openDump(file_path, 'w')
+		self.count = 0
+		if not self.ndjson:
+			self.file.write('[')
+
+	def write(self, doc):
+		if self.ndjson:
+			self.file.write(json.dumps(doc, ensure_ascii=False, default=str))
+			self.file.write('\n')
+		else:
+			self.file.write(',\n' if self.count else '\n')
+			self.file.write(json.dumps(doc, ensure_ascii=False, default=str, indent=4))
+		self.count += 1
+
+	def close(self):
+		if not self.ndjson:
+			self.file.write('\n]\n')
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def iterDump(file_path):
+	'''Документы дампа по одному (генератор)'''
+	ndjson, _ = dumpFormat(file_path)
+	with openDump(file_path, 'r') as file:
+		if ndjson:
+			for line in file:
+				line = line.strip()
+				if line:
+					yield json.loads(line)
+		else:
+			yield from _iterArray(file)
+
+
+_NUMBER_CHARS = '0123456789+-.eE' # символы, которыми может продолжаться число JSON
+
+
+def _iterArray(file, chunk_size=JSON_READ_CHUNK):
+	'''элементы JSON-массива из файла, без чтения файла целиком'''
+	decoder = json.JSONDecoder()
+	buffer, position = '', 0
+
+	def fill() -> bool:
+		'''дочитывает файл (разобранное начало буфера отбрасывается), False - файл кончился'''
+		nonlocal buffer, position
+		# большой документ - читаем кусками всё крупнее, чтобы не разбирать его начало заново много раз
+		more = file.read(max(chunk_size, len(buffer) - position))
+		buffer, position = buffer[position:] + more, 0
+		return bool(more)
+
+	def nextChar() -> str:
+		'''первый непробельный символ ('' - конец файла)'''
+		nonlocal position
+		while True:
+			while position < len(buffer) and buffer[position].isspace():
+				position += 1
+			if position < len(buffer): return buffer[position]
+			if not fill(): return ''
+
+	char = nextChar()
+	if not char: return # пустой файл
+	if char != '[':
+		raise ValueError(f'ожидался JSON-массив, а не {char!r}')
+	position += 1
+	if nextChar() == ']': return
+
+	while True:
+		while True:
+			try:
+				doc, end = decoder.raw_decode(buffer, position)
+				# число могло оборваться на границе куска ("2" из "2.5") - пока после него нет разделителя, дочитываем
+				if isinstance(doc, (int, float)) and not isinstance(doc, bool) \
+					and not buffer[end:].strip(_NUMBER_CHARS) and fill(): continue
+				position = end
+				break
+			except json.JSONDecodeError:
+				# документ не поместился в буфер - дочитываем
+				if not fill(): raise
+		yield doc
+
+		char = nextChar()
+		if char == ',':
+			position += 1
+			nextChar()
+		elif char == ']':
+			return
+		else:
+			raise ValueError(f'дамп повреждён: ожидалась , или ], а не {char!r}')
@@ -0,0 +1,100 @@
+import ctypes, hashlib, os, shutil, subprocess, tempfile, threading
+import numpy as np
+
+from pathlib import Path
+
+from .dao_config import OK, ERROR, INFO, KMP_MODULE_PATH, KMP_BUILD_DIR, KMP_CXX_FLAGS
+
+
+'''
+сборка и загрузка C++ ядра kmp_module.cpp (вместо cppyy.cppdef при импорте)
+
+- исходник компилируется системным компилятором в разделяемую библиотеку ОДИН раз
+- библиотека лежит в KMP_BUILD_DIR, в имени - хеш исходника и флагов:
+  изменили kmp_module.cpp - при следующем поиске соберётся новая
+- загрузка ленивая (ctypes) - при первом поиске сканированием, а не при импорте;
+  все процессы бота подгружают один и тот же файл
+- компилятора нет или сборка упала - loadKmp() возвращает None,
+  поиск переключается на движок numpy/python (см. DataBase._matchPages)
+'''
+
+_lock = threading.Lock()
+_library = None
+_tried = False
+
+
+def _compiler():
+	for name in (os.environ.get('CXX'), 'c++', 'g++', 'clang++'):
+		if name and shutil.which(name):
+			return name
+	return None
+
+
+def _libraryPath(source_path, build_dir):
+	digest = hashlib.sha256(Path(source_path).read_bytes() + ' '.join(KMP_CXX_FLAGS).encode()).hexdigest()[:16]
+	return Path(build_dir) / f'kmp_module_{digest}.so'
+
+
+def buildLibrary(source_path=KMP_MODULE_PATH, build_dir=KMP_BUILD_DIR):
+	'''
+	Возвращает путь к собранной библиотеке (собирает, если её ещё нет в кеше)
+	или None, если собрать не получилось.
+	'''
+	lib_path = _libraryPath(source_path, build_dir)
+	if lib_path.exists():
+		return lib_path
+
+	compiler = _compiler()
+	if not compiler:
+		print(f'kmp_loader.buildLibrary {INFO}: компилятор C++ не найден')
+		return None
+
+	lib_path.parent.mkdir(parents=True, exist_ok=True)
+	# сборка во временный файл и атомарная замена: несколько процессов могут собирать одновременно
+	fd, tmp_path = tempfile.mkstemp(suffix='.so', dir=lib_path.parent)
+	os.close(fd)
+	try:
+		subprocess.run(
+			[compiler, *KMP_CXX_FLAGS, str(source_path), '-o', tmp_path],
+			check=True, capture_output=True, text=True
+		)
+		os.replace(tmp_path, lib_path)
+	except (OSError, subprocess.CalledProcessError) as e:
+		print(f'kmp_loader.buildLibrary {ERROR}: {getattr(e, "stderr", "") or e}')
+		return None
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+
+	print(f'kmp_loader.buildLibrary {OK}: {lib_path.name}')
+	return lib_path
+
+
+def loadKmp():
+	'''Ленивая загрузка ядра: ctypes.CDLL с настроенным kmpSearchBatch или None'''
+	global _library, _tried
+	if _tried:
+		return _library
+
+	with _lock:
+		if _tried:
+			return _library
+		try:
+			lib_path = buildLibrary()
+			if lib_path:
+				lib = ctypes.CDLL(str(lib_path))
+				int_array = np.ctypeslib.ndpointer(dtype=np.int32, flags='C_CONTIGUOUS')
+				lib.kmpSearchBatch.argtypes = [
+					ctypes.c_char_p, ctypes.c_int,  # text, text_len
+					int_array, ctypes.c_int,        # page_offsets, n_pages
+					ctypes.c_char_p, ctypes.c_int,  # needle_text, needle_len
+					ctypes.c_int,                   # substring
+					int_array, ctypes.c_int         # out, cap
+				]
+				lib.kmpSearchBatch.restype = ctypes.c_int
+				_library = lib
+		except OSError as e:
+			print(f'kmp_loader.loadKmp {ERROR}: {e}')
+		_tried = True
+
+	return _library
@@ -1,9 +1,16 @@
 #include <iostream>
 #include <vector>
 #include <string>
+#include <string_view>
 using std::vector;
 using std::string;
 
+// Совпадение слова страницы со словом needle (см. MATCH_SUBSTRING в dao_config.py):
+// substring == false - слова равны целиком
+// substring == true  - слово страницы содержит слово needle ("br" найдётся в "break")
+static inline bool _wordMatch(std::string_view word, std::string_view token, bool substring) {
+    return substring ? word.find(token) != std::string_view::npos : word == token;
+}
 
 vector<int> _kmpPrefix(const vector<string>& needle) {
     int m = static_cast<int>(needle.size());
@@ -23,7 +30,8 @@ vector<int> _kmpPrefix(const vector<string>& needle) {
 
 // Ищет все индексы совпадений подсписка needle в haystack
 vector<int> kmpSearch(const vector<string>& haystack,
-                           const vector<string>& needle) {
+                           const vector<string>& needle,
+                           bool substring = false) {
     int n = static_cast<int>(haystack.size());
     int m = static_cast<int>(needle.size());
     if (m == 0 || n < m) {
@@ -33,10 +41,10 @@ vector<int> kmpSearch(const vector<string>& haystack,
     vector<int> res;
     int j = 0;
     for (int i = 0; i < n; ++i) {
-        while (j > 0 && haystack[i].find(needle[j]) == string::npos) {
+        while (j > 0 && !_wordMatch(haystack[i], needle[j], substring)) {
             j = lps[j - 1];
         }
-        if (haystack[i].find(needle[j]) != string::npos) {
+        if (_wordMatch(haystack[i], needle[j], substring)) {
             ++j;
             if (j == m) {
                 int start = i - m + 1;
@@ -50,17 +58,94 @@ vector<int> kmpSearch(const vector<string>& haystack,
     return res;
 }
 
+// ============= пакетный поиск =============
+// Все страницы кандидатов передаются одним плоским UTF-8 буфером, без std::vector<std::string>:
+// text - все слова всех страниц подряд через '\n' (в очищенных словах перевода строки не бывает)
+// page_offsets[p] .. page_offsets[p + 1] - сквозные номера слов p-й страницы
+// needle - так же, m слов через '\n'
+// out - пары (страница, позиция на странице), cap - ёмкость out в парах
+// Возвращает общее число найденных пар (если оно больше cap - в out записаны только первые cap).
+// Совпадение слова - как и в kmpSearch (_wordMatch), substring != 0 - поиск подстроки.
+
+static vector<std::string_view> _splitWords(const char* text, int text_len) {
+    vector<std::string_view> words;
+    int begin = 0;
+    for (int i = 0; i <= text_len; ++i) {
+        if (i == text_len || text[i] == '\n') {
+            words.emplace_back(text + begin, static_cast<size_t>(i - begin));
+            begin = i + 1;
+        }
+    }
+    return words;
+}
+
+extern "C" int kmpSearchBatch(const char* text, int text_len,
+                              const int* page_offsets, int n_pages,
+                              const char* needle_text, int needle_len,
+                              int substring, int* out, int cap) {
+    if (n_pages <= 0 || page_offsets[n_pages] == 0) {
+        return 0;
+    }
+    vector<std::string_view> words = _splitWords(text, text_len);
+    vector<std::string_view> needle = _splitWords(needle_text, needle_len);
+    int m = static_cast<int>(needle.size());
 
+    // префикс-функция
+    vector<int> lps(m, 0);
+    for (int i = 1, j = 0; i < m; ++i) {
+        while (j > 0 && needle[i] != needle[j]) {
+            j = lps[j - 1];
+        }
+        if (needle[i] == needle[j]) {
+            ++j;
+        }
+        lps[i] = j;
+    }
+
+    int found = 0;
+    for (int p = 0; p < n_pages; ++p) {
+        int first = page_offsets[p];
+        int n = page_offsets[p + 1] - first;
+        if (n < m) {
+            continue;
+        }
+        int j = 0;
+        for (int i = 0; i < n; ++i) {
+            std::string_view word = words[first + i];
+            while (j > 0 && !_wordMatch(word, needle[j], substring)) {
+                j = lps[j - 1];
+            }
+            if (_wordMatch(word, needle[j], substring)) {
+                ++j;
+                if (j == m) {
+                    int start = i - m + 1;
+                    for (int k = start; k < start + m; ++k) {
+                        if (found < cap) {
+                            out[2 * found] = p;
+                            out[2 * found + 1] = k;
+                        }
+                        ++found;
+                    }
+                    j = lps[j - 1];
+                }
+            }
+        }
+    }
+    return found;
+}
+
+
+#ifndef KMP_SHARED_LIBRARY // при сборке библиотеки (kmp_loader.py) демонстрация не нужна
 int main() {
     
     vector<string> haystack = {"aaa", "aaa", "aaa", "aaa"};
     vector<string> needle = {"aa", "aa"};
     
-    vector<int> indices = kmpSearch(haystack, needle);
+    vector<int> indices = kmpSearch(haystack, needle, true);
     for (int idx : indices) {
         std::cout << idx << " ";
     }
     // Вывод: 0 1 2 3
     return 0;
 }
-
+#endif
@@ -0,0 +1,105 @@
+import re
+
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne
+
+from .dao_config import OK, ERROR, INFO
+
+
+'''
+манифест проиндексированных файлов (для FileManager.syncPath)
+
+коллекция <collection_name>_manifest, запись на файл:
+{"_id": "/abs/path/file.pdf", "size": 123456, "mtime": 1717171717.5, "hash": "sha256...", "doc_id": "66f..."}
+
+- size и mtime совпали - файл не менялся (без чтения содержимого)
+- поменялись, но hash тот же (файл скопировали/тронули) - обновляется только запись манифеста
+- поменялся hash - документ заменяется на месте (тот же doc_id, страницы и индекс перестраиваются)
+- файла больше нет - документ удаляется вместе с записью
+'''
+
+
+class FileManifest:
+	# При использовании предполагается, что self.collection и self.manifest уже определены,
+	# а _fillDoc, _replaceDoc, __call__ и __delitem__ доступны (DataBase)
+
+	def manifestEntries(self, directory) -> dict:
+		'''{path: запись манифеста} для файлов внутри directory'''
+		prefix = str(directory).rstrip('/') + '/'
+		return {rec["_id"]: rec for rec in self.manifest.find({"_id": {"$regex": '^' + re.escape(prefix)}})}
+
+	def manifestFor(self, paths) -> dict:
+		'''{path: запись манифеста} для перечисленных путей (которых нет в манифесте - пропускаются)'''
+		return {rec["_id"]: rec for rec in self.manifest.find({"_id": {"$in": [str(path) for path in paths]}})}
+
+	def manifestPut(self, path, size, mtime, digest, doc_id):
+		self.manifest.replace_one(
+			{"_id": str(path)},
+			{"_id": str(path), "size": size, "mtime": mtime, "hash": digest, "doc_id": str(doc_id)},
+			upsert=True
+		)
+
+	def syncDoc(self, data, size, mtime, digest):
+		'''
+		Документ файла data["path"] по его новому содержимому: заменяет прежний (из манифеста
+		или с тем же путём - если файл индексировался без манифеста), иначе создаёт.
+		Дубликаты с тем же путём удаляются. Возвращает doc_id или None.
+		'''
+		path = data["path"]
+		old_ids = self._syncedIds(path)
+		if old_ids:
+			doc_id = old_ids[0]
+			self._fillDoc(data)
+			if not self._replaceDoc(doc_id, data): return None
+			for duplicate_id in old_ids[1:]:
+				del self[duplicate_id]
+		else:
+			doc_id = self(data)
+			if doc_id is None: return None
+
+		self.manifestPut(path, size, mtime, digest, doc_id)
+		return doc_id
+
+	def _syncedIds(self, path) -> list:
+		'''существующие документы файла: из манифеста (первым) и с тем же path'''
+		entry = self.manifest.find_one({"_id": path})
+		old_ids = [entry["doc_id"]] if entry else []
+		old_ids += [str(doc["_id"]) for doc in self.collection.find({"path": path}, {"_id": 1})]
+		return [doc_id for doc_id in dict.fromkeys(old_ids) if self.collection.find_one({"_id": ObjectId(doc_id)}, {"_id": 1})]
+
+	def syncMany(self, items) -> list:
+		'''
+		syncDoc для пачки: items - [(data, size, mtime, hash), ...] -> [(doc_id, None) или (None, ошибка), ...].
+		Файлы без документа пишутся одной пачкой (BulkWriter.insertMany), записи манифеста - одним bulk_write;
+		изменённые заменяют свой документ по одному.
+		'''
+		results = [None] * len(items)
+		new = [] # номера файлов, у которых ещё нет документа
+		for index, (data, size, mtime, digest) in enumerate(items):
+			if self._syncedIds(data["path"]):
+				doc_id = self.syncDoc(data, size, mtime, digest)
+				results[index] = (doc_id, None) if doc_id else (None, 'документ не заменён')
+			else:
+				new.append(index)
+
+		records = []
+		for index, (doc_id, error) in zip(new, self.insertMany([items[index][0] for index in new])):
+			results[index] = (doc_id, error)
+			if doc_id:
+				data, size, mtime, digest = items[index]
+				records.append(ReplaceOne(
+					{"_id": data["path"]},
+					{"_id": data["path"], "size": size, "mtime": mtime, "hash": digest, "doc_id": doc_id},
+					upsert=True
+				))
+		if records:
+			self.manifest.bulk_write(records, ordered=False)
+		return results
+
+	def dropSynced(self, path):
+		'''Файла больше нет: удаляет его документ и запись манифеста'''
+		entry = self.manifest.find_one({"_id": str(path)})
+		if entry and self.collection.find_one({"_id": ObjectId(entry["doc_id"])}, {"_id": 1}):
+			del self[entry["doc_id"]]
+		self.manifest.delete_one({"_id": str(path)})
+		print(f'FileManifest.dropSynced {OK}: {path}')
@@ -1,18 +1,33 @@
-import re, json, datetime, cppyy
+import re, json, datetime
+import numpy as np
+
+from hashlib import blake2b
 
 from pprint import pprint as pp
 from pprint import pformat as pf
 from pathlib import Path
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, UpdateOne, ReplaceOne, DeleteOne
 from bson.objectid import ObjectId
 from sys import exit
 from shutil import get_terminal_size
 
-from .dao_config import OK, ERROR, INFO, DB_HOST, DB_PORT, DB_NAME, DB_INDEX_NAME, CONN_TIMEOUT, KMP_MODULE_PATH
+from .dao_config import OK, ERROR, INFO, DB_HOST, DB_PORT, DB_NAME, DB_INDEX_NAME, CONN_TIMEOUT
+from .dao_config import DB_POSTINGS_SUFFIX, SEARCH_USE_INDEX, DB_PAGES_SUFFIX, PAGE_STORAGE, KMP_BATCH_PAGES
+from .dao_config import SEARCH_ENGINE, MATCH_SUBSTRING
+from .dao_config import SEARCH_ITER_DOCS, SEARCH_ITER_FIRST_PAGES
+from .dao_config import SEARCH_RANK, DB_PAGELEN_SUFFIX, DB_TERMS_SUFFIX, FUZZY_SEARCH
+from .dao_config import QUERY_CACHE, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL, DB_META_SUFFIX
+from .dao_config import DB_MANIFEST_SUFFIX, DB_WRITE_BATCH, DB_EXPORT_BATCH
 from .stopwatch import stopWatch as sw
-
-with open(KMP_MODULE_PATH, 'r') as f:
-	cppyy.cppdef(f.read())
+from .inverted_index import InvertedIndex
+from .page_store import PageStore
+from .kmp_loader import loadKmp
+from .query_cache import QueryCache, CacheGeneration
+from .ranking import Bm25Ranking
+from .fuzzy_search import FuzzyTerms
+from .manifest import FileManifest
+from .bulk_write import BulkWriter
+from .json_stream import DumpWriter, iterDump
 
 
 '''
@@ -38,34 +53,61 @@ with open(KMP_MODULE_PATH, 'r') as f:
 
 
 class JsonHandler:
-	# При использовании MongoDB предполагается, что self.collection уже определена
-	def exportToJson(self, file_path):
-		# Экспорт данных из текущей коллекции MongoDB в JSON файл.
+	# При использовании MongoDB предполагается, что self.collection уже определена, а insertMany доступен (DataBase)
+	# формат дампа - по расширению: .json (массив), .ndjson/.jsonl (документ на строку), + .gz - сжатый (см. json_stream.py)
+	def exportToJson(self, file_path, progress=None, batch_size=DB_EXPORT_BATCH):
+		'''
+		Экспорт текущей коллекции MongoDB в файл, по одному документу: память не зависит от размера коллекции.
+		progress(записано, всего) - вызывается после каждой пачки курсора. Возвращает число документов или None
+		'''
 		try:
-			documents = list(self.collection.find({}))
-			# Преобразуем ObjectId в строку
-			for doc in documents:
-				doc['_id'] = str(doc['_id'])
+			total = self.collection.estimated_document_count()
+			with DumpWriter(file_path) as writer:
+				for doc in self.collection.find({}).batch_size(batch_size):
+					# постраничные документы собираются обратно со страницами
+					doc = self._assembleDoc(doc)
+					# Преобразуем ObjectId в строку
+					doc['_id'] = str(doc['_id'])
+					writer.write(doc)
+					if progress and writer.count % batch_size == 0:
+						progress(writer.count, total)
+			if progress: progress(writer.count, total)
 		except Exception as e:
 			print(f'JsonHandler.exportToJson {ERROR}: {e}')
-			return
-		with open(file_path, 'w', encoding='utf-8') as file:
-			json.dump(documents, file, indent=4)
-		print(f'JsonHandler.exportToJson {OK}: collection -> json<{file_path}>')
+			return None
+		print(f'JsonHandler.exportToJson {OK}: collection -> json<{file_path}> ({writer.count} документов)')
+		return writer.count
+
+	def importFromJson(self, file_path, progress=None, batch_size=DB_WRITE_BATCH):
+		'''
+		Импорт документов из файла дампа в текущую коллекцию пачками по batch_size (BulkWriter.insertMany):
+		страницы и индекс строятся заново, _id из дампа сохраняются. progress(прочитано, None) - после каждой пачки.
+		Возвращает (записано, ошибочных) или None, если файл не читается
+		'''
+		inserted, failed, read = 0, 0, 0
+		chunk = []
+
+		def flush():
+			nonlocal inserted, failed
+			for doc_id, _ in self.insertMany(chunk, batch_size):
+				if doc_id: inserted += 1
+				else: failed += 1
+			chunk.clear()
+			if progress: progress(read, None)
 
-	def importFromJson(self, file_path):
-		# Импорт данных из JSON файла в текущую коллекцию MongoDB.
 		try:
-			# Читаем данные из JSON файла
-			with open(file_path, 'r', encoding='utf-8') as file:
-				data = json.load(file)
-			# Выполняем массовую вставку документов
-			result = self.collection.insert_many(data)
+			for doc in iterDump(file_path):
+				chunk.append(doc)
+				read += 1
+				if len(chunk) >= batch_size:
+					flush()
+			if chunk:
+				flush()
 		except Exception as e:
-			print(f'JsonHandler.importFromJson {ERROR}: json<{file_path}> -> collection:\n{e}')
-			return
-		else:
-			print(f'JsonHandler.importFromJson {OK}: json<{file_path}> -> inserted {len(result.inserted_ids)} документов')
+			print(f'JsonHandler.importFromJson {ERROR}: json<{file_path}> -> collection (прочитано {read}):\n{e}')
+			return None
+		print(f'JsonHandler.importFromJson {OK}: json<{file_path}> -> inserted {inserted} документов, ошибок {failed}')
+		return inserted, failed
 
 	def __iter__(self):
 		#for doc in self.collection.find({}):
@@ -116,6 +158,58 @@ class UtilityDBTools:
 		text = re.sub(r'\s+', ' ', text) # замена последовательности ' ' на ' '
 		return text.strip() # Убираем возможные пробелы в начале и конце строки
 
+	@classmethod
+	def _splitTokens(cls, page) -> list:
+		'''
+		Приводит слова страницы к виду "одна запись = один токен":
+		пустые слова выкидываются, слово с пробелами после очистки ("т.е." -> "т е")
+		разбивается на несколько записей с теми же координатами.
+		'''
+		return [
+			{"word": token, "coords": item["coords"]}
+			for item in page
+			for token in cls.cleanText(item["word"]).split()
+		]
+
+	@staticmethod
+	def _readingKey(tok):
+		'''ключ сортировки "верхний левый угол": (min_y, min_x)'''
+		coords = tok['coords']
+		# если первый элемент вложенный (tuple/list), то четырёхточечный формат, иначе (x0, y0, x1, y1)
+		if coords and isinstance(coords[0], (list, tuple)):
+			return min(y for _, y in coords), min(x for x, _ in coords)
+		else:
+			return coords[1], coords[0]
+
+	@classmethod
+	def _readingOrder(cls, page_tokens) -> list:
+		'''Слова страницы в порядке чтения (сортировка устойчивая)'''
+		return sorted(page_tokens, key=cls._readingKey)
+
+	@classmethod
+	def _prepareDoc(cls, data):
+		'''
+		Приводит страницы документа к виду, в котором они хранятся в базе:
+		- одна запись = один токен (_splitTokens)
+		- слова страницы уже в порядке чтения, поиск их больше не сортирует
+		- data["words"] - массив слов каждой страницы, готовый для сопоставления
+		'''
+		data["pages"] = [cls._readingOrder(cls._splitTokens(page)) for page in data.get("pages", [])]
+		data["words"] = [[item["word"] for item in page] for page in data["pages"]]
+		data["reading_order"] = True
+		return data
+
+	@classmethod
+	def _pageView(cls, doc, page_index):
+		'''(слова страницы в порядке чтения, массив слов) для документа из базы'''
+		page = doc["pages"][page_index]
+		if doc.get("reading_order"):
+			words = doc.get("words") # поле могло не попасть в проекцию
+			return page, (words[page_index] if words else [t["word"] for t in page])
+		# документ ещё не прошёл миграцию reorderPages()
+		sorted_tokens = cls._readingOrder(cls._splitTokens(page))
+		return sorted_tokens, [t["word"] for t in sorted_tokens]
+
 	@staticmethod
 	def _kmpPrefix(needle: list) -> list:
 		"""Метод для вычисления префикс-функции (массива lps) для алгоритма Кнута-Морриса-Пратта. 
@@ -132,19 +226,27 @@ class UtilityDBTools:
 			lps[i] = j
 		return lps
 	
-	# возможно при использовании "in" будет проблема ложного находа ('br' in 'break'). При условии что в clean_text существует слово "br"
+	'''
+	Политика совпадения слов (MATCH_SUBSTRING в dao_config.py):
+	- False (по умолчанию) - слово фразы совпадает со словом страницы только целиком.
+	  Так же работают индекс поиска и старый regex-префильтр по text_clear,
+	  а подстрока давала ложные находы ('br' in 'break').
+	- True - старое поведение kmp: слово страницы содержит слово фразы.
+	  Поддерживается только kmp-движками (python, cpp), движок numpy сравнивает хеши слов целиком.
+	'''
 	@classmethod
-	def kmpSearch_python(cls, haystack: list, needle: list) -> list:
+	def kmpSearch_python(cls, haystack: list, needle: list, substring=MATCH_SUBSTRING) -> list:
 		"""Поиск подсписка needle в списке haystack алгоритмом Кнута-Морриса-Пратта (KMP).
-		Возвращает все стартовые индексы вхождений."""
+		Возвращает индексы всех слов каждого вхождения."""
 		n, m = len(haystack), len(needle)
 		if m == 0 or n < m: return []
+		match = (lambda token, element: token in element) if substring else (lambda token, element: token == element)
 		lps = cls._kmpPrefix(needle)
 		res, j = [], 0
 		for num, element in enumerate(haystack):
-			while j and needle[j] not in element: 
+			while j and not match(needle[j], element): 
 				j = lps[j - 1]
-			if needle[j] in element:
+			if match(needle[j], element):
 				j += 1
 				if j == m:
 					start = num - m + 1
@@ -153,28 +255,152 @@ class UtilityDBTools:
 		return res
 	
 	
-	@staticmethod
-	def kmpSearch_cpp(haystack: list, needle: list) -> list:
+	@classmethod
+	def kmpSearch_cpp(cls, haystack: list, needle: list, substring=MATCH_SUBSTRING) -> list:
 		'''C++ реализация алгоритма Кнута-Морриса-Пратта (KMP) для поиска подсписка needle в списке haystack.'''
-		# Прямой вызов C++: list автоматически конвертируется в std::vector<std::string> при передаче в функцию kmpSearch
-		res_cpp = cppyy.gbl.kmpSearch(haystack, needle)
-		return list(res_cpp)
+		# та же функция kmpSearchBatch, но с одной страницей
+		return cls.kmpSearch_batch([haystack], needle, substring)[:, 1].tolist()
+
+	@staticmethod
+	def _packPages(pages):
+		'''
+		Упаковка списка страниц (списков слов) для kmpSearchBatch:
+		(UTF-8 буфер со словами через '\\n', смещения страниц в словах int32)
+		'''
+		text = '\n'.join(word for words in pages for word in words).encode('utf-8')
+		page_offsets = np.zeros(len(pages) + 1, dtype=np.int32)
+		page_offsets[1:] = np.cumsum(np.fromiter(map(len, pages), dtype=np.int32, count=len(pages)))
+		return text, page_offsets
+
+	@classmethod
+	def kmpSearch_batch(cls, pages: list, needle: list, substring=MATCH_SUBSTRING) -> np.ndarray:
+		'''
+		C++ KMP сразу по всем страницам pages (список списков слов) за один вызов.
+		Возвращает массив формы (k, 2) со строками (номер страницы в pages, позиция слова),
+		позиции на странице - те же, что вернул бы kmpSearch_python.
+		Ядро собирается и подгружается при первом вызове (kmp_loader.loadKmp),
+		если собрать его нельзя - считается на python.
+		'''
+		if not needle or not pages:
+			return np.empty((0, 2), dtype=np.int32)
+		kmp = loadKmp()
+		if kmp is None:
+			rows = [(row, pos) for row, words in enumerate(pages) for pos in cls.kmpSearch_python(words, needle, substring)]
+			return np.array(rows, dtype=np.int32).reshape(-1, 2)
+
+		text, page_offsets = cls._packPages(pages)
+		needle_text = '\n'.join(needle).encode('utf-8')
+
+		cap = max(int(page_offsets[-1]), 1) # обычно совпадений меньше, чем слов
+		while True:
+			# ctypes отпускает GIL на время вызова: пока C++ считает, бот обслуживает других пользователей
+			out = np.empty(2 * cap, dtype=np.int32)
+			found = kmp.kmpSearchBatch(
+				text, len(text), page_offsets, len(pages),
+				needle_text, len(needle_text),
+				int(substring), out, cap
+			)
+			if found <= cap:
+				return out[:2 * found].reshape(-1, 2)
+			cap = found # перекрывающиеся вхождения не влезли - повторяем с точным размером
+
+	@staticmethod
+	def tokenIds(words: list) -> np.ndarray:
+		'''Слова -> 64-битные хеши (uint64). Считаются один раз при вставке и хранятся в записях страниц.'''
+		return np.fromiter(
+			(int.from_bytes(blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little') for word in words),
+			dtype=np.uint64, count=len(words)
+		)
+
+	@staticmethod
+	def tokenSearch_batch(pages_ids: list, needle_ids: np.ndarray) -> np.ndarray:
+		'''
+		Векторный поиск фразы по хешам слов сразу по всем страницам, без Python-объектов на слово.
+		pages_ids - список массивов uint64 (по странице), needle_ids - хеши слов фразы.
+		Возвращает то же, что kmpSearch_batch (слова сравниваются целиком).
+		'''
+		m = len(needle_ids)
+		empty = np.empty((0, 2), dtype=np.int32)
+		if m == 0 or not pages_ids: return empty
+		haystack = np.concatenate(pages_ids)
+		n = len(haystack)
+		if n < m: return empty
+
+		# mask[i] - фраза начинается с i-го слова (сквозная нумерация)
+		mask = haystack[:n - m + 1] == needle_ids[0]
+		for j in range(1, m):
+			mask &= haystack[j:n - m + 1 + j] == needle_ids[j]
+		starts = np.flatnonzero(mask)
+
+		# номер страницы для каждого старта, вхождение не должно переходить на следующую страницу
+		lengths = np.fromiter(map(len, pages_ids), dtype=np.int64, count=len(pages_ids))
+		ends = np.cumsum(lengths)
+		page_rows = np.searchsorted(ends, starts, side='right')
+		inside = starts + m <= ends[page_rows]
+		starts, page_rows = starts[inside], page_rows[inside]
+		starts -= ends[page_rows] - lengths[page_rows]
+
+		# как у kmp: индексы всех слов каждого вхождения
+		res = np.empty((len(starts) * m, 2), dtype=np.int32)
+		res[:, 0] = np.repeat(page_rows, m)
+		res[:, 1] = (starts[:, None] + np.arange(m)).ravel()
+		return res
+
+	@classmethod
+	def tokenSearch_numpy(cls, haystack_ids: np.ndarray, needle_ids: np.ndarray) -> list:
+		'''То же, что kmpSearch_python/kmpSearch_cpp, но по хешам слов одной страницы'''
+		return cls.tokenSearch_batch([haystack_ids], needle_ids)[:, 1].tolist()
 
 
 	def rebase(self, new_base_path):
 		"""
 		Обходит все документы, берёт старый путь из поля 'path',
 		сохраняет имя файла и обновляет 'path' на new_base_path/имя_файла.
+		Записи манифеста (FileManifest, ключ - путь файла) переносятся на новые пути вместе с документами.
 		"""
 		new_base = Path(new_base_path)
 		
-		for doc in self:
+		# пачками по DB_WRITE_BATCH, неупорядоченно - один запрос на пачку, а не на документ
+		updates = []
+		moved = {} # старый путь -> новый
+		for doc in self.collection.find({}, {'path': 1}):
 			old_path = Path(doc.get('path', ''))
 			new_path = new_base / old_path.name
+			updates.append(UpdateOne({'_id': doc['_id']}, {'$set': {'path': str(new_path)}}))
+			moved[doc.get('path', '')] = str(new_path)
+
+		# _id записи манифеста не меняется на месте: сначала удаляются старые записи, потом пишутся новые
+		# (так новый путь одного файла, совпавший со старым путём другого, не удалится)
+		entries = [entry for entry in self.manifest.find({}) if moved.get(entry['_id'], entry['_id']) != entry['_id']]
+		removals = [DeleteOne({'_id': entry['_id']}) for entry in entries]
+		inserts = [ReplaceOne({'_id': moved[entry['_id']]}, {**entry, '_id': moved[entry['_id']]}, upsert=True) for entry in entries]
+
+		for collection, requests in ((self.collection, updates), (self.manifest, removals), (self.manifest, inserts)):
+			for start in range(0, len(requests), DB_WRITE_BATCH):
+				try:
+					collection.bulk_write(requests[start:start + DB_WRITE_BATCH], ordered=False)
+				except Exception as e:
+					print(f"UtilityDBTools.rebase {ERROR}: {e}")
+		# пути попадают в результаты поиска
+		self._bumpGeneration()
+
+	def reorderPages(self):
+		'''
+		Миграция старых документов: страницы сохраняются в порядке чтения,
+		добавляется массив слов words, документ переиндексируется.
+		'''
+		counter = 0
+		for doc in self.collection.find({'reading_order': {'$ne': True}}, {'pages': 1}):
+			self._prepareDoc(doc)
 			self.collection.update_one(
-				{'_id': ObjectId(doc['_id'])},
-				{'$set': {'path': str(new_path)}}
+				{'_id': doc['_id']},
+				{'$set': {'pages': doc['pages'], 'words': doc['words'], 'reading_order': True}}
 			)
+			self.unindexDoc(doc['_id'])
+			self.indexDoc(doc['_id'], doc['words'])
+			counter += 1
+		self._bumpGeneration()
+		print(f'UtilityDBTools.reorderPages {OK}: переведено документов: {counter}')
 
 
 class DisplayManager:
@@ -316,15 +542,21 @@ class DisplayManager:
 			print(self._terminal_length('-'))
 
 
-class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
+class DataBase(JsonHandler, UtilityDBTools, DisplayManager, InvertedIndex, PageStore, CacheGeneration, Bm25Ranking, FuzzyTerms, FileManifest, BulkWriter):
 
-	def __init__(self, mongo_host=DB_HOST, port=DB_PORT, db_name=DB_NAME, collection_name=DB_INDEX_NAME):
+	def __init__(self, mongo_host=DB_HOST, port=DB_PORT, db_name=DB_NAME, collection_name=DB_INDEX_NAME, use_index=SEARCH_USE_INDEX, page_storage=PAGE_STORAGE, engine=SEARCH_ENGINE, query_cache=QUERY_CACHE, rank=SEARCH_RANK, fuzzy=FUZZY_SEARCH):
 		'''
 		- create doc: doc_id = DB(data)
+		- create many docs in batches: [(doc_id, error), ...] = DB.insertMany(docs)
 		- search doc: DB.search("searched phrase", {"subject":"Психология общения"})
+		- stream search results: for hit in DB.search_iter("phrase", tag_filters, limit=10): ...
 		- extract one doc: print(DB[doc_id])
 		- show all docs: print(DB)
 		- delete doc: del DB[doc_id]
+		- rebuild search index: DB.rebuildIndex()
+		- move pages of old docs to the pages collection: DB.splitPages()
+		- search cache hits/misses: DB.cacheStats()
+		- replace/create the doc of a changed file: DB.syncDoc(data, size, mtime, hash) (FileManager.syncPath)
 		
 		- ...
 		- show doc in table: DB.showCompact()
@@ -343,12 +575,56 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 		try:
 			self.db = self.client[db_name]
 			self.collection = self.db[collection_name]
+			self.postings = self.db[collection_name + DB_POSTINGS_SUFFIX]
+			self._ensurePostingsIndex()
+			self.pages = self.db[collection_name + DB_PAGES_SUFFIX]
+			self._ensurePagesIndex()
+			self.meta = self.db[collection_name + DB_META_SUFFIX]
+			self.pagelen = self.db[collection_name + DB_PAGELEN_SUFFIX]
+			self.terms = self.db[collection_name + DB_TERMS_SUFFIX]
+			self._ensureStatsIndex()
+			self.manifest = self.db[collection_name + DB_MANIFEST_SUFFIX]
 		except Exception as e:
 			print(f'DataBase {ERROR}: Ошибка при инициализации базы данных или коллекции:\n{e}')
 			exit(1)
-		
-		# "прогрев" метода (прекомпиляция)
-		self.kmpSearch_cpp(["aaa", "aaa", "aaa", "aaa"],  ["aa", "aa"])
+
+		# пустая коллекция - индекс и статистика для ранжирования ведутся с самого начала
+		if self.collection.estimated_document_count() == 0:
+			if not self.statsReady(): self._clearStats()
+			if not self.indexReady(): self._markIndexReady()
+
+		# старая база (документы добавлялись без индекса) ищется сканированием, пока не будет вызван rebuildIndex():
+		# новые документы индексируются и так, но по индексу нашлись бы только они
+		self.index_requested = use_index # use_index из конструктора: rebuildIndex включает индекс, только если он был запрошен
+		self.use_index = use_index
+		if use_index and not self.indexReady():
+			print(f'DataBase {INFO}: индекс поиска неполный, используется сканирование. Для перехода на индекс: DB.rebuildIndex()')
+			self.use_index = False
+
+		# ранжирование BM25 результатов поиска по индексу (Bm25Ranking)
+		self.rank = rank
+		self.use_rank = rank
+		if not self.statsReady():
+			print(f'DataBase {INFO}: нет статистики для ранжирования, результаты не сортируются. Для ранжирования: DB.rebuildIndex()')
+			self.use_rank = False
+
+		# поиск по индексу с учётом ошибок OCR (FuzzyTerms)
+		self.fuzzy = fuzzy
+
+		# новые документы: страницы отдельными записями (True) или внутри документа (False)
+		self.page_storage = page_storage
+
+		# движок сопоставления страниц при сканировании: 'cpp', 'python' или 'numpy'
+		if engine not in ('cpp', 'python', 'numpy'):
+			print(f'DataBase {ERROR}: неизвестный движок поиска {engine=}')
+			exit(1)
+		if engine == 'numpy' and MATCH_SUBSTRING:
+			print(f'DataBase {INFO}: движок numpy не ищет подстроки (MATCH_SUBSTRING), используется python')
+			engine = 'python'
+		self.engine = engine
+
+		# кеш результатов поиска (None - выключен)
+		self.query_cache = QueryCache(QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL) if query_cache else None
 
 	def __call__(self, data):
 		'''
@@ -356,27 +632,25 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 		Синтаксис: DB(data)
 		'''
 		try:
-			# автоочистка текста
-			data['text_clear'] = self.cleanText(data['text'])
-
-			# очистка пустых слов
-			for page in data["pages"]:
-				page[:] = [item for item in page if item["word"].strip() != ""]
-
-			# если дата не указана, то берём из системы
-			if not data['tags'].get('date', None): 
-				data['tags']['date'] = self.getTime(data['path'])
-
-
-			res = self.collection.insert_one(data)
-			doc_id = str(res.inserted_id)
+			# тот же путь, что и у пакетной записи - пачка из одного документа
+			doc_id, error = self.insertMany([data])[0]
 		except Exception as e:
 			print(f"DataBase.__call__ {ERROR}: {e}")
 			return None
-		else:
-			print(f"DataBase.__call__ {OK}: Документ: {doc_id}")
+		if error:
+			print(f"DataBase.__call__ {ERROR}: {error}")
+			return None
+		print(f"DataBase.__call__ {OK}: Документ: {doc_id}")
 		return doc_id
 
+	def _fillDoc(self, data):
+		'''Поля нового документа из результата парсера: очищенный текст и дата'''
+		data['text_clear'] = self.cleanText(data['text'])
+
+		# если дата не указана, то берём из системы
+		if not data['tags'].get('date', None): 
+			data['tags']['date'] = self.getTime(data['path'])
+
 	def createDoc(self, data):
 		'''
 		Создаёт документ и вставляет его в коллекцию MongoDB. 
@@ -402,6 +676,11 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 
 		try:
 			self.collection.delete_one({"_id": ObjectId(doc_id)})
+			self._dropPages(doc_id)
+			self.unindexDoc(doc_id)
+			# файл документа снова новый для syncPath
+			self.manifest.delete_many({"doc_id": str(doc_id)})
+			self._bumpGeneration()
 			print(f"DataBase.__delitem__ {OK}: Документ {doc_id} удалён.")
 		except Exception as e:
 			print(f"DataBase.__delitem__ {ERROR}: {doc_id}\n{e}")
@@ -422,6 +701,8 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 				print(f"DisplayManager.__getitem__ {ERROR}: Ошибка преобразования ID:\n{e}")
 				return None
 				
+			# постраничный документ собирается целиком
+			self._assembleDoc(doc)
 			# Конвертируем ObjectId в строку для удобства
 			doc['_id'] = str(doc['_id'])
 			return doc
@@ -432,27 +713,43 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 
 	def __setitem__(self, doc_id, new_doc):
 		"""Обновление документа по ID"""
+		self._replaceDoc(doc_id, new_doc)
+
+	def _replaceDoc(self, doc_id, new_doc) -> bool:
+		"""Замена документа целиком (страницы и индекс тоже), True - заменён"""
 		try:
 			# Конвертируем строковый ID в ObjectId
 			doc_OID = ObjectId(doc_id)
 			
 			# Восстанавливаем ObjectId в документе
 			new_doc['_id'] = doc_OID
+			self._prepareDoc(new_doc)
 			
 			# Заменяем весь документ
+			parent = self._splitDoc(new_doc)[0] if self.page_storage else new_doc
 			result = self.collection.replace_one(
 				{'_id': doc_OID}, 
-				new_doc,
+				parent,
 				upsert=False # Запрещаем создание новых документов
 			)
 			
 			if result.matched_count == 0:
 				print(f"{ERROR}: Документ {doc_id} не найден")
+				return False
 			else:
+				# страницы могли поменяться - перезаписываем и переиндексируем документ целиком
+				self._dropPages(doc_id)
+				if self.page_storage:
+					self._storePages(doc_id, new_doc["pages"], new_doc["words"])
+				self.unindexDoc(doc_id)
+				self.indexDoc(doc_id, new_doc["words"])
+				self._bumpGeneration()
 				print(f"{OK}: Документ {doc_id} обновлён")
+				return True
 			
 		except Exception as e:
 			print(f"{ERROR}: Ошибка обновления {doc_id}:\n{e}")
+			return False
 
 	# в конце класса DataBase (nosql.py)
 	def distinct(self, key: str):
@@ -467,6 +764,15 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 			print(f"DataBase.distinct {ERROR}:\n{e}")
 			return []
 	
+	def tagsOf(self, doc_ids) -> dict:
+		"""{doc_id: tags} для перечисленных документов одним запросом (без сборки страниц)"""
+		try:
+			oids = [ObjectId(doc_id) for doc_id in set(doc_ids)]
+			return {str(doc["_id"]): doc.get("tags", {}) for doc in self.collection.find({"_id": {"$in": oids}}, {"tags": 1})}
+		except Exception as e:
+			print(f"DataBase.tagsOf {ERROR}:\n{e}")
+			return {}
+
 	def list_compact(self) -> list[str]:
 		"""
 		Возвращает список строк с краткой информацией о каждом документе:
@@ -485,39 +791,234 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 	'''
 	Общий алгоритм поиска:
 	1) берём теги и запрос у пользователя (+чистим запрос)
-	2) Mongo фильтрует по tags + по наличию подстроки в text_clear.
-	3) далее итеративно по каждому документу:
-		далее вложено итеративно по каждой странице документа:
-		берём все слова, и сортируем их по полю "coords" 
-	(минимальное по x и по y, чтобы однозначно выяснить левый верхний угол) 
-	и проходимся по всем словам каким-то эффективным алгоритмом типа kmp
-	4) при находе закидываем в отчётный список кортежи с (Mongo_ID, номер страницы, координаты найденного слова)
+	2) позиционный индекс (InvertedIndex.lookupPhrase) пересечением списков вхождений
+	сразу даёт документы, страницы и стартовые позиции фразы
+	3) Mongo фильтрует по tags только найденные документы
+	4) из коллекции страниц достаются только найденные страницы (PageStore._fetchPages)
+	5) слова страниц хранятся уже в порядке чтения (DataBase._prepareDoc при вставке),
+	по позициям из индекса сразу достаются координаты
+	6) при находе закидываем в отчётный список кортежи с (Mongo_ID, номер страницы, координаты найденного слова)
+
+	Если индекс не построен (база заполнена до его появления) - работает старый путь _searchScan:
+	Mongo фильтрует по tags + по наличию подстроки в text_clear,
+	далее по каждой странице каждого документа проходимся kmp.
+
+	Поиск по индексу сортирует страницы по оценке BM25 (ranking.py), сканирование - нет.
+	Перед поиском по индексу слова фразы раскрываются в похожие слова словаря (fuzzy_search.py),
+	чтобы находились слова с ошибками OCR.
+	Оба пути - генераторы (_iterHits): search собирает их в список,
+	search_iter отдаёт результаты по одному, с остановкой после limit и продолжением по курсору.
 	'''
 	def search(self, phrase, tag_filters=None):
 		"""
-		Ищет в документе doc точные вхождения фразы phrase.
+		Ищет в документах точные вхождения фразы phrase.
 		Возвращает список словарей с полями:
 		- doc_id: идентификатор документа
 		- page: номер страницы
-		- coords: список координат каждого слова фразы
+		- coords: список координат каждого слова фразы (все вхождения на странице подряд)
+		- hit_size: слов в одном вхождении - coords делится на вхождения по hit_size координат
+		- path: путь к файлу
+		- score: оценка релевантности (при ранжировании, лучшие страницы - первыми)
 		"""
 		time_point = sw()
 
-		results = []
 		tag_filters = tag_filters or {}
-		# 1) Очистка и токенизация фразы:
+		phrase_clean, phrase_tokens = self._cleanPhrase(phrase)
+		if not phrase_tokens: return []
+
+		# кеш: одинаковые токены + фильтры, коллекция с тех пор не менялась (поколение)
+		generation = self._currentGeneration() if self.query_cache else None
+		if generation is not None:
+			cache_key = self.query_cache.makeKey(phrase_tokens, tag_filters, self._searchMode())
+			results = self.query_cache.get(cache_key, generation)
+			if results is not None:
+				print(f"DataBase.search {OK}: Поиск '{phrase}'->'{phrase_clean}' ({len(results)}) из кеша за {sw(time_point)}.")
+				return results
+
+		results = list(self._iterHits(phrase_tokens, tag_filters))
+
+		if generation is not None:
+			self.query_cache.put(cache_key, generation, results)
+
+		print(f"DataBase.search {OK}: Поиск '{phrase}'->'{phrase_clean}' ({len(results)}) занял {sw(time_point)}.")
+		return results
+
+	def search_iter(self, phrase, tag_filters=None, limit=None, cursor=None):
+		"""
+		То же, что search, но генератор: результаты отдаются по мере нахождения страниц.
+		- limit: остановиться после limit результатов (top-k, дальше база не читается)
+		- cursor: продолжить поиск после результата с этим курсором
+		У каждого результата есть поле cursor - строка "<doc_id>:<page>" для продолжения.
+		Порядок результатов: по убыванию оценки (ранжирование), иначе по doc_id и номеру страницы.
+		"""
+		time_point = sw()
+
+		tag_filters = tag_filters or {}
+		phrase_clean, phrase_tokens = self._cleanPhrase(phrase)
+		if not phrase_tokens or limit == 0: return
+		after = self._parseCursor(cursor)
+
+		# полный результат уже в кеше - просто отдаём его с нужного места
+		source = None
+		if self.query_cache:
+			generation = self._currentGeneration()
+			if generation is not None:
+				cached = self.query_cache.get(self.query_cache.makeKey(phrase_tokens, tag_filters, self._searchMode()), generation)
+				if cached is not None:
+					source = iter(cached[self._cursorOffset(cached, after):])
+		if source is None:
+			source = self._iterHits(phrase_tokens, tag_filters, after, streaming=True)
+
+		counter = 0
+		try:
+			for hit in source:
+				hit["cursor"] = f'{hit["doc_id"]}:{hit["page"]}'
+				counter += 1
+				if counter == 1:
+					print(f"DataBase.search_iter {INFO}: первый результат '{phrase_clean}' через {sw(time_point)}.")
+				yield hit
+				if limit and counter >= limit: break
+		finally:
+			print(f"DataBase.search_iter {OK}: Поиск '{phrase}'->'{phrase_clean}' ({counter}) занял {sw(time_point)}.")
+
+	@staticmethod
+	def _cleanPhrase(phrase):
+		# Очистка и токенизация фразы:
 		# оставляем только маленькие а–я, a–z 0-9 и пробелы, приводим к lower() заменяем ё на е
 		phrase_clean = re.sub(r'[^a-zа-яе0-9 ]', ' ', phrase.lower().replace('ё', 'е'))
-		phrase_tokens = phrase_clean.split()
+		return phrase_clean, phrase_clean.split()
 
-		
+	def _ranked(self) -> bool:
+		return self.use_index and self.use_rank
+
+	def _searchMode(self):
+		'''настройки, от которых зависят результаты (часть ключа кеша)'''
+		return (self._ranked(), self.use_index and self.fuzzy)
+
+	def _cursorOffset(self, hits, after) -> int:
+		'''С какого места списка результатов продолжать после курсора after'''
+		if after is None: return 0
+		keys = [(hit["doc_id"], hit["page"] - 1) for hit in hits]
+		if after in keys: return keys.index(after) + 1
+		# результата с курсором уже нет: по порядку документов - следующий за ним, по оценке - с начала
+		return 0 if self._ranked() else sum(key <= after for key in keys)
+
+	@staticmethod
+	def _parseCursor(cursor):
+		'''"<doc_id>:<page>" -> (doc_id, page_index) или None'''
+		if not cursor: return None
+		doc_id, page = str(cursor).rsplit(':', 1)
+		ObjectId(doc_id) # проверка формата
+		return doc_id, int(page) - 1
+
+	def _iterHits(self, phrase_tokens, tag_filters, after=None, streaming=False):
+		'''
+		Генератор результатов поиска после позиции after:
+		по убыванию оценки BM25 (_searchRanked) или по порядку (doc_id, страница).
+		streaming=True - база читается небольшими порциями, чтобы первый результат пришёл быстрее
+		'''
+		if self.use_index:
+			return self._searchIndex(phrase_tokens, tag_filters, after, streaming)
+		return self._searchScan(phrase_tokens, tag_filters, after, streaming)
+
+	@staticmethod
+	def _hitCoords(sorted_tokens, positions):
+		# каждая координата берётся как есть, без лишней обёртки
+		return tuple(sorted_tokens[pos]["coords"] for pos in positions)
+
+	def _indexedCoords(self, pages, doc_id, page_index, starts, m):
+		'''
+		Координаты найденных индексом слов страницы (pages - результат _fetchPages) или None:
+		документ удалили или заменили (syncDoc, watchPath) уже после поиска по индексу
+		'''
+		page = pages.get((doc_id, page_index))
+		if page is None: return None
+		sorted_tokens, _ = page
+		# все индексы совпавших слов, как у kmp
+		positions = [start + i for start in starts for i in range(m)]
+		if positions and positions[-1] >= len(sorted_tokens): return None
+		return self._hitCoords(sorted_tokens, positions)
+
+	def _searchIndex(self, phrase_tokens, tag_filters, after=None, streaming=False):
 		m = len(phrase_tokens) # длинна needle обычно m
-		if m == 0: return []
-		
-		# 2) Формируем Mongo-запрос: теги + точная фраза в text_clear
-		#regex_pattern = r'\b' + r'\s+'.join(re.escape(tok) for tok in phrase_tokens) + r'\b'
-		#compiled_regex = re.compile(regex_pattern, re.IGNORECASE | re.UNICODE)
-		#query = {**tag_filters, "text_clear": compiled_regex}
+		term_freqs = {} if self.use_rank else None
+		# варианты слов из словаря: ошибки OCR (fuzzy) или слова, содержащие токен (MATCH_SUBSTRING)
+		variants = self.expandTokens(phrase_tokens, substring=MATCH_SUBSTRING) if self.fuzzy or MATCH_SUBSTRING else None
+		hits = self.lookupPhrase(phrase_tokens, term_freqs, variants)
+		if self.use_rank:
+			yield from self._searchRanked(phrase_tokens, tag_filters, hits, term_freqs, after, streaming)
+			return
+		doc_ids = sorted(doc_id for doc_id in hits if after is None or doc_id >= after[0])
+		chunk_size = SEARCH_ITER_DOCS if streaming else max(len(doc_ids), 1)
+
+		for chunk_start in range(0, len(doc_ids), chunk_size):
+			chunk = doc_ids[chunk_start:chunk_start + chunk_size]
+
+			# только метаданные документов, прошедших фильтр по тегам
+			query = {**tag_filters, "_id": {"$in": [ObjectId(doc_id) for doc_id in chunk]}}
+			docs = {str(doc["_id"]): doc for doc in self.collection.find(query, {"path": 1, "paged": 1})}
+			wanted = {}
+			for doc_id in chunk:
+				if doc_id not in docs: continue
+				page_indexes = [page_index for page_index in hits[doc_id] if after is None or (doc_id, page_index) > after]
+				if page_indexes:
+					wanted[doc_id] = (docs[doc_id], page_indexes)
+			pages = self._fetchPages(wanted)
+
+			for doc_id, (doc, page_indexes) in wanted.items():
+				for page_index in page_indexes:
+					coords = self._indexedCoords(pages, doc_id, page_index, hits[doc_id][page_index], m)
+					if coords is None: continue
+					yield {
+						"doc_id": doc_id,
+						"page": page_index + 1,
+						"coords": coords,
+						"hit_size": m,
+						"path": doc["path"]
+					}
+
+	def _searchRanked(self, phrase_tokens, tag_filters, hits, term_freqs, after, streaming):
+		'''
+		Найденные индексом страницы по убыванию оценки (Bm25Ranking.rankHits).
+		Оценка считается только по индексу и метаданным, страницы с координатами
+		достаются из базы уже по порядку - для top-k читаются только первые k.
+		'''
+		m = len(phrase_tokens)
+		if not hits: return
+
+		query = {**tag_filters, "_id": {"$in": [ObjectId(doc_id) for doc_id in hits]}}
+		projection = {"path": 1, "paged": 1, "filename": 1, "tags.subject": 1}
+		docs = {str(doc["_id"]): doc for doc in self.collection.find(query, projection)}
+		ranked = self.rankHits(phrase_tokens, hits, term_freqs, docs)
+
+		if after is not None:
+			keys = [(doc_id, page_index) for _, doc_id, page_index in ranked]
+			# результата с курсором уже нет (база изменилась) - отдаём с начала
+			if after in keys:
+				ranked = ranked[keys.index(after) + 1:]
+
+		chunk_size = SEARCH_ITER_DOCS if streaming else max(len(ranked), 1)
+		for chunk_start in range(0, len(ranked), chunk_size):
+			chunk = ranked[chunk_start:chunk_start + chunk_size]
+			wanted = {}
+			for _, doc_id, page_index in chunk:
+				wanted.setdefault(doc_id, (docs[doc_id], []))[1].append(page_index)
+			pages = self._fetchPages(wanted)
+
+			for score, doc_id, page_index in chunk:
+				coords = self._indexedCoords(pages, doc_id, page_index, hits[doc_id][page_index], m)
+				if coords is None: continue
+				yield {
+					"doc_id": doc_id,
+					"page": page_index + 1,
+					"coords": coords,
+					"hit_size": m,
+					"path": docs[doc_id]["path"],
+					"score": round(score, 4)
+				}
+
+	def _searchScan(self, phrase_tokens, tag_filters, after=None, streaming=False):
+		# Формируем Mongo-запрос: теги + точная фраза в text_clear
 		regex_pattern = (
 	r'(?:(?<=^)|(?<=[^a-zA-Zа-яё0-9_]))'  # граница начала: начало строки или символ, не являющийся буквой/цифрой
 	+ r'\s+'.join(re.escape(tok) for tok in phrase_tokens) +
@@ -525,59 +1026,139 @@ class DataBase(JsonHandler, UtilityDBTools, DisplayManager):
 )
 		compiled_regex = re.compile(regex_pattern, re.IGNORECASE)
 		query = {**tag_filters, "text_clear": compiled_regex}
-
-		cursor = self.collection.find(query)
-
-		# вспомогательные функции для сортировки по "верхнему левому"
-		def min_y(tok):
-			coords = tok['coords']
-			# если первый элемент вложенный (tuple/list), то извлекаем y, иначе предполагаем стандартный формат
-			if coords and isinstance(coords[0], (list, tuple)):
-				return min(y for _, y in coords)
-			else:
-				return coords[1]
-		
-		def min_x(tok):
-			coords = tok['coords']
-			if coords and isinstance(coords[0], (list, tuple)):
-				return min(x for x, _ in coords)
-			else:
-				return coords[0]
-
-
-		# 3) Обход всех документов и страниц
-		for doc in cursor:
-			doc_id = str(doc["_id"])
-			for page_num, page_tokens in enumerate(doc.get("pages", []), start=1):
-				# 3.1) Сортировка токенов в порядке чтения
-				sorted_tokens = sorted(
-					page_tokens,
-					key=lambda t: (min_y(t), min_x(t))
-				)
-				words = [t["word"] for t in sorted_tokens]
-
-				# 3.2) Поиск фразы алгоритмом kmp
-				positions = self.kmpSearch_cpp(words, phrase_tokens)
-
-				# 4) Сбор координат для страницы, а не для каждого вхождения
-				if positions:
-					coords_list = []
-					for pos in positions:
-						# каждая координата берётся как есть, без лишней обёртки
-						coords_value = tuple(
-							sorted_tokens[pos + i]["coords"] for i in range(m)
-						)
-						coords_list.append(coords_value[0]) # [0] - обязательно, чтобы избежать лишней вложенности
-					consolidated_coords = tuple(coords_list)
-					results.append({
-						"doc_id": doc_id,
-						"page": page_num,
-						"coords": consolidated_coords,
-						"path": doc["path"]
-					})
-		
-		print(f"DataBase.search {OK}: Поиск '{phrase}'->'{phrase_clean}' ({len(results)}) занял {sw(time_point)}.")
-		return results
+		if after is not None:
+			query["_id"] = {"$gte": ObjectId(after[0])}
+
+		cursor = self.collection.find(query, {"path": 1, "paged": 1, "pages": 1, "words": 1, "reading_order": 1}).sort("_id", ASCENDING)
+
+		# страницы копятся пачкой и ищутся одним вызовом движка (_matchPages)
+		batch_words, batch_ids, batch_meta = [], [], [] # слова и хеши страниц, (doc, page_index, sorted_tokens)
+		# при потоковой выдаче первая пачка маленькая и дальше растёт до KMP_BATCH_PAGES
+		batch_limit = SEARCH_ITER_FIRST_PAGES if streaming else KMP_BATCH_PAGES
+
+		def flush():
+			hits = self._matchPages(batch_words, batch_ids, phrase_tokens)
+			meta = batch_meta.copy()
+			batch_words.clear()
+			batch_ids.clear()
+			batch_meta.clear()
+			if not len(hits): return
+			# hits упорядочены по странице - режем на куски по страницам
+			page_rows, bounds = np.unique(hits[:, 0], return_index=True)
+			found = list(zip(page_rows.tolist(), np.split(hits[:, 1], bounds[1:])))
+
+			# numpy сопоставлял только хеши: слова с координатами читаются одним запросом и только для найденных страниц
+			wanted = {}
+			for row, _ in found:
+				doc, page_index, sorted_tokens = meta[row]
+				if sorted_tokens is None:
+					wanted.setdefault(str(doc["_id"]), (doc, []))[1].append(page_index)
+			pages = self._fetchPages(wanted) if wanted else {}
+
+			for row, positions in found:
+				doc, page_index, sorted_tokens = meta[row]
+				if sorted_tokens is None:
+					page = pages.get((str(doc["_id"]), page_index))
+					if page is None: continue # документ удалили во время поиска
+					sorted_tokens = page[0]
+				# Сбор координат для страницы, а не для каждого вхождения
+				yield {
+					"doc_id": str(doc["_id"]),
+					"page": page_index + 1,
+					"coords": self._hitCoords(sorted_tokens, positions.tolist()),
+					"hit_size": len(phrase_tokens),
+					"path": doc["path"]
+				}
+
+		# Обход всех документов и страниц (токены уже в порядке чтения)
+		try:
+			for doc in cursor:
+				doc_id = str(doc["_id"])
+				if self.engine == 'numpy':
+					# для сопоставления хватает хешей слов страницы
+					for page_index, ids in self._iterPageIds(doc):
+						if after is not None and (doc_id, page_index) <= after: continue
+						batch_ids.append(ids)
+						batch_meta.append((doc, page_index, None))
+				else:
+					for page_index, sorted_tokens, words in self._iterDocPages(doc):
+						if after is not None and (doc_id, page_index) <= after: continue
+						batch_words.append(words)
+						batch_meta.append((doc, page_index, sorted_tokens))
+				if len(batch_meta) >= batch_limit:
+					yield from flush()
+					batch_limit = min(batch_limit * 2, KMP_BATCH_PAGES)
+			yield from flush()
+		finally:
+			cursor.close()
+
+	def _matchPages(self, pages_words, pages_ids, needle) -> np.ndarray:
+		'''Поиск фразы needle сразу по пачке страниц выбранным движком -> массив (страница, позиция)'''
+		if self.engine == 'cpp' and loadKmp() is None:
+			# C++ ядро недоступно (нет компилятора) - дальше без него
+			self.engine = 'python' if MATCH_SUBSTRING else 'numpy'
+			print(f'DataBase._matchPages {INFO}: C++ ядро недоступно, движок поиска: {self.engine}')
+		if self.engine == 'numpy':
+			if len(pages_ids) < len(pages_words): # хеши не подгружались (движок сменился на ходу)
+				pages_ids = [self.tokenIds(words) for words in pages_words]
+			return self.tokenSearch_batch(pages_ids, self.tokenIds(needle))
+		if self.engine == 'cpp':
+			return self.kmpSearch_batch(pages_words, needle)
+		rows = [(row, pos) for row, words in enumerate(pages_words) for pos in self.kmpSearch_python(words, needle)]
+		return np.array(rows, dtype=np.int32).reshape(-1, 2)
+
+def benchmark_kmp(pages_count=2000, words_per_page=300, repeat=5):
+	'''
+	Сравнение поиска по набору страниц:
+	- python по странице (kmpSearch_python на каждую) - как сканирование до пакетного ядра, база для ускорений;
+	- ядро по странице (kmpSearch_cpp - вызов kmpSearch_batch с одной страницей на каждую);
+	- ядро одним пакетом (kmpSearch_batch) и по хешам слов (tokenSearch_batch, хеши считаются заранее, как при вставке).
+	Запуск: python -c "import dao_service.nosql as n; n.benchmark_kmp()" (из корня проекта)
+	'''
+	import random
+	random.seed(0)
+	vocabulary = [item["word"] for page in SAMPLE_LECTURE["pages"] for item in page]
+	pages = [[random.choice(vocabulary) for _ in range(words_per_page)] for _ in range(pages_count)]
+	needle = ["очень", "сильно"]
+
+	time_point = sw()
+	for _ in range(repeat):
+		per_page = [
+			(page_index, pos)
+			for page_index, words in enumerate(pages)
+			for pos in UtilityDBTools.kmpSearch_python(words, needle)
+		]
+	per_page_time = sw(time_point, True) / repeat
+
+	UtilityDBTools.kmpSearch_cpp(pages[0], needle) # прогрев (сборка/загрузка ядра)
+	time_point = sw()
+	for _ in range(repeat):
+		per_page_cpp = [
+			(page_index, pos)
+			for page_index, words in enumerate(pages)
+			for pos in UtilityDBTools.kmpSearch_cpp(words, needle)
+		]
+	per_page_cpp_time = sw(time_point, True) / repeat
+
+	time_point = sw()
+	for _ in range(repeat):
+		batch = UtilityDBTools.kmpSearch_batch(pages, needle)
+	batch_time = sw(time_point, True) / repeat
+
+	pages_ids = [UtilityDBTools.tokenIds(words) for words in pages]
+	needle_ids = UtilityDBTools.tokenIds(needle)
+	time_point = sw()
+	for _ in range(repeat):
+		hashed = UtilityDBTools.tokenSearch_batch(pages_ids, needle_ids)
+	hashed_time = sw(time_point, True) / repeat
+
+	for name, res in (('kmpSearch_cpp', per_page_cpp), ('kmpSearch_batch', batch.tolist()), ('tokenSearch_batch', hashed.tolist())):
+		if per_page != [tuple(row) for row in res]:
+			print(f'benchmark_kmp {ERROR}: результаты kmpSearch_python и {name} различаются!')
+	speedup = lambda seconds: per_page_time / max(seconds, 1e-9) # noqa: E731
+	print(f'benchmark_kmp {INFO}: {pages_count} страниц x {words_per_page} слов, совпадений {len(per_page)}')
+	print(f'benchmark_kmp {INFO}: python по странице {per_page_time:.4f}s, ядро по странице {per_page_cpp_time:.4f}s (x{speedup(per_page_cpp_time):.1f}), '
+		f'ядро пакетом {batch_time:.4f}s (x{speedup(batch_time):.1f}), хешами {hashed_time:.4f}s (x{speedup(hashed_time):.1f})')
 
 LINE = lambda: print(DataBase._terminal_length('=')) # просто чтобы линии рисовать  # noqa: E731
 SAMPLE_LECTURE_OLD = {
@@ -0,0 +1,170 @@
+import numpy as np
+
+from bson.objectid import ObjectId
+from bson.binary import Binary
+from pymongo import ASCENDING
+
+from .dao_config import OK, ERROR, INFO
+
+
+'''
+постраничное хранение документов
+
+документ (родитель) хранит только метаданные и текст, без слов и координат:
+{"filename": ..., "path": ..., "tags": {...}, "len_pages": 3, "text": ..., "text_clear": ..., "paged": True}
+
+каждая страница - отдельная запись коллекции <collection_name>_pages:
+{"doc_id": ObjectId(...), "page": 0, "tokens": [{"word": ..., "coords": ...}, ...], "words": [...], "ids": Binary(...)}
+- page - индекс страницы (с нуля), как и в индексе поиска
+- tokens/words - то же, что doc["pages"][page]/doc["words"][page] у старых документов
+- ids - хеши слов страницы (uint64, UtilityDBTools.tokenIds) для движка numpy
+
+старые документы (страницы внутри родителя, без "paged") читаются как раньше,
+перевести их в постраничный формат: DB.splitPages()
+'''
+
+
+class PageStore:
+	# При использовании предполагается, что self.collection и self.pages уже определены
+
+	def _ensurePagesIndex(self):
+		self.pages.create_index([("doc_id", ASCENDING), ("page", ASCENDING)], unique=True)
+
+	def _storePages(self, doc_id, pages, words):
+		'''Записывает страницы документа отдельными записями'''
+		records = self._pageRecords(doc_id, pages, words)
+		if records:
+			self.pages.insert_many(records, ordered=False)
+		return len(records)
+
+	def _pageRecords(self, doc_id, pages, words) -> list:
+		'''записи коллекции страниц для документа (см. _storePages)'''
+		doc_oid = ObjectId(str(doc_id))
+		return [
+			{
+				"doc_id": doc_oid, "page": page_index, "tokens": tokens, "words": page_words,
+				"ids": Binary(self.tokenIds(page_words).tobytes())
+			}
+			for page_index, (tokens, page_words) in enumerate(zip(pages, words))
+		]
+
+	def _dropPages(self, doc_id):
+		res = self.pages.delete_many({"doc_id": ObjectId(str(doc_id))})
+		return res.deleted_count
+
+	def _fetchPages(self, wanted) -> dict:
+		'''
+		Достаёт из базы только нужные страницы.
+		wanted - {doc_id(str): (документ-родитель хотя бы с полем paged, [page_index, ...])}
+		Возвращает {(doc_id(str), page_index): (tokens, words)}; страниц удалённых документов в результате нет
+		'''
+		res = {}
+		projection = {"_id": 0, "doc_id": 1, "page": 1, "tokens": 1, "words": 1}
+
+		# постраничные документы - одним запросом
+		paged = [
+			{"doc_id": ObjectId(doc_id), "page": {"$in": list(page_indexes)}}
+			for doc_id, (doc, page_indexes) in wanted.items() if doc.get("paged")
+		]
+		if paged:
+			for rec in self.pages.find({"$or": paged}, projection):
+				res[(str(rec["doc_id"]), rec["page"])] = (rec["tokens"], rec["words"])
+
+		# старые документы - страницы внутри родителя
+		for doc_id, (doc, page_indexes) in wanted.items():
+			if doc.get("paged"): continue
+			if "pages" not in doc:
+				doc = self.collection.find_one({"_id": ObjectId(doc_id)}, {"pages": 1, "words": 1, "reading_order": 1})
+				if doc is None: continue # документ удалили
+			for page_index in page_indexes:
+				if page_index < len(doc["pages"]):
+					res[(doc_id, page_index)] = self._pageView(doc, page_index)
+		return res
+
+	def _iterDocPages(self, doc, with_ids=False):
+		'''
+		Генератор (page_index, tokens, words) по всем страницам документа,
+		with_ids=True - ещё и хеши слов: (page_index, tokens, words, ids)
+		'''
+		if doc.get("paged"):
+			projection = {"_id": 0, "page": 1, "tokens": 1, "words": 1}
+			if with_ids: projection["ids"] = 1
+			cursor = self.pages.find({"doc_id": doc["_id"]}, projection).sort("page", ASCENDING)
+			for rec in cursor:
+				if not with_ids:
+					yield rec["page"], rec["tokens"], rec["words"]
+				elif "ids" in rec:
+					yield rec["page"], rec["tokens"], rec["words"], np.frombuffer(rec["ids"], dtype=np.uint64)
+				else:
+					yield rec["page"], rec["tokens"], rec["words"], self.tokenIds(rec["words"])
+		else:
+			if "pages" not in doc:
+				doc = self.collection.find_one({"_id": doc["_id"]}, {"pages": 1, "words": 1, "reading_order": 1})
+			for page_index in range(len(doc.get("pages", []))):
+				tokens, words = self._pageView(doc, page_index)
+				if with_ids:
+					yield page_index, tokens, words, self.tokenIds(words)
+				else:
+					yield page_index, tokens, words
+
+	def _iterPageIds(self, doc):
+		'''
+		Генератор (page_index, хеши слов) по всем страницам документа - для движка numpy:
+		у постраничного документа читаются только хеши (ids), без слов и координат
+		'''
+		if not doc.get("paged"):
+			for page_index, _, _, ids in self._iterDocPages(doc, with_ids=True):
+				yield page_index, ids
+			return
+		cursor = self.pages.find({"doc_id": doc["_id"]}, {"_id": 0, "page": 1, "ids": 1}).sort("page", ASCENDING)
+		for rec in cursor:
+			if "ids" in rec:
+				yield rec["page"], np.frombuffer(rec["ids"], dtype=np.uint64)
+			else: # страница записана до появления хешей
+				words = self.pages.find_one({"doc_id": doc["_id"], "page": rec["page"]}, {"words": 1})["words"]
+				yield rec["page"], self.tokenIds(words)
+
+	def _assembleDoc(self, doc):
+		'''Собирает постраничный документ обратно в один словарь (pages + words)'''
+		if doc and doc.get("paged"):
+			pages, words = [], []
+			for _, tokens, page_words in self._iterDocPages(doc):
+				pages.append(tokens)
+				words.append(page_words)
+			doc["pages"], doc["words"] = pages, words
+			del doc["paged"]
+		return doc
+
+	@staticmethod
+	def _splitDoc(data):
+		'''(родитель без страниц, pages, words) для уже подготовленного _prepareDoc документа'''
+		parent = {key: value for key, value in data.items() if key not in ("pages", "words")}
+		parent["paged"] = True
+		return parent, data["pages"], data["words"]
+
+	def splitPages(self):
+		'''
+		Миграция: переносит страницы старых документов в коллекцию страниц,
+		в родителе остаются только метаданные.
+		'''
+		print(f'PageStore.splitPages {INFO}: перенос страниц в коллекцию {self.pages.name}...')
+		counter = 0
+		for doc in self.collection.find({"paged": {"$ne": True}}, {"_id": 1}):
+			try:
+				full = self.collection.find_one({"_id": doc["_id"]})
+				if not full.get("reading_order"):
+					# позиции слов меняются - документ переиндексируется
+					self._prepareDoc(full)
+					self.unindexDoc(doc["_id"])
+					self.indexDoc(doc["_id"], full["words"])
+				self._dropPages(doc["_id"])
+				self._storePages(doc["_id"], full["pages"], full["words"])
+				self.collection.update_one(
+					{"_id": doc["_id"]},
+					{"$set": {"paged": True, "reading_order": True}, "$unset": {"pages": "", "words": ""}}
+				)
+				counter += 1
+			except Exception as e:
+				print(f'PageStore.splitPages {ERROR}: {doc["_id"]}\n{e}')
+		self._bumpGeneration()
+		print(f'PageStore.splitPages {OK}: переведено документов: {counter}')
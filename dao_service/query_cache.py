@@ -0,0 +1,133 @@
+import json, threading, time
+
+from collections import OrderedDict
+from pymongo import ReturnDocument
+
+from .dao_config import OK, ERROR, INFO
+
+
+'''
+кеш результатов поиска
+
+ключ - (токены очищенной фразы, фильтр по тегам в каноническом виде):
+"Биологию!" и "биологию" с одинаковыми фильтрами - одна запись кеша
+
+- LRU: при превышении бюджета памяти вытесняются давно не запрошенные фразы
+- TTL: запись старше ttl секунд считается устаревшей
+- поколение коллекции: счётчик в коллекции <collection_name>_meta,
+  любая запись в базу (DB(data), del DB[id], DB[id] = doc, rebase, миграции) увеличивает его.
+  перед поиском поколение сверяется с базой - если другой процесс бота что-то изменил,
+  локальный кеш сбрасывается целиком
+'''
+
+
+class QueryCache:
+
+	def __init__(self, max_bytes, ttl):
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.generation = None
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict() # key -> (время записи, размер, результаты)
+		self._size = 0
+		self._lock = threading.Lock() # бот обрабатывает сообщения в нескольких потоках
+
+	@staticmethod
+	def makeKey(phrase_tokens, tag_filters, mode=None):
+		# mode - настройки поиска, от которых зависит результат (ранжирование, нечёткий поиск)
+		canonical = json.dumps(tag_filters, sort_keys=True, ensure_ascii=False, default=str)
+		return (tuple(phrase_tokens), canonical, mode)
+
+	@staticmethod
+	def _resultsSize(results):
+		# примерная оценка в байтах: словарь результата + координаты каждого слова
+		return 64 + sum(400 + 120 * len(hit["coords"]) for hit in results)
+
+	def _sync(self, generation):
+		if generation != self.generation:
+			self._entries.clear()
+			self._size = 0
+			self.generation = generation
+
+	def get(self, key, generation):
+		'''Результаты из кеша (копия списка) или None'''
+		with self._lock:
+			self._sync(generation)
+			entry = self._entries.get(key)
+			if entry is None or time.monotonic() - entry[0] > self.ttl:
+				if entry is not None:
+					self._drop(key)
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return [dict(hit) for hit in entry[2]]
+
+	def put(self, key, generation, results):
+		size = self._resultsSize(results)
+		if size > self.max_bytes: return
+		with self._lock:
+			# пока шёл поиск, коллекция изменилась - результат уже устарел
+			if generation != self.generation: return
+			if key in self._entries:
+				self._drop(key)
+			self._entries[key] = (time.monotonic(), size, [dict(hit) for hit in results])
+			self._size += size
+			while self._size > self.max_bytes:
+				self._drop(next(iter(self._entries)))
+
+	def _drop(self, key):
+		self._size -= self._entries.pop(key)[1]
+
+	def invalidate(self, generation=None):
+		'''Сбрасывает кеш; generation - новое поколение коллекции, если известно'''
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
+			if generation is not None:
+				self.generation = generation
+
+	def stats(self) -> dict:
+		total = self.hits + self.misses
+		return {
+			"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes,
+			"hits": self.hits, "misses": self.misses,
+			"hit_rate": round(self.hits / total, 3) if total else 0.0,
+			"generation": self.generation
+		}
+
+
+class CacheGeneration:
+	# При использовании предполагается, что self.meta и self.query_cache уже определены
+
+	_GENERATION_ID = "generation"
+
+	def _currentGeneration(self):
+		try:
+			rec = self.meta.find_one({"_id": self._GENERATION_ID})
+		except Exception as e:
+			print(f'CacheGeneration._currentGeneration {ERROR}: {e}')
+			return None
+		return rec["value"] if rec else 0
+
+	def _bumpGeneration(self):
+		'''Вызывается после любой записи в коллекцию: кеш поиска всех процессов становится недействительным'''
+		try:
+			rec = self.meta.find_one_and_update(
+				{"_id": self._GENERATION_ID}, {"$inc": {"value": 1}},
+				upsert=True, return_document=ReturnDocument.AFTER
+			)
+		except Exception as e:
+			print(f'CacheGeneration._bumpGeneration {ERROR}: {e}')
+			# не смогли записать поколение - хотя бы свой кеш не должен отдавать старое
+			if self.query_cache: self.query_cache.invalidate()
+			return
+		if self.query_cache: self.query_cache.invalidate(rec["value"])
+
+	def cacheStats(self) -> dict:
+		'''Счётчики кеша поиска: попадания, промахи, занятая память'''
+		if not self.query_cache:
+			print(f'CacheGeneration.cacheStats {INFO}: кеш поиска выключен')
+			return {}
+		return self.query_cache.stats()
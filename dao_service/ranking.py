@@ -0,0 +1,139 @@
+import math
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from .dao_config import OK, ERROR, INFO
+from .dao_config import BM25_K1, BM25_B, RANK_PHRASE_WEIGHT, RANK_FILENAME_BOOST, RANK_SUBJECT_BOOST
+
+
+'''
+ранжирование результатов поиска (BM25)
+
+единица поиска - страница, поэтому и статистика постраничная:
+- <collection_name>_pagelen: {"doc_id": ObjectId(...), "page": 2, "length": 312} - длина страницы в словах
+- <collection_name>_terms: {"_id": "биологию", "df": 17} - на скольких страницах встречается токен
+- <collection_name>_meta, {"_id": "corpus", "pages": N, "tokens": сумма длин} - для средней длины страницы
+
+таблицы меняются вместе с индексом (InvertedIndex.indexDoc/unindexDoc) через $inc,
+поэтому несколько процессов могут писать в базу одновременно.
+
+оценка страницы:
+- BM25 по токенам фразы (tf - из позиций индекса)
+- фраза как отдельный терм: чем больше точных вхождений фразы на странице, тем выше
+  (фраза ищется только целиком, так что близость слов = число их совпадений подряд)
+- бонус, если слова фразы есть в имени файла или в предмете (tags.subject)
+'''
+
+
+class Bm25Ranking:
+	# При использовании предполагается, что self.pagelen, self.terms и self.meta уже определены,
+	# а cleanText доступен (UtilityDBTools)
+
+	_CORPUS_ID = "corpus"
+
+	def _ensureStatsIndex(self):
+		self.pagelen.create_index([("doc_id", ASCENDING), ("page", ASCENDING)], unique=True)
+
+	def _addStats(self, docs_postings):
+		'''docs_postings - [(doc_oid, [(page_index, длина страницы, {token: [позиции]}), ...]), ...]'''
+		pages = [(doc_oid, page) for doc_oid, pages_postings in docs_postings for page in pages_postings]
+		# статистика не ведётся, пока её не создаст rebuildIndex() (иначе она будет неполной)
+		if not pages or not self.statsReady(): return
+		self.pagelen.insert_many(
+			[{"doc_id": doc_oid, "page": page_index, "length": length} for doc_oid, (page_index, length, _) in pages],
+			ordered=False
+		)
+		df = {}
+		for _, (_, _, postings) in pages:
+			for token in postings:
+				df[token] = df.get(token, 0) + 1
+		self.terms.bulk_write(
+			[UpdateOne({"_id": token}, {"$inc": {"df": count}}, upsert=True) for token, count in df.items()],
+			ordered=False
+		)
+		self.meta.update_one(
+			{"_id": self._CORPUS_ID},
+			{"$inc": {"pages": len(pages), "tokens": sum(length for _, (_, length, _) in pages)}}
+		)
+
+	def _removeStats(self, doc_oid, tokens_df):
+		'''tokens_df - {token: на скольких страницах документа он был} (из записей индекса)'''
+		lengths = [rec["length"] for rec in self.pagelen.find({"doc_id": doc_oid}, {"length": 1})]
+		if not lengths: return
+		self.pagelen.delete_many({"doc_id": doc_oid})
+		if tokens_df:
+			self.terms.bulk_write(
+				[UpdateOne({"_id": token}, {"$inc": {"df": -count}}) for token, count in tokens_df.items()],
+				ordered=False
+			)
+			self.terms.delete_many({"_id": {"$in": list(tokens_df)}, "df": {"$lte": 0}})
+		self.meta.update_one(
+			{"_id": self._CORPUS_ID},
+			{"$inc": {"pages": -len(lengths), "tokens": -sum(lengths)}}
+		)
+
+	def _clearStats(self):
+		self.pagelen.delete_many({})
+		self.terms.delete_many({})
+		self.meta.update_one({"_id": self._CORPUS_ID}, {"$set": {"pages": 0, "tokens": 0}}, upsert=True)
+
+	def statsReady(self) -> bool:
+		'''Статистика есть (база заполнялась уже с ней или был вызван rebuildIndex())'''
+		return self.meta.find_one({"_id": self._CORPUS_ID}) is not None
+
+	def termDf(self, tokens) -> dict:
+		'''{token: df} из таблицы частот, отсутствующие токены - 0'''
+		df = {rec["_id"]: rec["df"] for rec in self.terms.find({"_id": {"$in": list(tokens)}})}
+		return {token: df.get(token, 0) for token in tokens}
+
+	def _fieldMatch(self, text, tokens):
+		'''доля токенов фразы, которые есть в поле (имя файла, предмет)'''
+		words = set(self.cleanText(text or "").split())
+		return sum(token in words for token in tokens) / len(tokens)
+
+	def rankHits(self, phrase_tokens, hits, term_freqs, docs) -> list:
+		'''
+		Сортирует найденные страницы по убыванию оценки.
+		hits - результат lookupPhrase, term_freqs - {(doc_id, page_index): {token: tf}},
+		docs - {doc_id: родитель с filename и tags.subject} (только прошедшие фильтр по тегам)
+		Возвращает [(score, doc_id, page_index), ...]
+		'''
+		corpus = self.meta.find_one({"_id": self._CORPUS_ID}) or {}
+		n_pages = max(corpus.get("pages", 0), 1)
+		avg_len = max(corpus.get("tokens", 0) / n_pages, 1.0)
+
+		unique = list(dict.fromkeys(phrase_tokens))
+		idf = {
+			token: math.log(1 + (n_pages - df + 0.5) / (df + 0.5))
+			for token, df in self.termDf(unique).items()
+		}
+		phrase_idf = max(idf.values())
+
+		lengths = {}
+		doc_oids = [ObjectId(doc_id) for doc_id in docs]
+		for rec in self.pagelen.find({"doc_id": {"$in": doc_oids}}, {"_id": 0, "doc_id": 1, "page": 1, "length": 1}):
+			lengths[(str(rec["doc_id"]), rec["page"])] = rec["length"]
+
+		def bm25(tf, idf_value, norm):
+			return idf_value * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+		ranked = []
+		for doc_id, doc in docs.items():
+			field_bonus = (
+				RANK_FILENAME_BOOST * self._fieldMatch(doc.get("filename", ""), unique)
+				+ RANK_SUBJECT_BOOST * self._fieldMatch(doc.get("tags", {}).get("subject", ""), unique)
+			)
+			for page_index, starts in hits[doc_id].items():
+				length = lengths.get((doc_id, page_index), avg_len)
+				norm = 1 - BM25_B + BM25_B * length / avg_len
+				tf = term_freqs[(doc_id, page_index)]
+				score = sum(bm25(tf[token], idf[token], norm) for token in unique)
+				if len(phrase_tokens) > 1:
+					score += RANK_PHRASE_WEIGHT * bm25(len(starts), phrase_idf, norm)
+				ranked.append((score + field_bonus, doc_id, page_index))
+
+		# при равной оценке - порядок документов и страниц
+		ranked.sort(key=lambda item: (-item[0], item[1], item[2]))
+		return ranked
+
@@ -0,0 +1,90 @@
+import os, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import fitz
+
+from .file_manager_configs import ERROR, OK, INFO
+from .file_manager_configs import PDF_DOC_POOL_SIZE
+
+
+'''
+пул открытых PDF для отрисовки страниц (PdfParser.renderPixmap / renderToPic)
+
+листание отчёта рисует страницы одних и тех же лекций: документ открывается (разбор xref)
+один раз и остаётся открытым, пока он среди PDF_DOC_POOL_SIZE последних использованных.
+ключ - (путь, mtime, size): файл поменялся - открывается заново, старая версия закрывается.
+вытесненные документы закрываются сразу (дескрипторы не копятся неделями работы бота).
+
+MuPDF не рассчитан на работу из нескольких потоков одновременно, поэтому документ
+выдаётся под общей блокировкой пула: отрисовки из разных потоков (фоновая подгрузка
+страниц бота) идут по очереди, но без повторного открытия файлов.
+'''
+
+
+class DocumentPool:
+	def __init__(self, max_docs=PDF_DOC_POOL_SIZE):
+		self.max_docs = max_docs
+		self._docs = OrderedDict() # (путь, mtime_ns, size) -> fitz.Document, последний использованный - в конце
+		self._lock = threading.RLock()
+		self.hits = 0
+		self.misses = 0
+
+	@contextmanager
+	def document(self, path):
+		'''with pool.document(normalized_path) as doc: ... - открытый документ, пока блок выполняется'''
+		path = str(path)
+		stat = os.stat(path)
+		key = (path, stat.st_mtime_ns, stat.st_size)
+		with self._lock:
+			doc = self._docs.get(key)
+			if doc is None or doc.is_closed:
+				self.misses += 1
+				self._dropPath(path) # прежняя версия файла
+				doc = fitz.open(path)
+				self._docs[key] = doc
+				self._evict()
+			else:
+				self.hits += 1
+				self._docs.move_to_end(key)
+			yield doc
+
+	def _dropPath(self, path):
+		for key in [key for key in self._docs if key[0] == path]:
+			self._close(self._docs.pop(key))
+
+	def _evict(self):
+		while len(self._docs) > self.max_docs:
+			_, doc = self._docs.popitem(last=False)
+			self._close(doc)
+
+	@staticmethod
+	def _close(doc):
+		try:
+			doc.close()
+		except Exception as e:
+			print(f'DocumentPool._close {ERROR}: {e}')
+
+	def close(self):
+		'''Закрывает все документы пула'''
+		with self._lock:
+			while self._docs:
+				self._close(self._docs.popitem()[1])
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"open": len(self._docs), "max_docs": self.max_docs, "hits": self.hits, "misses": self.misses}
+
+
+# у каждого процесса свой пул (документы MuPDF не переживают fork)
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def getDocPool() -> DocumentPool:
+	global _pool, _pool_pid
+	with _pool_lock:
+		if _pool_pid != os.getpid():
+			_pool_pid = os.getpid()
+			_pool = DocumentPool()
+		return _pool
@@ -1,3 +1,4 @@
+from os import cpu_count
 from pathlib import Path
 from re import compile, UNICODE
 
@@ -16,10 +17,45 @@ LANGUAGES = {
 }
 CFD = Path(__file__).resolve().parent # (current file directory)
 TESSDATA_DIR = CFD / 'tessdata' # (tessdata directory)
+OCR_LANG = 'rus+eng'
+OCR_OEM = 1 # LSTM
+OCR_PSM = 3 # автоматическая разметка страницы
+OCR_CONFIG = f'--oem {OCR_OEM} --psm {OCR_PSM} -l {OCR_LANG}' # конфиг tesseract (входит в ключ кеша OCR)
+OCR_BACKEND = 'auto' # 'tesserocr' - движок живёт в процессе, 'pytesseract' - процесс tesseract на картинку, 'auto' - tesserocr если установлен
+OCR_ENGINES = 2 # сколько движков tesserocr держит процесс (общие для всех потоков, каждый - десятки МБ)
+OCR_CACHE = True # кешировать результаты OCR на диске по хешу картинки
+OCR_CACHE_PATH = CFD / 'ocr_cache.db'
+OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024 # бюджет кеша OCR (размер результатов в json)
+OCR_CACHE_EVICT_EVERY = 100 # проверка бюджета раз в столько записей
+OCR_POLICY = True # решать перед OCR, стоит ли распознавать картинку PDF (ocr_policy.py)
+OCR_MIN_SIDE = 24 # px, картинки с меньшей стороной не распознаются (иконки, маркеры)
+OCR_MIN_AREA = 64 * 64 # px, то же по площади
+OCR_EDGE_LEVEL = 40 # перепад яркости соседних пикселей (0-255), который считается границей
+OCR_MIN_EDGE_DENSITY = 0.01 # доля пикселей-границ, ниже которой текста на картинке нет
+OCR_TARGET_DPI = 300 # картинки с большим разрешением на странице уменьшаются до него
+OCR_COVERED_MIN_WORDS = 3 # слов текстового слоя внутри картинки, чтобы считать её уже распознанной
+OCR_COVERED_RATIO = 0.5 # и какую долю площади картинки они должны охватывать
 
 # ============= Transfer configs =============
 OUTLINE_COLOR = (255, 0, 0) # (R, G, B)
 OUTLINE_FACTOR = 0.005
+HIGHLIGHT_MERGE_GAP = 1.0 # слова подряд на одной строке обводятся одной рамкой, если между ними не больше столько высот строки
+RENDER_CACHE_DIR = CFD / 'render_cache' # общий кеш отрисованных страниц (render_cache.py)
+RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024 # бюджет кеша страниц на диске
+RENDER_CACHE_WRITE = True # FileManager.renderPage: страница, отрисованная в память, пишется в кеш (в фоне)
+
+# ============= ingest configs =============
+INGEST_WORKERS = cpu_count() or 1 # процессов разбора файлов в FileManager.runPath (1 - по одному в текущем процессе)
+INGEST_BATCH = 16 # сколько разобранных документов писатель копит перед записью в базу
+INGEST_QUEUE = True # индексация через очередь заданий (ingest_queue.py): после падения продолжается с места остановки
+INGEST_QUEUE_PATH = CFD / 'ingest_queue.db'
+INGEST_LEASE = 600 # seconds - аренда взятого задания (продлевается, пока идёт разбор)
+INGEST_MAX_ATTEMPTS = 3 # попыток на файл, потом задание failed
+WATCH_WORKERS = 2 # процессов разбора у FileManager.watchPath
+WATCH_BACKEND = 'auto' # 'inotify' (Linux), 'polling' или 'auto'
+WATCH_DEBOUNCE = 1.0 # seconds - файл разбирается, когда столько времени не менялся
+WATCH_POLL_INTERVAL = 2.0 # seconds - период обхода директории без inotify
+WATCH_TICK = 0.5 # seconds - как часто проверяются затихшие файлы
 
 # ============= parsers configs =============
 #FILE_REGEX = compile(r'^([A-Za-zА-Яа-яЁё_0-9]+)-([\d._]*)-((?:\d{8})?)-(\d{1,2})-(\d)-([A-Za-zА-Яа-яЁё_.]*)(?:@([A-Za-zА-Яа-яЁё0-9_]+))?\.(\w+)')
@@ -29,3 +65,7 @@ FILE_REGEX = compile(
     UNICODE
 )
 TEMP_FOLDER = './temp' # ./tmp нельзя
+PDF_PAGE_WORKERS = cpu_count() or 1 # процессов для постраничного разбора одного большого PDF
+PDF_PARALLEL_MIN_PAGES = 32 # с какого числа страниц PDF разбирается кусками параллельно
+PDF_PAGES_PER_TASK = 8 # страниц в одном куске
+PDF_DOC_POOL_SIZE = 16 # сколько PDF держать открытыми для отрисовки страниц (doc_pool.py)
@@ -0,0 +1,249 @@
+import os, re, time, socket, sqlite3, threading
+from pathlib import Path
+from contextlib import contextmanager
+
+from .file_manager_configs import ERROR, OK, INFO
+from .file_manager_configs import INGEST_QUEUE_PATH, INGEST_LEASE, INGEST_MAX_ATTEMPTS
+
+
+'''
+очередь заданий индексации (sqlite), переживает падения и Ctrl+C
+
+задание - файл: {"path", "mode", "state", "attempts", "size", "mtime", "hash", "owner", "lease_until", "checkpoint", "doc_id", "error"}
+- mode: 'insert' (runPath - новый документ) или 'sync' (syncPath/watchPath - замена документа по пути)
+- state: pending -> running -> done | failed (после INGEST_MAX_ATTEMPTS неудачных попыток)
+- owner/lease_until: кто взял задание и до какого времени (пока задания разбираются, аренда
+  продлевается в фоне - keepAlive); задание с истёкшей арендой (или взятое процессом этого хоста,
+  которого больше нет) снова можно взять
+- checkpoint: последний пройденный этап ('parsed', 'written'), doc_id - записанный документ
+
+очередь общая для нескольких процессов (и хостов с общим диском): claim берёт задания
+в транзакции BEGIN IMMEDIATE, остальные операции проверяют владельца.
+у каждой базы/коллекции свой файл очереди (queuePath): выполненное задание одной коллекции
+не мешает индексировать тот же файл в другую.
+'''
+
+
+def queuePath(scope) -> Path:
+	'''файл очереди для scope ('база.коллекция')'''
+	scope = re.sub(r'[^\w.-]', '_', str(scope))
+	return INGEST_QUEUE_PATH.with_name(f'{INGEST_QUEUE_PATH.stem}.{scope}{INGEST_QUEUE_PATH.suffix}')
+
+
+class IngestQueue:
+	STATES = ('pending', 'running', 'done', 'failed')
+
+	def __init__(self, db_path=INGEST_QUEUE_PATH, lease=INGEST_LEASE, max_attempts=INGEST_MAX_ATTEMPTS):
+		self.db_path = Path(db_path)
+		self.lease = lease
+		self.max_attempts = max_attempts
+		self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+		self.host = socket.gethostname()
+		self.owner = f'{self.host}:{os.getpid()}'
+
+		self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self._init_db()
+		self._reclaimDead()
+
+	def _init_db(self):
+		self.conn.execute('''
+		CREATE TABLE IF NOT EXISTS jobs (
+			path TEXT PRIMARY KEY,
+			mode TEXT,
+			state TEXT,
+			attempts INTEGER DEFAULT 0,
+			size INTEGER,
+			mtime REAL,
+			hash TEXT,
+			owner TEXT,
+			lease_until REAL,
+			checkpoint TEXT,
+			doc_id TEXT,
+			error TEXT,
+			updated_at REAL
+		)''')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state)')
+
+	@staticmethod
+	def _row(cursor, row) -> dict:
+		return {column[0]: value for column, value in zip(cursor.description, row)}
+
+	def _reclaimDead(self):
+		'''задания процессов этого хоста, которых уже нет (упали без release) - снова в pending'''
+		rows = self.conn.execute(
+			"SELECT path, owner FROM jobs WHERE state = 'running' AND owner LIKE ?", (self.host + ':%',)
+		).fetchall()
+		for path, owner in rows:
+			pid = int(owner.rsplit(':', 1)[1])
+			try:
+				os.kill(pid, 0)
+				continue # процесс жив (или чужой, но существует) - ждём окончания аренды
+			except ProcessLookupError:
+				pass
+			except PermissionError:
+				continue
+			self.conn.execute(
+				"UPDATE jobs SET state = 'pending', owner = NULL, lease_until = NULL WHERE path = ? AND owner = ?",
+				(path, owner)
+			)
+			print(f'IngestQueue._reclaimDead {INFO}: {Path(path).name} - процесс {owner} завершился, задание возвращено')
+
+	def enqueue(self, items, mode):
+		'''
+		items - [(path, size, mtime, hash или None), ...]. Задание становится pending, если его нет,
+		поменялся файл (size/mtime) или оно не было выполнено; выполненное задание 'insert' того же файла
+		не трогается (повторный runPath после падения), взятое другим процессом - тоже.
+		'sync' - решение уже принято по манифесту (файл новый, изменён или его документ удалён),
+		поэтому выполненное задание снова становится pending.
+		Возвращает число заданий в pending после добавления.
+		'''
+		now = time.time()
+		self.conn.execute('BEGIN IMMEDIATE')
+		try:
+			self.conn.executemany('''
+				INSERT INTO jobs(path, mode, state, attempts, size, mtime, hash, updated_at)
+				VALUES(?, ?, 'pending', 0, ?, ?, ?, ?)
+				ON CONFLICT(path) DO UPDATE
+				  SET mode = excluded.mode, state = 'pending', attempts = 0, size = excluded.size, mtime = excluded.mtime,
+				      hash = excluded.hash, error = NULL, updated_at = excluded.updated_at,
+				      -- тот же файл: этап сохраняется (документ мог быть уже записан до падения)
+				      checkpoint = CASE WHEN jobs.size = excluded.size AND jobs.mtime = excluded.mtime THEN jobs.checkpoint END
+				  WHERE (jobs.state != 'running' OR jobs.lease_until < excluded.updated_at)
+				    AND (excluded.mode = 'sync' OR jobs.state != 'done' OR jobs.size != excluded.size
+				         OR jobs.mtime != excluded.mtime OR jobs.mode != excluded.mode)
+				''',
+				[(str(path), mode, size, mtime, digest, now) for path, size, mtime, digest in items]
+			)
+			self.conn.execute('COMMIT')
+		except Exception:
+			self.conn.execute('ROLLBACK')
+			raise
+		return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'pending'").fetchone()[0]
+
+	def claim(self, prefix='', limit=1) -> list:
+		'''Берёт до limit заданий (pending или с истёкшей арендой) внутри директории prefix'''
+		now = time.time()
+		prefix = str(prefix)
+		self.conn.execute('BEGIN IMMEDIATE')
+		try:
+			cursor = self.conn.execute('''
+				SELECT * FROM jobs
+				WHERE substr(path, 1, ?) = ?
+				  AND (state = 'pending' OR (state = 'running' AND lease_until < ?))
+				ORDER BY updated_at
+				LIMIT ?
+				''',
+				(len(prefix), prefix, now, limit)
+			)
+			jobs = [self._row(cursor, row) for row in cursor.fetchall()]
+			self.conn.executemany('''
+				UPDATE jobs SET state = 'running', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+				WHERE path = ?
+				''',
+				[(self.owner, now + self.lease, now, job["path"]) for job in jobs]
+			)
+			self.conn.execute('COMMIT')
+		except Exception:
+			self.conn.execute('ROLLBACK')
+			raise
+		for job in jobs:
+			job["attempts"] += 1
+		return jobs
+
+	def renew(self, conn=None):
+		'''Продлевает аренду всех заданий этого процесса (пока они разбираются)'''
+		(conn or self.conn).execute(
+			"UPDATE jobs SET lease_until = ? WHERE owner = ? AND state = 'running'",
+			(time.time() + self.lease, self.owner)
+		)
+
+	@contextmanager
+	def keepAlive(self, interval=None):
+		'''
+		with queue.keepAlive(): ... - пока блок выполняется, аренда заданий продлевается в фоне
+		каждые interval секунд (по умолчанию - треть аренды): один большой файл может разбираться
+		дольше INGEST_LEASE, и его задание не должен забрать другой процесс
+		'''
+		interval = interval or self.lease / 3
+		stop = threading.Event()
+
+		def renewLoop():
+			# своё соединение: транзакции claim основного потока не смешиваются с продлением
+			conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+			try:
+				while not stop.wait(interval):
+					try:
+						self.renew(conn)
+					except Exception as e:
+						print(f'IngestQueue.keepAlive {ERROR}: аренда не продлена: {e}')
+			finally:
+				conn.close()
+
+		thread = threading.Thread(target=renewLoop, name='IngestQueue.keepAlive', daemon=True)
+		thread.start()
+		try:
+			yield self
+		finally:
+			stop.set()
+			thread.join()
+
+	def checkpoint(self, path, stage, doc_id=None):
+		self.conn.execute(
+			"UPDATE jobs SET checkpoint = ?, doc_id = COALESCE(?, doc_id), updated_at = ? WHERE path = ? AND owner = ?",
+			(stage, doc_id, time.time(), str(path), self.owner)
+		)
+
+	def complete(self, path, doc_id):
+		self.conn.execute('''
+			UPDATE jobs SET state = 'done', checkpoint = 'written', doc_id = ?, owner = NULL, lease_until = NULL,
+			  error = NULL, updated_at = ?
+			WHERE path = ? AND owner = ?
+			''',
+			(doc_id, time.time(), str(path), self.owner)
+		)
+
+	def fail(self, path, error) -> bool:
+		'''Неудачная попытка: снова pending или failed, если попытки кончились. True - окончательно'''
+		row = self.conn.execute('SELECT attempts FROM jobs WHERE path = ? AND owner = ?', (str(path), self.owner)).fetchone()
+		if not row: return False
+		final = row[0] >= self.max_attempts
+		self.conn.execute('''
+			UPDATE jobs SET state = ?, error = ?, owner = NULL, lease_until = NULL, updated_at = ?
+			WHERE path = ? AND owner = ?
+			''',
+			('failed' if final else 'pending', str(error), time.time(), str(path), self.owner)
+		)
+		return final
+
+	def release(self):
+		'''Возвращает невыполненные задания этого процесса в pending (остановка), попытка не засчитывается'''
+		self.conn.execute('''
+			UPDATE jobs SET state = 'pending', attempts = MAX(attempts - 1, 0), owner = NULL, lease_until = NULL, updated_at = ?
+			WHERE owner = ? AND state = 'running'
+			''',
+			(time.time(), self.owner)
+		)
+
+	def stats(self, prefix='') -> dict:
+		prefix = str(prefix)
+		rows = self.conn.execute(
+			'SELECT state, COUNT(*) FROM jobs WHERE substr(path, 1, ?) = ? GROUP BY state', (len(prefix), prefix)
+		).fetchall()
+		return {state: 0 for state in self.STATES} | dict(rows)
+
+	def failed(self, prefix='') -> list:
+		'''[(path, error), ...] окончательно не разобранных файлов'''
+		prefix = str(prefix)
+		return self.conn.execute(
+			"SELECT path, error FROM jobs WHERE state = 'failed' AND substr(path, 1, ?) = ?", (len(prefix), prefix)
+		).fetchall()
+
+	def clear(self, prefix='', states=('done',)):
+		'''Удаляет задания в указанных состояниях (по умолчанию - выполненные)'''
+		prefix = str(prefix)
+		self.conn.execute(
+			f"DELETE FROM jobs WHERE substr(path, 1, ?) = ? AND state IN ({','.join('?' * len(states))})",
+			(len(prefix), prefix, *states)
+		)
@@ -1,5 +1,7 @@
-import os, pytesseract, requests
+import os, atexit, queue, pytesseract, requests, threading
 import numpy as np
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from tqdm import tqdm
 from PIL import Image, ImageDraw
 from pathlib import Path
@@ -8,6 +10,11 @@ from .file_manager_configs import *
 os.environ['TESSDATA_PREFIX'] = str(TESSDATA_DIR) 
 # !! убедиться что файл откуда взят TESSDATA_DIR находиться в той же директории что и этот файл
 
+try: # необязательная зависимость: биндинг к libtesseract без отдельного процесса
+	import tesserocr
+except ImportError:
+	tesserocr = None
+
 '''
 правила нейминга
 
@@ -64,6 +71,146 @@ def download_lang_data():
 				pbar.update(size)
 	print(f"ocr.download_lang_data <{OK}>: Все требуемые файлы скачаны в директорию {TESSDATA_DIR.name}")
 
+class OcrBackend(ABC):
+	'''
+	Движок OCR: картинка PIL (RGB) -> [full_text, [(word: str, coords: tuple), ...]]
+	Разбор ответа общий - tsv tesseract (столбцы как у image_to_data).
+	'''
+	name = None
+
+	@abstractmethod
+	def recognize(self, pil_img) -> list:
+		pass
+
+	def warmUp(self):
+		'''подготовить движок заранее (в воркере пула - до первой картинки)'''
+		pass
+
+	@staticmethod
+	def _fromData(data):
+		# формирование результата из данных tesseract
+		full_text, words_data = "", []
+		for word, x, y, w, h in zip(
+			data['text'], data['left'], data['top'], data['width'], data['height']):
+			if word := word.strip(): # проверка на пустоту с присваиванием
+				coords = ((x, y), (x + w, y), (x + w, y + h), (x, y + h)) # абсолютные координаты углов четырехугольника
+				full_text += word + " "
+				words_data.append((word, coords))
+
+		# list: [full_text, [(word: str, coords: tuple), ...]]
+		return [full_text.strip(), words_data]
+
+
+class PytesseractBackend(OcrBackend):
+	'''процесс tesseract на каждую картинку (каждый раз заново грузит traineddata)'''
+	name = 'pytesseract'
+
+	def recognize(self, pil_img) -> list:
+		# обработка pytesseract
+		data = pytesseract.image_to_data(
+			np.array(pil_img),  # Теперь передаем numpy array (требование pytesseract)
+			config=OCR_CONFIG,
+			output_type=pytesseract.Output.DICT)
+		return self._fromData(data)
+
+
+class TesserocrBackend(OcrBackend):
+	'''
+	libtesseract внутри процесса: движки с загруженными языками создаются по мере надобности,
+	не больше OCR_ENGINES на процесс, и общие для всех потоков - поток берёт свободный движок
+	на одну картинку (нет свободного - ждёт). Воркер пула разбора однопоточный и держит один.
+	Картинка передаётся из памяти без временных файлов, движки освобождаются при выходе.
+	'''
+	name = 'tesserocr'
+	_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num', 'left', 'top', 'width', 'height', 'conf', 'text')
+
+	def __init__(self, engines=OCR_ENGINES):
+		self.engines = max(1, engines)
+		self._idle = queue.Queue()
+		self._created = 0
+		self._lock = threading.Lock()
+		atexit.register(self.close)
+
+	def _newApi(self):
+		api = tesserocr.PyTessBaseAPI(
+			path=str(TESSDATA_DIR),
+			lang=OCR_LANG,
+			oem=OCR_OEM,
+			psm=OCR_PSM
+		)
+		print(f"TesserocrBackend._newApi {OK}: движок {OCR_LANG} загружен (pid {os.getpid()}, {self._created}/{self.engines})")
+		return api
+
+	@contextmanager
+	def _api(self):
+		'''with self._api() as api: ... - свободный движок на время блока'''
+		try:
+			api = self._idle.get_nowait()
+		except queue.Empty:
+			with self._lock:
+				create = self._created < self.engines
+				if create: self._created += 1
+			if not create:
+				api = self._idle.get() # все движки заняты - ждём освободившийся
+			else:
+				try:
+					api = self._newApi()
+				except Exception:
+					with self._lock:
+						self._created -= 1
+					raise
+		try:
+			yield api
+		finally:
+			api.Clear()
+			self._idle.put(api)
+
+	def warmUp(self):
+		with self._api():
+			pass
+
+	def recognize(self, pil_img) -> list:
+		with self._api() as api:
+			api.SetImage(pil_img)
+			tsv = api.GetTSVText(0)
+		data = {column: [] for column in self._COLUMNS}
+		for line in tsv.splitlines():
+			values = line.split('\t', len(self._COLUMNS) - 1)
+			if len(values) < len(self._COLUMNS): continue
+			for column, value in zip(self._COLUMNS, values):
+				data[column].append(value if column == 'text' else int(float(value)))
+		return self._fromData(data)
+
+	def close(self):
+		'''освобождает свободные движки (End)'''
+		while True:
+			try:
+				api = self._idle.get_nowait()
+			except queue.Empty:
+				return
+			with self._lock:
+				self._created -= 1
+			api.End()
+
+
+_backend = None
+
+def getOcrBackend() -> OcrBackend:
+	'''Движок OCR процесса (по OCR_BACKEND), создаётся при первом вызове'''
+	global _backend
+	if _backend is None:
+		name = OCR_BACKEND
+		if name == 'auto':
+			name = 'tesserocr' if tesserocr is not None else 'pytesseract'
+			if tesserocr is None:
+				print(f"ocr.getOcrBackend {INFO}: tesserocr не установлен (requirements-ocr.txt), OCR - процесс tesseract на каждую картинку")
+		if name == 'tesserocr' and tesserocr is None:
+			print(f"ocr.getOcrBackend {ERROR}: tesserocr не установлен, используется pytesseract")
+			name = 'pytesseract'
+		_backend = TesserocrBackend() if name == 'tesserocr' else PytesseractBackend()
+	return _backend
+
+
 def process_image(image_input):
 	"""
 	Обрабатывает изображение и возвращает структурированные данные о распознанном тексте
@@ -84,23 +231,7 @@ def process_image(image_input):
 	if pil_img.mode != 'RGB':
 		pil_img = pil_img.convert('RGB')
 
-	# обработка pytesseract
-	data = pytesseract.image_to_data(
-		np.array(pil_img),  # Теперь передаем numpy array (требование pytesseract)
-		config=r'--oem 1 --psm 3 -l rus+eng',
-		output_type=pytesseract.Output.DICT)
-	
-	# формирование результата из данных pytesseract
-	full_text, words_data = "", []
-	for word, x, y, w, h in zip(
-		data['text'], data['left'], data['top'], data['width'], data['height']):
-		if word := word.strip(): # проверка на пустоту с присваиванием
-			coords = ((x, y), (x + w, y), (x + w, y + h), (x, y + h)) # абсолютные координаты углов четырехугольника
-			full_text += word + " "
-			words_data.append((word, coords))
-
-	# list: [full_text, [(word: str, coords: tuple), ...]]
-	return [full_text.strip(), words_data]
+	return getOcrBackend().recognize(pil_img)
 
 
 def main():
@@ -0,0 +1,119 @@
+import os, json, sqlite3, time, hashlib, threading
+from pathlib import Path
+
+from .file_manager_configs import ERROR, OK, INFO
+from .file_manager_configs import OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES, OCR_CACHE_EVICT_EVERY
+
+
+'''
+кеш результатов OCR на диске (sqlite)
+
+ключ - sha256(байты картинки + строка конфигурации tesseract):
+один и тот же логотип на каждом слайде, тот же файл под другим именем,
+повторная индексация - tesseract не запускается повторно.
+поменялся конфиг (языки, psm) - другие ключи, старые записи вытеснятся сами.
+
+значение - ровно то, что вернул ocr.process_image: [full_text, [(word, coords), ...]] (в json)
+
+размер ограничен OCR_CACHE_MAX_BYTES: раз в OCR_CACHE_EVICT_EVERY записей
+удаляются давно не использованные записи (LRU по last_used).
+файл общий для всех процессов разбора (WAL), соединение - своё у каждого процесса.
+'''
+
+
+class OcrCache:
+	def __init__(self, db_path=OCR_CACHE_PATH, max_bytes=OCR_CACHE_MAX_BYTES):
+		self.db_path = Path(db_path)
+		self.max_bytes = max_bytes
+		self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+		self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self._lock = threading.Lock()
+		self._puts = 0
+		self.hits = 0
+		self.misses = 0
+		self._init_db()
+
+	def _init_db(self):
+		self.conn.execute('''
+		CREATE TABLE IF NOT EXISTS ocr (
+			key TEXT PRIMARY KEY,
+			result_json TEXT,
+			size INTEGER,
+			last_used REAL
+		)''')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS ocr_last_used ON ocr(last_used)')
+		self.conn.commit()
+
+	@staticmethod
+	def makeKey(image_bytes: bytes, config: str) -> str:
+		return hashlib.sha256(image_bytes + b'\0' + config.encode()).hexdigest()
+
+	def get(self, key):
+		'''[full_text, [(word, coords), ...]] или None'''
+		with self._lock:
+			row = self.conn.execute('SELECT result_json FROM ocr WHERE key = ?', (key,)).fetchone()
+			if not row:
+				self.misses += 1
+				return None
+			self.conn.execute('UPDATE ocr SET last_used = ? WHERE key = ?', (time.time(), key))
+			self.conn.commit()
+			self.hits += 1
+
+		full_text, words = json.loads(row[0])
+		# json превращает кортежи в списки - возвращаем как у process_image
+		return [full_text, [(word, tuple(tuple(point) for point in coords)) for word, coords in words]]
+
+	def put(self, key, result):
+		result_json = json.dumps(result, ensure_ascii=False)
+		with self._lock:
+			self.conn.execute('''
+				INSERT INTO ocr(key, result_json, size, last_used)
+				VALUES(?, ?, ?, ?)
+				ON CONFLICT(key) DO UPDATE
+				  SET result_json = excluded.result_json, size = excluded.size, last_used = excluded.last_used
+				''',
+				(key, result_json, len(result_json.encode()), time.time())
+			)
+			self.conn.commit()
+			self._puts += 1
+			if self._puts % OCR_CACHE_EVICT_EVERY == 0:
+				self._evict()
+
+	def _evict(self):
+		# вытесняем до 90% бюджета, чтобы не чистить на каждой записи
+		total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM ocr').fetchone()[0]
+		if total <= self.max_bytes: return
+		to_free = total - int(self.max_bytes * 0.9)
+
+		keys, freed = [], 0
+		for key, size in self.conn.execute('SELECT key, size FROM ocr ORDER BY last_used'):
+			keys.append((key,))
+			freed += size
+			if freed >= to_free: break
+		self.conn.executemany('DELETE FROM ocr WHERE key = ?', keys)
+		self.conn.commit()
+		print(f'OcrCache._evict {INFO}: удалено записей {len(keys)} ({freed} байт)')
+
+	def stats(self) -> dict:
+		with self._lock:
+			entries, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr').fetchone()
+		return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+# у каждого процесса (пул разбора файлов) своё соединение с файлом кеша
+_cache = None
+_cache_pid = None
+
+def getOcrCache():
+	'''OcrCache текущего процесса или None, если открыть кеш не получилось'''
+	global _cache, _cache_pid
+	if _cache_pid != os.getpid():
+		_cache_pid = os.getpid()
+		try:
+			_cache = OcrCache()
+		except sqlite3.Error as e:
+			print(f'ocr_cache.getOcrCache {ERROR}: {e}')
+			_cache = None
+	return _cache
@@ -0,0 +1,93 @@
+import numpy as np
+from PIL import Image
+
+from .file_manager_configs import OCR_MIN_SIDE, OCR_MIN_AREA, OCR_EDGE_LEVEL, OCR_MIN_EDGE_DENSITY
+from .file_manager_configs import OCR_TARGET_DPI, OCR_COVERED_MIN_WORDS, OCR_COVERED_RATIO
+
+
+'''
+допуск картинок PDF к OCR
+
+перед ocrEngine каждая картинка проходит проверки (по порядку):
+- skip_covered - текстовый слой страницы уже покрывает картинку (скан с распознанным текстом)
+- skip_small - картинка меньше OCR_MIN_SIDE по стороне или OCR_MIN_AREA по площади (иконки, маркеры списков)
+- skip_edges - мало перепадов яркости (заливки, градиенты, фон): текста там нет
+- downscaled - разрешение на странице выше OCR_TARGET_DPI: картинка уменьшается до него
+- ocr - картинка идёт в OCR как есть
+
+каждое решение - отдельный счётчик в метриках разбора (ocr_stats у результата парсера)
+'''
+
+
+class OcrPolicy:
+	DECISIONS = ('ocr', 'downscaled', 'skip_covered', 'skip_small', 'skip_edges')
+
+	def decide(self, pil_img, image_rect, text_boxes):
+		'''
+		pil_img - картинка, image_rect - (x0, y0, x1, y1) на странице (или None),
+		text_boxes - [(x0, y0, x1, y1), ...] слов текстового слоя страницы.
+		Возвращает (решение, картинка для OCR или None)
+		'''
+		if image_rect is not None and self._coveredByText(image_rect, text_boxes):
+			return 'skip_covered', None
+
+		width, height = pil_img.size
+		if min(width, height) < OCR_MIN_SIDE or width * height < OCR_MIN_AREA:
+			return 'skip_small', None
+
+		if self.edgeDensity(pil_img) < OCR_MIN_EDGE_DENSITY:
+			return 'skip_edges', None
+
+		if image_rect is not None:
+			downscaled = self._downscale(pil_img, image_rect)
+			if downscaled is not None:
+				return 'downscaled', downscaled
+
+		return 'ocr', pil_img
+
+	@staticmethod
+	def edgeDensity(pil_img, max_side=1024) -> float:
+		'''доля пикселей с перепадом яркости больше OCR_EDGE_LEVEL (по уменьшенной копии)'''
+		gray = pil_img.convert('L')
+		if max(gray.size) > max_side:
+			gray.thumbnail((max_side, max_side))
+		pixels = np.asarray(gray, dtype=np.int16)
+		if pixels.shape[0] < 2 or pixels.shape[1] < 2: return 0.0
+
+		diff_x = np.abs(np.diff(pixels, axis=1))[:-1, :]
+		diff_y = np.abs(np.diff(pixels, axis=0))[:, :-1]
+		return float(((diff_x > OCR_EDGE_LEVEL) | (diff_y > OCR_EDGE_LEVEL)).mean())
+
+	@staticmethod
+	def _downscale(pil_img, image_rect):
+		'''уменьшенная до OCR_TARGET_DPI картинка или None, если разрешение и так не выше'''
+		x0, y0, x1, y1 = image_rect
+		if x1 - x0 <= 0 or y1 - y0 <= 0: return None
+
+		# точек на дюйм при показе на странице (1 pt = 1/72 дюйма), по менее плотной оси
+		dpi = min(pil_img.width / ((x1 - x0) / 72), pil_img.height / ((y1 - y0) / 72))
+		if dpi <= OCR_TARGET_DPI: return None
+
+		scale = OCR_TARGET_DPI / dpi
+		size = (max(1, round(pil_img.width * scale)), max(1, round(pil_img.height * scale)))
+		return pil_img.resize(size, Image.LANCZOS)
+
+	@staticmethod
+	def _coveredByText(image_rect, text_boxes) -> bool:
+		'''слова текстового слоя внутри картинки, их охват - не меньше OCR_COVERED_RATIO её площади'''
+		x0, y0, x1, y1 = image_rect
+		area = (x1 - x0) * (y1 - y0)
+		if area <= 0: return False
+
+		inside = [
+			box for box in text_boxes
+			if x0 <= (box[0] + box[2]) / 2 <= x1 and y0 <= (box[1] + box[3]) / 2 <= y1
+		]
+		if len(inside) < OCR_COVERED_MIN_WORDS: return False
+
+		# охват - прямоугольник, описанный вокруг слов
+		covered = (
+			(max(box[2] for box in inside) - min(box[0] for box in inside))
+			* (max(box[3] for box in inside) - min(box[1] for box in inside))
+		)
+		return covered / area >= OCR_COVERED_RATIO
@@ -1,5 +1,8 @@
-import fitz, re
+import os, fitz, re
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from datetime import datetime
 from pathlib import Path
 from PIL import Image, ImageDraw
@@ -10,9 +13,27 @@ from .file_manager_configs import *
 # новые алиасы не переименовывают функции!
 
 from .ocr import process_image as ocr_process_image
+from .ocr_cache import getOcrCache
+from .ocr_policy import OcrPolicy
 from .ocr import download_lang_data as ocr_download
+from .doc_pool import getDocPool
 ocr_download() # сразу предзагрузка
 
+
+@lru_cache(maxsize=4096)
+def _normalizeAbsolute(path: str) -> str:
+	return str(Path(path).resolve()).replace('и\u0306','й').replace('е\u0308','ё')
+
+def normalizePath(path) -> str:
+	'''
+	Абсолютный путь файла + fix макбуковского написания букв ё и й (вот так: ё, й).
+	Абсолютные пути запоминаются: при отрисовке страниц одного файла путь разбирается один раз
+	'''
+	path = str(path)
+	if os.path.isabs(path):
+		return _normalizeAbsolute(path)
+	return str(Path(path).resolve()).replace('и\u0306','й').replace('е\u0308','ё')
+
 '''
 правила нейминга
 
@@ -49,8 +70,9 @@ class BaseParser(ABC):
 	'''
 
 	@classmethod
-	def ocrEngine(cls, image): # image - PIL.Image.Image или путь Path
-		ocr_text, ocr_words = ocr_process_image(image)
+	def ocrEngine(cls, image, image_bytes=None): # image - PIL.Image.Image или путь Path
+		# image_bytes - исходные байты картинки (если есть), по ним ищется результат в кеше OCR
+		ocr_text, ocr_words = cls._ocrCached(image, image_bytes)
 		
 		one_words_page = []
 		for word, coords in ocr_words:
@@ -61,6 +83,26 @@ class BaseParser(ABC):
 		return ocr_text, one_words_page
 	
 	
+	@staticmethod
+	def _ocrCached(image, image_bytes=None):
+		'''ocr_process_image через дисковый кеш (OCR_CACHE), ключ - хеш байтов картинки и OCR_CONFIG'''
+		cache = getOcrCache() if OCR_CACHE else None
+		if cache is None:
+			return ocr_process_image(image)
+
+		if image_bytes is None:
+			if isinstance(image, Image.Image):
+				image_bytes = f'{image.mode}{image.size}'.encode() + image.tobytes()
+			else:
+				image_bytes = Path(image).read_bytes()
+		key = cache.makeKey(image_bytes, OCR_CONFIG)
+
+		result = cache.get(key)
+		if result is None:
+			result = ocr_process_image(image)
+			cache.put(key, result)
+		return result
+
 	@staticmethod
 	def _filenameToDict(path:Path):
 		# fix макбуковского написания буквы ё (вот так: ё) и буквы й (вот так: й)
@@ -172,12 +214,22 @@ class PdfParser(BaseParser):
 	"""docstring for PdfParser
 	
 	run(cls, pdf_path) - метод полностью преобразующий PDF в представление лекции
+	parseRange(cls, pdf_path, start, stop) - разбор куска страниц (для параллельного разбора большого файла)
 	renderToPic(cls, pdf_path, page_num, output_path) - метод рендера одной страницы в картинку с поддержкой выбора режимов (все страницы/одна страница)
 	_extract_image(cls, doc, block) - метод получения глобальных координат изображения
 	_renderToPicServise(cls, page, output_path) - сервисная функция рендера одной страницы в картинку
 	"""
 
-	def run(self, path):
+	def __init__(self, page_workers=PDF_PAGE_WORKERS):
+		self.page_workers = page_workers # процессов для постраничного разбора больших файлов
+		self.ocr_policy = OcrPolicy() if OCR_POLICY else None # какие картинки распознавать
+
+	def run(self, path, workers=None):
+		'''
+		Большой файл (от PDF_PARALLEL_MIN_PAGES страниц) разбирается кусками по PDF_PAGES_PER_TASK страниц
+		в пуле из workers процессов (по умолчанию self.page_workers), каждый кусок открывает свой fitz документ.
+		Страницы собираются обратно по порядку - документ такой же, как при разборе подряд.
+		'''
 		# fix макбуковского написания буквы ё (вот так: ё) и буквы й (вот так: й)
 		pdf_path = Path(
 			str(Path(path).resolve())
@@ -188,10 +240,37 @@ class PdfParser(BaseParser):
 		pdf_path = Path(pdf_path)
 		print(f"{cb('PdfParser.run')}: {pdf_path}")
 
-		RESULT_dict = self.initMetadata(pdf_path) # classmethod можно вызывать и через экземпляр. 🤯
+		ranges = self.pageRanges(pdf_path)
+		workers = min(self.page_workers if workers is None else workers, len(ranges))
+		if workers > 1:
+			print(f"PdfParser.run {INFO}: {pdf_path.name} - {len(ranges)} кусков страниц, процессов - {workers}")
+			# spawn, а не fork: run вызывается и из многопоточного процесса (бот - потоки telebot, пул отрисовки,
+			# мониторы pymongo), а дочерний процесс после fork такого процесса может зависнуть на чужой блокировке
+			with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+				parts = list(pool.map(parsePdfRange, *zip(*[(pdf_path, start, stop) for start, stop in ranges])))
+		else:
+			parts = [self.parseRange(pdf_path, start, stop) for start, stop in ranges]
+
+		return self.assemble(pdf_path, parts)
+
+	def pageRanges(self, path):
+		'''[(start, stop), ...] - куски страниц файла; маленький файл - один кусок'''
+		with fitz.open(str(path)) as doc:
+			len_pages = len(doc)
+		if len_pages < PDF_PARALLEL_MIN_PAGES:
+			return [(0, len_pages)]
+		return [(start, min(start + PDF_PAGES_PER_TASK, len_pages)) for start in range(0, len_pages, PDF_PAGES_PER_TASK)]
+
+	def parseRange(self, path, start, stop):
+		'''Страницы [start, stop) в своём fitz документе -> [(текст страницы, слова страницы, решения OCR), ...]'''
+		with fitz.open(str(path)) as doc: # наш документик
+			xref_memo = {} # xref -> (ocr_text, ocr_words, размер картинки) или None (не распознаётся): повторяющаяся картинка разбирается один раз
+			return [self._parsePage(doc, doc[page_index], xref_memo) for page_index in range(start, stop)]
+
+	def assemble(self, path, parts):
+		'''Сборка документа из кусков parseRange (куски - по порядку страниц)'''
+		RESULT_dict = self.initMetadata(path) # classmethod можно вызывать и через экземпляр. 🤯
 
-		doc = fitz.open(str(pdf_path)) # наш документик
-		
 		all_text = '' # полный сплошной текст с файла
 		all_pages = [] # список страниц со словорями 
 		'''
@@ -206,36 +285,57 @@ class PdfParser(BaseParser):
 			]
 		]
 		'''
+		ocr_stats = {} # решения по картинкам (OcrPolicy.DECISIONS и memo) - метрики разбора, в базу не пишутся
+		for part in parts:
+			for page_text, page_words, page_stats in part:
+				all_text += page_text
+				for decision, count in page_stats.items():
+					ocr_stats[decision] = ocr_stats.get(decision, 0) + count
+				# добавлание одного массива/страницы в общий массив страниц
+				all_pages.append(page_words)
 
-		# глобальная прокрутка ПО СТРАНИЦАМ (итерация = страница)
-		for page_index, page in enumerate(doc):
-			#pp(inspect.getmembers(page, lambda v: not callable(v)))
-			#input("???>")
-			current_page_words = []  # список слов на текущей странице (слово - словарик words coords)
-
-			# ================== ТЕКСТ НА СТРАНИЦЕ ==================
-			# достаём весь текст сплошняком со станицы
-			text_data = page.get_text("text")
-			if text_data: 
-				all_text += str(text_data) + "\n\n"
-
-			# достаём данные о словах со страницы
-			words_data = page.get_text("words")
-			for w in words_data:
-				x0, y0, x1, y1, word = w[0], w[1], w[2], w[3], w[4]
-				current_page_words.append({
-						"word": self.cleanText(word),
-						"coords": ((x0, y0), (x1, y0), (x1, y1), (x0, y1))  # формат с четырьмя точками
-					})
-
-			# ================== ИЗОБРАЖЕНИЯ НА СТРАНИЦЕ ==================
-			images = page.get_images(full=True)  # получаем список всех картинок на странице
-			
-			# print(f"PdfParser.run {INFO}: page_index {page_index}: found {len(images)} images")
-			
-			# Обрабатываем каждое изображение на странице
-			for i in images:
-				xref = i[0]  # XREF для извлечения картинки
+		# формирование результирующего документа
+		RESULT_dict['pages'] = all_pages
+		RESULT_dict['text'] = all_text
+		RESULT_dict['len_pages'] = len(all_pages)
+		RESULT_dict['ocr_stats'] = ocr_stats
+		return RESULT_dict
+
+	def _parsePage(self, doc, page, xref_memo=None):
+		'''Текст и слова одной страницы (вместе с OCR её изображений), xref_memo - общий на документ'''
+		if xref_memo is None: xref_memo = {}
+		#pp(inspect.getmembers(page, lambda v: not callable(v)))
+		#input("???>")
+		page_text = '' # текст страницы (в том виде, в каком он идёт в общий текст файла)
+		current_page_words = []  # список слов на текущей странице (слово - словарик words coords)
+		page_stats = {} # решение по каждой картинке страницы -> сколько раз
+
+		# ================== ТЕКСТ НА СТРАНИЦЕ ==================
+		# достаём весь текст сплошняком со станицы
+		text_data = page.get_text("text")
+		if text_data: 
+			page_text += str(text_data) + "\n\n"
+
+		# достаём данные о словах со страницы
+		words_data = page.get_text("words")
+		for w in words_data:
+			x0, y0, x1, y1, word = w[0], w[1], w[2], w[3], w[4]
+			current_page_words.append({
+					"word": self.cleanText(word),
+					"coords": ((x0, y0), (x1, y0), (x1, y1), (x0, y1))  # формат с четырьмя точками
+				})
+
+		# ================== ИЗОБРАЖЕНИЯ НА СТРАНИЦЕ ==================
+		images = page.get_images(full=True)  # получаем список всех картинок на странице
+		
+		# print(f"PdfParser.run {INFO}: page_index {page_index}: found {len(images)} images")
+		
+		# Обрабатываем каждое изображение на странице
+		for i in images:
+			xref = i[0]  # XREF для извлечения картинки
+			if xref in xref_memo:
+				decision = 'memo'
+			else:
 				base_image = doc.extract_image(xref)  # получаем метаданные картинки
 				image_bytes = base_image["image"] # получаем байты картинки из метаданных
 
@@ -243,71 +343,69 @@ class PdfParser(BaseParser):
 				pil_img = Image.open(BytesIO(image_bytes))
 				# pil_img.show()
 
-				# OCR и добавление результатов
-				ocr_text, ocr_words = self.ocrEngine(pil_img) # list: [full_text:str, [(word: str, coords: tuple), (word: str, coords: tuple), ...]]
-				all_text += ocr_text + "\n\n"
-				
-				# Получаем все рамки (Rect) данного XREF на странице
-				rects = page.get_image_rects(xref)  # возвращает список Rect с координатами
-				#if len(rects) > 1: print(f'\033[91m<ОЧЕНЬ РЕДКАЯ ОШИБКА №412>\033[0m\n{rects=}')
+				decision, ocr_img = 'ocr', pil_img
+				if self.ocr_policy:
+					rects = page.get_image_rects(xref)
+					text_boxes = [w[:4] for w in words_data]
+					decision, ocr_img = self.ocr_policy.decide(pil_img, tuple(rects[0]) if rects else None, text_boxes)
 
-				if rects:
-					pic_box = (rects[0].x0, rects[0].y0, rects[0].x1, rects[0].y1)
+				if ocr_img is None:
+					# покрытие текстом зависит от страницы - такое решение не запоминается
+					if decision != 'skip_covered': xref_memo[xref] = None
 				else:
-					continue
-				
-				''' вроде ненужный кусок кода
-				if len(rects) > 1:
-					print(f"PdfParser.run {INFO}: найдено более одного изображения для xref={xref}")
-					for rect in rects:
-						print(f"координаты верхнего-левого ({rect.x0:.2f}, {rect.y0:.2f}), "
-						  f"нижнего-правого ({rect.x1:.2f}, {rect.y1:.2f})")
-				'''
-				
-				# Перевод координат и добавление слов (не добавление в конец, а конкотенация двух списков на равных условиях)
-				current_page_words += self._convert_coords_from_image(
-							ocr_words, # list: [(word: str, coords: tuple), (word: str, coords: tuple), ...]
-							pic_box,   # tuple: (x0, y0, x1, y1)
-							pil_img    # PIL.Image
-						)
-
-
-			# добавлание одного массива/страницы в общий массив страниц
-			all_pages.append(current_page_words)
-			'''
-			"pages": [
-				[
-					{"word": "я", "coords": [[269, 127], [368, 127], [368, 142], [269, 142]]},
-					{"word": "тим", "coords": [[382, 127], [530, 127], [530, 146], [382, 146]]}
-				],
-				[
-					{"word": "мотоцикл", "coords": [[545, 122], [626, 122], [626, 146], [545, 146]]},
-					{"word": "едет", "coords": [[545, 122], [626, 122], [626, 146], [545, 146]]}
-				]
-			]
+					# уменьшенная картинка - свой ключ кеша (координаты слов в её пикселях)
+					if ocr_img is not pil_img: image_bytes += f'@{ocr_img.size}'.encode()
+					# OCR (через кеш по байтам картинки)
+					ocr_text, ocr_words = self.ocrEngine(ocr_img, image_bytes) # list: [full_text:str, [(word: str, coords: tuple), (word: str, coords: tuple), ...]]
+					xref_memo[xref] = (ocr_text, ocr_words, ocr_img.size)
+			page_stats[decision] = page_stats.get(decision, 0) + 1
+
+			if xref_memo.get(xref) is None: continue
+			ocr_text, ocr_words, image_size = xref_memo[xref]
+			page_text += ocr_text + "\n\n"
+			
+			# Получаем все рамки (Rect) данного XREF на странице
+			rects = page.get_image_rects(xref)  # возвращает список Rect с координатами
+			#if len(rects) > 1: print(f'\033[91m<ОЧЕНЬ РЕДКАЯ ОШИБКА №412>\033[0m\n{rects=}')
+
+			if rects:
+				pic_box = (rects[0].x0, rects[0].y0, rects[0].x1, rects[0].y1)
+			else:
+				continue
+			
+			''' вроде ненужный кусок кода
+			if len(rects) > 1:
+				print(f"PdfParser.run {INFO}: найдено более одного изображения для xref={xref}")
+				for rect in rects:
+					print(f"координаты верхнего-левого ({rect.x0:.2f}, {rect.y0:.2f}), "
+					  f"нижнего-правого ({rect.x1:.2f}, {rect.y1:.2f})")
 			'''
-		
-		# формирование результирующего документа
-		RESULT_dict['pages'] = all_pages
-		RESULT_dict['text'] = all_text
-		RESULT_dict['len_pages'] = len(doc)
-		return RESULT_dict
+			
+			# Перевод координат и добавление слов (не добавление в конец, а конкотенация двух списков на равных условиях)
+			current_page_words += self._convert_coords_from_image(
+						ocr_words, # list: [(word: str, coords: tuple), (word: str, coords: tuple), ...]
+						pic_box,   # tuple: (x0, y0, x1, y1)
+						image_size # tuple: (width, height) картинки
+					)
+
+		return page_text, current_page_words, page_stats
 
-	def _convert_coords_from_image(self, ocr_words, pic_box, pil_image):
+	def _convert_coords_from_image(self, ocr_words, pic_box, image_size):
 		"""
 		Математические преобразования координат слов из изображения в глобальные координаты.
 		Теперь local_coords — это ((x0, y0), (x1, y0), (x1, y1), (x0, y1)).
 		ВСЕГДА четырёхточенчный формат
 		"""
-		# print(f"PdfParser._convert_coords_from_image: {INFO}: {len(ocr_words)=} {pic_box=} {pil_image=}")
+		# print(f"PdfParser._convert_coords_from_image: {INFO}: {len(ocr_words)=} {pic_box=} {image_size=}")
 		res_pages_list = [] # список слов с глобальными координатами
 
 		# Распаковываем координаты изображения (pic_box — это (x0_page, y0_page, x1_page, y1_page))
 		x0_page, y0_page, x1_page, y1_page = pic_box
 		
 		# коэффициенты для перевода локальных координат изображения в глобальные
-		factor_x = (x1_page - x0_page) / pil_image.width
-		factor_y = (y1_page - y0_page) / pil_image.height
+		width, height = image_size
+		factor_x = (x1_page - x0_page) / width
+		factor_y = (y1_page - y0_page) / height
 
 		# перевод координат слов из изображения в глобальные
 		for word_dict in ocr_words: 
@@ -339,6 +437,17 @@ class PdfParser(BaseParser):
 			#print(f"PdfParser._renderToPicServise {OK} to {output_path.relative_to(Path.cwd())}")
 			pass
 	
+	def renderPixmap(self, path, page_index, zoom=1.0):
+		'''Страница в памяти (fitz.Pixmap, RGB), без записи на диск. None - страница не отрисована'''
+		file_path = normalizePath(path)
+		try:
+			# документ остаётся открытым в пуле, пиксели принадлежат самому пиксмапу
+			with getDocPool().document(file_path) as doc:
+				return doc[page_index].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+		except Exception as e:
+			print(f"PdfParser.renderPixmap {ERROR}: <{file_path}> [{page_index}]\n{e}")
+			return None
+
 	def renderToPic(self, path, page_index=None, output_path=None, zoom=1.0):
 		'''docstring for PdfParser.renderToPic
 		работает в двух режимах:
@@ -354,11 +463,7 @@ class PdfParser(BaseParser):
 			output_path - путь к выходному файлу
 		'''
 		# fix макбуковского написания буквы ё (вот так: ё) и буквы й (вот так: й)
-		file_path = Path(
-			str(Path(path).resolve())
-				.replace('и\u0306','й')
-				.replace('е\u0308','ё')
-		)
+		file_path = Path(normalizePath(path))
 
 		# Если путь к выходному файлу не указан, выбираем его по умолчанию 
 		if not output_path:
@@ -369,34 +474,38 @@ class PdfParser(BaseParser):
 		else:
 			output_path = Path(output_path)
 		
-		# наш документик
-		doc = fitz.open(str(file_path))
-
-		if page_index is not None: # если страница указана (если page_index != None)
-			if output_path.is_dir():
-				print(f"PdfParser.renderToPic {ERROR}: ошибка пути <{file_path}> путь ЯВЛЯЕТСЯ ДИРРЕКТОРИЕЙ (ожидался путь к выходному файлу)")
-				output_path = output_path / f"img{page_index}.png"
+		# наш документик (открытый в пуле, закрывается при вытеснении)
+		with getDocPool().document(file_path) as doc:
+			if page_index is not None: # если страница указана (если page_index != None)
+				if output_path.is_dir():
+					print(f"PdfParser.renderToPic {ERROR}: ошибка пути <{file_path}> путь ЯВЛЯЕТСЯ ДИРРЕКТОРИЕЙ (ожидался путь к выходному файлу)")
+					output_path = output_path / f"img{page_index}.png"
 			
-			output_path.parent.mkdir(parents=True, exist_ok=True)
+				output_path.parent.mkdir(parents=True, exist_ok=True)
 
-			page = doc[page_index]
-			self._renderToPicServise(page, output_path, file_path, zoom)
+				page = doc[page_index]
+				self._renderToPicServise(page, output_path, file_path, zoom)
 
-		else: # если страница НЕ указана (нужен весь документ)
-			if output_path.is_file(): 
-				raise Exception(f"PdfParser.renderToPic {ERROR}: ошибка пути: <{file_path}> путь ЯВЛЯЕТСЯ ФАЙЛОМ (ожидался путь к желаемой папке)")
+			else: # если страница НЕ указана (нужен весь документ)
+				if output_path.is_file(): 
+					raise Exception(f"PdfParser.renderToPic {ERROR}: ошибка пути: <{file_path}> путь ЯВЛЯЕТСЯ ФАЙЛОМ (ожидался путь к желаемой папке)")
 			
-			output_path.mkdir(parents=True, exist_ok=True)
+				output_path.mkdir(parents=True, exist_ok=True)
 
-			for idx, page in enumerate(doc):
-				img_path = output_path / f'img{idx}.png'
-				self._renderToPicServise(page, img_path, file_path, zoom)
+				for idx, page in enumerate(doc):
+					img_path = output_path / f'img{idx}.png'
+					self._renderToPicServise(page, img_path, file_path, zoom)
 		
 		print(f"PdfParser.renderToPic: {OK} {file_path.name} [{page_index}] -> {output_path.name}")
 		return output_path
 
 
 
+def parsePdfRange(path, start, stop):
+	'''Кусок страниц PDF в процессе пула (PdfParser.run, FileManager.runPath)'''
+	return PdfParser(page_workers=1).parseRange(path, start, stop)
+
+
 # TODO: надо бы сдеалать..
 class PptxParser(BaseParser):
 	pass
@@ -0,0 +1,147 @@
+import os, sqlite3, time, hashlib, threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from .file_manager_configs import ERROR, OK, INFO
+from .file_manager_configs import RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES
+
+
+'''
+общий кеш отрисованных страниц (FileManager.renderCached)
+
+ключ - sha256(хеш содержимого файла, номер страницы, zoom): страница одной и той же лекции
+рисуется один раз для всех пользователей и отчётов, файл под другим именем или путём - тот же ключ,
+поменялось содержимое - другой ключ (старые картинки вытеснятся сами).
+
+картинки лежат файлами <ключ>.png в RENDER_CACHE_DIR, учёт (размер, last_used) - в sqlite там же.
+размер ограничен RENDER_CACHE_MAX_BYTES: после записи, если бюджет превышен, удаляются
+давно не использованные картинки (LRU) до 90% бюджета.
+обводка найденного в кеш не попадает - рисуется поверх картинки из кеша при отправке.
+страница, отрисованная в память для отправки (FileManager.renderPage), пишется в кеш в фоне
+(putAsync), пока запись не закончилась - отдаётся из памяти (getPending).
+'''
+
+
+class RenderCache:
+	def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+		self.dir = Path(cache_dir)
+		self.max_bytes = max_bytes
+		self.dir.mkdir(parents=True, exist_ok=True)
+
+		self.conn = sqlite3.connect(self.dir / 'index.db', timeout=30, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self._pending = {} # ключ -> PIL-картинка, которая ещё пишется в кеш
+		self._writer = None # поток фоновой записи (putAsync), запускается при первой записи
+		self._init_db()
+
+	def _init_db(self):
+		self.conn.execute('''
+		CREATE TABLE IF NOT EXISTS renders (
+			key TEXT PRIMARY KEY,
+			size INTEGER,
+			last_used REAL
+		)''')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS renders_last_used ON renders(last_used)')
+		self.conn.commit()
+
+	@staticmethod
+	def makeKey(doc_hash: str, page_index: int, zoom: float) -> str:
+		return hashlib.sha256(f'{doc_hash}:{page_index}:{float(zoom)!r}'.encode()).hexdigest()
+
+	def _path(self, key) -> Path:
+		return self.dir / f'{key}.png'
+
+	def get(self, key):
+		'''путь к картинке страницы или None'''
+		path = self._path(key)
+		with self._lock:
+			row = self.conn.execute('SELECT 1 FROM renders WHERE key = ?', (key,)).fetchone()
+			if not row or not path.exists():
+				if row: # картинку удалили руками - забываем запись
+					self.conn.execute('DELETE FROM renders WHERE key = ?', (key,))
+					self.conn.commit()
+				self.misses += 1
+				return None
+			self.conn.execute('UPDATE renders SET last_used = ? WHERE key = ?', (time.time(), key))
+			self.conn.commit()
+			self.hits += 1
+		return path
+
+	def tempPath(self, key) -> Path:
+		'''куда рисовать страницу перед put (в той же директории - put переносит файл без копирования)'''
+		return self.dir / f'{key}.{os.getpid()}.{threading.get_ident()}.tmp.png'
+
+	def put(self, key, image_path) -> Path:
+		'''Переносит отрисованную картинку image_path в кеш, возвращает её путь в кеше'''
+		path = self._path(key)
+		os.replace(image_path, path)
+		with self._lock:
+			self.conn.execute('''
+				INSERT INTO renders(key, size, last_used)
+				VALUES(?, ?, ?)
+				ON CONFLICT(key) DO UPDATE
+				  SET size = excluded.size, last_used = excluded.last_used
+				''',
+				(key, path.stat().st_size, time.time())
+			)
+			self.conn.commit()
+			self._evict(keep=key)
+		return path
+
+	def putImage(self, key, img) -> Path:
+		'''Пишет PIL-картинку в кеш, возвращает её путь в кеше'''
+		temp_path = self.tempPath(key)
+		img.save(temp_path, format='PNG')
+		return self.put(key, temp_path)
+
+	def putAsync(self, key, img):
+		'''putImage в фоновом потоке: img не должна меняться после вызова'''
+		with self._lock:
+			if key in self._pending: return
+			self._pending[key] = img
+			if self._writer is None:
+				self._writer = ThreadPoolExecutor(max_workers=1)
+		self._writer.submit(self._writeJob, key, img)
+
+	def _writeJob(self, key, img):
+		try:
+			self.putImage(key, img)
+		except Exception as e:
+			print(f'RenderCache._writeJob {ERROR}: {key}\n{e}')
+		finally:
+			with self._lock:
+				self._pending.pop(key, None)
+
+	def getPending(self, key):
+		'''PIL-картинка, которая ещё пишется в кеш, или None'''
+		with self._lock:
+			return self._pending.get(key)
+
+	def _evict(self, keep=None):
+		# вытесняем до 90% бюджета, чтобы не чистить на каждой записи
+		total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM renders').fetchone()[0]
+		if total <= self.max_bytes: return
+		to_free = total - int(self.max_bytes * 0.9)
+
+		keys, freed = [], 0
+		for key, size in self.conn.execute('SELECT key, size FROM renders ORDER BY last_used'):
+			if key == keep: continue # только что записанная картинка сейчас будет отправлена
+			keys.append((key,))
+			freed += size
+			if freed >= to_free: break
+		for (key,) in keys:
+			try:
+				self._path(key).unlink()
+			except FileNotFoundError:
+				pass
+		self.conn.executemany('DELETE FROM renders WHERE key = ?', keys)
+		self.conn.commit()
+		print(f'RenderCache._evict {INFO}: удалено картинок {len(keys)} ({freed} байт)')
+
+	def stats(self) -> dict:
+		with self._lock:
+			entries, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM renders').fetchone()
+		return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
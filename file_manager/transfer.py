@@ -1,10 +1,18 @@
+import os, io, hashlib, threading
 from pathlib import Path
 from PIL import Image, ImageDraw
 from pprint import pprint as pp
 from math import sqrt
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from .parsers import PdfParser, ImgParser
-from .file_manager_configs import ERROR, OK, INFO, OUTLINE_FACTOR, OUTLINE_COLOR, cb
+from .parsers import PdfParser, ImgParser, parsePdfRange, normalizePath
+from .ocr import getOcrBackend
+from .watcher import DirectoryWatcher
+from .ingest_queue import IngestQueue, queuePath
+from .render_cache import RenderCache
+from .file_manager_configs import ERROR, OK, INFO, OUTLINE_FACTOR, OUTLINE_COLOR, HIGHLIGHT_MERGE_GAP, cb
+from .file_manager_configs import INGEST_WORKERS, INGEST_BATCH, WATCH_WORKERS, INGEST_QUEUE, RENDER_CACHE_WRITE
 
 
 '''
@@ -28,11 +36,56 @@ from .file_manager_configs import ERROR, OK, INFO, OUTLINE_FACTOR, OUTLINE_COLOR
 <class_name>.<method_name> <INFO/OK/ERROR>: <message> # любое другое сообщение
 '''
 
+def _makeParsers():
+	# {'.pdf',	'.docx', '.pptx',	  '.ppt', '.pages'}
+	return {
+		'.pdf': PdfParser(),
+		'.png': ImgParser(),
+		'.jpg': ImgParser(),
+		'.jpeg': ImgParser(),
+		'.bmp': ImgParser()
+	}
+
+
+def _parseFile(parsers, file):
+	'''(файл, документ или None, текст ошибки или None) - исключение парсера не роняет весь обход'''
+	try:
+		return file, parsers[file.suffix].run(file), None
+	except Exception as e:
+		return file, None, f'{type(e).__name__}: {e}'
+
+
+# парсеры процесса пула (создаются один раз на процесс в _initIngestWorker)
+_worker_parsers = None
+
+def _initIngestWorker():
+	global _worker_parsers
+	# tesseract внутри процесса пула - в один поток, параллельность даёт сам пул
+	os.environ['OMP_THREAD_LIMIT'] = '1'
+	_worker_parsers = _makeParsers()
+	# большие PDF пул делит на куски страниц сам (_parseFiles) - своих пулов внутри процессов не нужно
+	_worker_parsers['.pdf'].page_workers = 1
+	# движок OCR грузит языки один раз на процесс, а не на каждую картинку
+	try:
+		getOcrBackend().warmUp()
+	except Exception as e:
+		print(f'transfer._initIngestWorker {ERROR}: OCR движок не загружен: {e}')
+
+def _parseFileWorker(file):
+	return _parseFile(_worker_parsers, file)
+
+
 class FileManager():
 	"""
 	- run a file: result = FileManager.runFile(file_path)
 	- process a directory: FileManager.runPath(directory_path)
+	- process a directory in N processes: FileManager.runPath(directory_path, workers=N)
+	- sync a directory with the database (only new/changed/removed files): FileManager.syncPath(directory_path)
+	- keep a directory in sync while it changes: FileManager.watchPath(directory_path)
 	- render a page to image: image = FileManager.renderToPic(file_path, page_index, output_path)
+	- render a page through the shared cache: image_path = FileManager.renderCached(file_path, page_index)
+	- render a page for sending, without touching the disk on a cache miss: page = FileManager.renderPage(file_path, page_index)
+	- highlight all found words on a rendered page at once: png_bytes = FileManager.highlightPage(image_or_pixmap, hit["coords"], hit_size=hit["hit_size"])
 	- draw a rectangle on image: FileManager.drawRectangle(image_path, coords, output_path, color)
 	"""
 	def __init__(self, database = None):
@@ -40,14 +93,12 @@ class FileManager():
 		self.workDir = Path.cwd() # дирректория в которой был инициализирован этот объект
 		self.database = database
 		
-		# {'.pdf',	'.docx', '.pptx',	  '.ppt', '.pages'}
-		self.parsers = {
-			'.pdf': PdfParser(),
-			'.png': ImgParser(),
-			'.jpg': ImgParser(),
-			'.jpeg': ImgParser(),
-			'.bmp': ImgParser()
-		}
+		self.parsers = _makeParsers()
+		self.ingest_metrics = {} # счётчики последней индексации (runFile/runPath): файлы и решения OCR ("ocr.<решение>")
+		self.queue = None # очередь заданий индексации (IngestQueue), открывается при первой индексации с базой
+		self.render_cache = None # кеш отрисованных страниц (RenderCache), открывается при первой отрисовке
+		self._doc_hashes = {} # (путь, size, mtime) -> хеш содержимого файла (ключ кеша страниц)
+		self._render_lock = threading.Lock()
 	
 	def runFile(self, path):
 		print(f'{cb('FileManager.runFile')}: "{path}"')
@@ -73,6 +124,8 @@ class FileManager():
 		
 		result = parser.run(file_path)
 		#print(f"{parser.__class__.__name__}")
+		self.ingest_metrics = {}
+		self._countMetrics(result)
 
 		if not result:
 			print(f'FileManager.runFile {ERROR}: "{file_path.name}" ({result=})')
@@ -84,7 +137,13 @@ class FileManager():
 			self.database(result) # создаёт документ в базе
 		return result
 
-	def runPath(self, path):
+	def runPath(self, path, workers=INGEST_WORKERS):
+		'''
+		Обрабатывает все поддерживаемые файлы директории (рекурсивно).
+		workers > 1 - файлы разбираются в пуле процессов (OCR упирается в процессор),
+		разобранные документы возвращаются в текущий процесс - единственный писатель в базу,
+		который пишет их пачками по INGEST_BATCH.
+		'''
 		print(f'FileManager.runPath: {path}')
 		directory = Path(
 			str(Path(path).resolve())
@@ -102,57 +161,394 @@ class FileManager():
 		elif not self.database:
 			print(f"FileManager.runPath {INFO}: Не привязана база данных!!!")
 
-		current_extensions = set()
-		# цикл по всем ФАЙЛАМ в директории с формированием МНОЖЕСТВА типов файлов
-		for file in directory.iterdir():
-			if file.is_file() and not file.name.startswith('.'):
-				current_extensions.add(file.suffix)
-		extentions = self.parsers.keys() & current_extensions
-		
-		print(f'FileManager.runPath {INFO}: Найденые в папке типы - <{current_extensions}>')
-		print(f'FileManager.runPath {INFO}: Из них обрабатываемые типы - <{extentions}>')		
+		files = self._listFiles(directory)
+		workers = max(1, min(workers or 1, len(files)))
+		print(f'FileManager.runPath {INFO}: файлов - {len(files)}, процессов разбора - {workers}')
 		
-		okay_counter = 0
-		errors_counter = 0
-		#pattern = '*.{' + ','.join(extentions).replace('.', '') + '}'  # формирование шаблона из доступных расширений
-		#print(pattern)
-		#print(list(directory.rglob(pattern)))
-
-		# цикл обработки файлов
-		for ext in extentions:
-			pattern = '*' + ext
-
-			for file in directory.rglob(pattern):
-				parser = self.parsers[file.suffix]
-				result = parser.run(file)
-				
-				if result:
-					print(f'FileManager.runPath {OK}: {file.name}')
-					okay_counter += 1
-				else:
-					print(f'FileManager.runPath {ERROR}: {file.name} ({result=})')
-					errors_counter += 1
-				
-				if self.database:
-					self.database(result) # создаёт документ в базе
-				else:
-					print(f'FileManager.runPath {ERROR}: {file.name} ({result=})')
-				
-				# сброс на всякий случай
-				result = None
+		self.ingest_metrics = {}
+		queue = self._ingestQueue()
+		if queue is not None:
+			# через очередь: после падения повторный runPath доделывает только невыполненные файлы
+			queue.enqueue([(file, file.stat().st_size, file.stat().st_mtime, None) for file in files], 'insert')
+			okay_counter, error_files = self._drainQueue(queue, directory, workers)
+		else:
+			okay_counter, error_files = self._insertFiles(files, workers)
 
+		errors_counter = len(error_files)
 		if errors_counter:
 			print(f'FileManager.runPath {INFO}: <{okay_counter}/\033[91m{errors_counter}\033[0m> <успешных/\033[91mошибочных\033[0m> файлов')
+			print(f'FileManager.runPath {INFO}: ошибочные файлы:\n' + '\n'.join(f' * {name}' for name in error_files))
 		else:
 			print(f'FileManager.runPath {INFO}: <{okay_counter}> <успешных> файлов')
+		self.ingest_metrics.update({"files_ok": okay_counter, "files_failed": errors_counter})
+		print(f'FileManager.runPath {INFO}: метрики - {self.ingest_metrics}')
 
+	def _insertFiles(self, files, workers):
+		'''Разбор файлов и запись пачками без очереди -> (успешных, [ошибочные файлы])'''
+		okay_counter = 0
+		error_files = []
+		batch = [] # разобранные, но ещё не записанные документы: (file, result)
 
-	def renderToPic(self, path, page_index = None, output_path = None, zoom=1.0):
-		file_path = Path(
+		def flush():
+			nonlocal okay_counter
+			for file, doc_id in self._writeBatch(batch):
+				if doc_id:
+					okay_counter += 1
+				else:
+					print(f'FileManager._insertFiles {ERROR}: {file.name} - не записан в базу')
+					error_files.append(file.name)
+			batch.clear()
+
+		# цикл обработки файлов (в порядке готовности)
+		for file, result, error in self._parseFiles(files, workers):
+			if not result:
+				print(f'FileManager._insertFiles {ERROR}: {file.name} ({error or f"{result=}"})')
+				error_files.append(file.name)
+				continue
+
+			print(f'FileManager._insertFiles {OK}: {file.name}')
+			self._countMetrics(result)
+			batch.append((file, result))
+			if len(batch) >= INGEST_BATCH:
+				flush()
+		flush()
+		return okay_counter, error_files
+
+	def _ingestQueue(self):
+		'''Очередь заданий (INGEST_QUEUE) привязанной базы/коллекции или None - без базы или если очередь выключена'''
+		if not (INGEST_QUEUE and self.database): return None
+		db_path = queuePath(f'{self.database.db.name}.{self.database.collection.name}')
+		if self.queue is None or self.queue.db_path != db_path:
+			self.queue = IngestQueue(db_path)
+		return self.queue
+
+	def _drainQueue(self, queue, directory, workers, pool=None):
+		'''
+		Выполняет задания очереди внутри directory (в том числе оставшиеся от упавшего запуска),
+		пока они не кончатся -> (успешных, [окончательно ошибочные файлы]).
+		Неудачная попытка возвращает задание в очередь (до INGEST_MAX_ATTEMPTS).
+		Новые файлы ('insert') пишутся пачками; 'sync' и задания, уже доходившие до записи (checkpoint),
+		- заменой документа по пути, так что запись, не отмеченная в очереди из-за падения, не даёт дубликата.
+		Когда задания кончились, выполненные удаляются из очереди (нужны только для продолжения после падения).
+		'''
+		prefix = str(directory).rstrip(os.sep) + os.sep
+		okay_counter = 0
+		error_files = []
+		batch = [] # (file, result, job) разобранных, но ещё не записанных
+
+		def failed(file, error):
+			if queue.fail(file, error):
+				print(f'FileManager._drainQueue {ERROR}: {file.name} - попытки кончились ({error})')
+				error_files.append(file.name)
+			else:
+				print(f'FileManager._drainQueue {INFO}: {file.name} - будет повторён ({error})')
+
+		def flush():
+			nonlocal okay_counter
+			inserts, syncs = [], []
+			for file, result, job in batch:
+				if job["mode"] == 'insert' and job["checkpoint"] is None:
+					inserts.append((file, result))
+				else:
+					syncs.append((file, result, job))
+			written = [(file, doc_id, None) for file, doc_id in self._writeBatch(inserts)]
+			if syncs:
+				synced = self.database.syncMany(
+					[(result, job["size"], job["mtime"], job["hash"] or self.fileHash(file)) for file, result, job in syncs]
+				)
+				written += [(file, doc_id, error) for (file, _, _), (doc_id, error) in zip(syncs, synced)]
+			for file, doc_id, error in written:
+				if doc_id:
+					queue.complete(file, doc_id)
+					okay_counter += 1
+				else:
+					failed(file, f'не записан в базу ({error})' if error else 'не записан в базу')
+			batch.clear()
+
+		own_pool = None
+		if pool is None and workers > 1:
+			pool = own_pool = ProcessPoolExecutor(max_workers=workers, initializer=_initIngestWorker)
+		try:
+			# аренда продлевается по таймеру, а не по готовым файлам: один файл может разбираться дольше аренды
+			with queue.keepAlive():
+				while jobs := queue.claim(prefix, limit=max(INGEST_BATCH, workers * 2)):
+					jobs = {Path(job["path"]): job for job in jobs}
+					for file, result, error in self._parseFiles(list(jobs), workers, pool):
+						if not result:
+							failed(file, error or f'{result=}')
+							continue
+
+						self._countMetrics(result)
+						queue.checkpoint(file, 'parsed')
+						batch.append((file, result, jobs[file]))
+						if len(batch) >= INGEST_BATCH:
+							flush()
+					flush()
+			queue.clear(prefix)
+		except BaseException:
+			# Ctrl+C и прочее: взятые задания - обратно в очередь, следующий запуск их доделает
+			queue.release()
+			raise
+		finally:
+			if own_pool is not None:
+				own_pool.shutdown(cancel_futures=True)
+		return okay_counter, error_files
+
+	def syncPath(self, path, workers=INGEST_WORKERS):
+		'''
+		Инкрементальная синхронизация директории с базой по манифесту (DataBase.manifestEntries):
+		не изменившиеся файлы пропускаются (размер и mtime, при их изменении - hash содержимого),
+		изменённые разбираются и заменяют свой документ, документы исчезнувших файлов удаляются.
+		Можно запускать сколько угодно раз - дубликатов не будет.
+		'''
+		print(f'FileManager.syncPath: {path}')
+		directory = Path(
 			str(Path(path).resolve())
 				.replace('и\u0306','й')
 				.replace('е\u0308','ё')
 		)
+
+		if not directory.is_dir():
+			print(f"FileManager.syncPath {ERROR}: {directory} - НЕ дирректория!")
+			return
+		elif not self.database:
+			print(f"FileManager.syncPath {ERROR}: Не привязана база данных!!!")
+			return
+
+		manifest = self.database.manifestEntries(directory)
+		changed, unchanged_counter = self._changedFiles(self._listFiles(directory), manifest)
+
+		# оставшиеся записи манифеста - файлы, которых больше нет
+		for doc_path in manifest:
+			self.database.dropSynced(doc_path)
+
+		self.ingest_metrics = {}
+		workers = max(1, min(workers or 1, len(changed)))
+		print(f'FileManager.syncPath {INFO}: без изменений - {unchanged_counter}, новых/изменённых - {len(changed)}, удалённых - {len(manifest)}, процессов разбора - {workers}')
+
+		queue = self._ingestQueue()
+		if queue is not None:
+			queue.enqueue([(file, *signature) for file, signature in changed.items()], 'sync')
+			okay_counter, error_files = self._drainQueue(queue, directory, workers)
+		else:
+			okay_counter, error_files = self._syncChanged(changed, workers)
+
+		if error_files:
+			print(f'FileManager.syncPath {INFO}: ошибочные файлы (будут разобраны при следующей синхронизации):\n' + '\n'.join(f' * {name}' for name in error_files))
+		self.ingest_metrics.update({
+			"files_ok": okay_counter, "files_failed": len(error_files),
+			"files_unchanged": unchanged_counter, "files_removed": len(manifest)
+		})
+		print(f'FileManager.syncPath {INFO}: метрики - {self.ingest_metrics}')
+
+	def watchPath(self, path, workers=WATCH_WORKERS, stop_event=None):
+		'''
+		Следит за директорией (inotify или обход, watcher.py) и сразу синхронизирует
+		новые, изменённые и удалённые файлы. Сначала - обычный syncPath, чтобы догнать изменения,
+		случившиеся без слежения. Работает до stop_event.set() или Ctrl+C.
+		'''
+		directory = Path(
+			str(Path(path).resolve())
+				.replace('и\u0306','й')
+				.replace('е\u0308','ё')
+		)
+		if not directory.is_dir():
+			print(f"FileManager.watchPath {ERROR}: {directory} - НЕ дирректория!")
+			return
+		elif not self.database:
+			print(f"FileManager.watchPath {ERROR}: Не привязана база данных!!!")
+			return
+
+		watcher = DirectoryWatcher(self, directory, max(1, workers or 1), _initIngestWorker)
+		self.syncPath(directory, workers)
+		watcher.run(stop_event)
+
+	def _changedFiles(self, files, manifest):
+		'''
+		Новые и изменённые файлы -> ({file: (size, mtime, hash)}, число не изменившихся).
+		Записи манифеста просмотренных файлов забираются из manifest ({path: запись}).
+		'''
+		changed = {} # file -> (size, mtime, hash) на момент проверки
+		unchanged_counter = 0
+		for file in files:
+			stat = file.stat()
+			entry = manifest.pop(self._docPath(file), None)
+			if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+				unchanged_counter += 1
+				continue
+
+			digest = self.fileHash(file)
+			if entry and entry["hash"] == digest:
+				# содержимое то же (файл тронули или скопировали поверх) - только новые size/mtime
+				self.database.manifestPut(entry["_id"], stat.st_size, stat.st_mtime, digest, entry["doc_id"])
+				unchanged_counter += 1
+				continue
+			changed[file] = (stat.st_size, stat.st_mtime, digest)
+		return changed, unchanged_counter
+
+	def _syncChanged(self, changed, workers, pool=None):
+		'''Разбор и замена документов изменённых файлов ({file: (size, mtime, hash)}) -> (успешных, [ошибочные файлы])'''
+		okay_counter = 0
+		error_files = []
+		batch = [] # (file, result)
+
+		def flush():
+			nonlocal okay_counter
+			written = self.database.syncMany([(result, *changed[file]) for file, result in batch])
+			for (file, _), (doc_id, error) in zip(batch, written):
+				if doc_id:
+					print(f'FileManager._syncChanged {OK}: {file.name}')
+					okay_counter += 1
+				else:
+					print(f'FileManager._syncChanged {ERROR}: {file.name} - не записан в базу ({error})')
+					error_files.append(file.name)
+			batch.clear()
+
+		for file, result, error in self._parseFiles(list(changed), workers, pool):
+			if not result:
+				print(f'FileManager._syncChanged {ERROR}: {file.name} ({error or f"{result=}"})')
+				error_files.append(file.name)
+				continue
+
+			self._countMetrics(result)
+			batch.append((file, result))
+			if len(batch) >= INGEST_BATCH:
+				flush()
+		flush()
+		return okay_counter, error_files
+
+	def _listFiles(self, directory):
+		'''
+		Все поддерживаемые файлы директории (рекурсивно, по всем типам self.parsers).
+		Полнота важна: syncPath удаляет документы файлов, которых нет в списке.
+		'''
+		files = []
+		current_extensions = set()
+		for dir_path, _, names in os.walk(directory):
+			for name in names:
+				if name.startswith(('.', '~$')): continue # скрытые и временные файлы
+				suffix = Path(name).suffix
+				current_extensions.add(suffix)
+				if suffix in self.parsers:
+					files.append(Path(dir_path) / name)
+		extentions = self.parsers.keys() & current_extensions
+
+		print(f'FileManager._listFiles {INFO}: Найденые в папке типы - <{current_extensions}>')
+		print(f'FileManager._listFiles {INFO}: Из них обрабатываемые типы - <{extentions}>')
+
+		return files
+
+	@staticmethod
+	def _docPath(file):
+		'''путь файла в том виде, в каком он хранится в документе (поле path, BaseParser.initMetadata)'''
+		return normalizePath(file)
+
+	@staticmethod
+	def fileHash(file, chunk_size=1024 * 1024):
+		'''sha256 содержимого файла (читается кусками)'''
+		digest = hashlib.sha256()
+		with open(file, 'rb') as f:
+			while chunk := f.read(chunk_size):
+				digest.update(chunk)
+		return digest.hexdigest()
+
+	def _parseFiles(self, files, workers, pool=None):
+		'''
+		Генератор (file, result, error) по мере готовности файлов.
+		Большие PDF в пуле делятся на куски страниц (PdfParser.pageRanges) - задачи того же пула,
+		так что один толстый файл не остаётся последним и разбирается на всех процессах.
+		pool - уже запущенный пул (с _initIngestWorker), иначе создаётся свой на workers процессов.
+		'''
+		if pool is not None:
+			yield from self._parseInPool(files, pool, max(1, workers or 1) * 2)
+			return
+
+		if workers == 1:
+			for file in files:
+				yield _parseFile(self.parsers, file)
+			return
+
+		with ProcessPoolExecutor(max_workers=workers, initializer=_initIngestWorker) as pool:
+			yield from self._parseInPool(files, pool, workers * 2)
+
+	def _parseInPool(self, files, pool, in_flight):
+		'''
+		Задачи отправляются в пул по мере готовности предыдущих - не больше in_flight одновременно,
+		так что в памяти лежат только документы, ещё не отданные писателю (а не весь корпус).
+		'''
+		parts = {} # file -> куски страниц по порядку (None - ещё не готов)
+
+		def tasks():
+			for file in files:
+				ranges = self._pageRanges(file)
+				if len(ranges) > 1:
+					parts[file] = [None] * len(ranges)
+					for part_index, (start, stop) in enumerate(ranges):
+						yield (file, part_index), parsePdfRange, (file, start, stop)
+				else:
+					yield (file, None), _parseFileWorker, (file,)
+
+		pending = tasks()
+		futures = {} # future -> (file, номер куска или None для файла целиком)
+
+		def submit():
+			for key, func, args in islice(pending, max(0, in_flight - len(futures))):
+				futures[pool.submit(func, *args)] = key
+
+		submit()
+		while futures:
+			done, _ = wait(futures, return_when=FIRST_COMPLETED)
+			for future in done:
+				file, part_index = futures.pop(future)
+				submit()
+				try:
+					result = future.result()
+				except Exception as e: # исключение в куске или процесс пула упал (BrokenProcessPool)
+					if part_index is None or parts.pop(file, None) is not None:
+						yield file, None, f'{type(e).__name__}: {e}'
+					continue
+
+				if part_index is None:
+					yield result
+					continue
+				if file not in parts: continue # другой кусок этого файла уже упал
+				parts[file][part_index] = result
+				if all(part is not None for part in parts[file]):
+					try:
+						yield file, self.parsers[file.suffix].assemble(file, parts.pop(file)), None
+					except Exception as e:
+						yield file, None, f'{type(e).__name__}: {e}'
+
+	def _pageRanges(self, file):
+		'''Куски страниц файла для пула; не PDF или файл не открылся - [None] (файл целиком)'''
+		parser = self.parsers[file.suffix]
+		if not isinstance(parser, PdfParser): return [None]
+		try:
+			return parser.pageRanges(file)
+		except Exception:
+			return [None] # ошибку покажет разбор файла целиком
+
+	def _countMetrics(self, result):
+		'''Решения OCR из результата парсера -> self.ingest_metrics (из документа они убираются)'''
+		if not result: return
+		for decision, count in result.pop('ocr_stats', {}).items():
+			key = f'ocr.{decision}'
+			self.ingest_metrics[key] = self.ingest_metrics.get(key, 0) + count
+
+	def _writeBatch(self, batch):
+		'''Запись пачки разобранных документов в базу (одной пакетной записью) -> [(file, doc_id или None)]'''
+		if not self.database:
+			return [(file, True) for file, _ in batch]
+		if not batch:
+			return []
+		written = self.database.insertMany([result for _, result in batch])
+		for (file, _), (_, error) in zip(batch, written):
+			if error: print(f'FileManager._writeBatch {ERROR}: {file.name} - {error}')
+		return [(file, doc_id) for (file, _), (doc_id, _) in zip(batch, written)]
+
+
+	def renderToPic(self, path, page_index = None, output_path = None, zoom=1.0):
+		file_path = Path(normalizePath(path))
 		
 		# проверка пути к файлу
 		if not file_path.exists():
@@ -177,13 +573,174 @@ class FileManager():
 		#print(f'renderToPic {INFO}: {page_index=} файла {file_path.name} сохранена в "{saved_path}"')
 		return saved_path
 	
+	def docHash(self, file_path) -> str:
+		'''
+		Хеш содержимого файла для ключа кеша страниц: из манифеста базы, если файл с тех пор
+		не менялся, иначе считается (один раз на версию файла)
+		'''
+		stat = os.stat(file_path)
+		signature = (str(file_path), stat.st_size, stat.st_mtime)
+		digest = self._doc_hashes.get(signature)
+		if digest: return digest
+
+		if self.database is not None:
+			doc_path = self._docPath(file_path)
+			entry = self.database.manifestFor([doc_path]).get(doc_path)
+			if entry and entry.get("hash") and (entry["size"], entry["mtime"]) == (stat.st_size, stat.st_mtime):
+				digest = entry["hash"]
+		digest = digest or self.fileHash(file_path)
+		self._doc_hashes[signature] = digest
+		return digest
+
+	def _renderCache(self):
+		with self._render_lock:
+			if self.render_cache is None:
+				self.render_cache = RenderCache()
+		return self.render_cache
+
+	def _renderKey(self, file_path, page_index, zoom):
+		'''ключ страницы в кеше или None, если файл не читается'''
+		try:
+			return self._renderCache().makeKey(self.docHash(file_path), page_index, zoom)
+		except OSError as e:
+			print(f"FileManager._renderKey {ERROR}: {file_path} - {e}")
+			return None
+
+	def renderCached(self, path, page_index, zoom=1.0):
+		'''
+		Путь к картинке страницы из общего кеша (RenderCache): страница рисуется,
+		только если её ещё нет в кеше. None - страница не отрисована
+		'''
+		file_path = Path(self._docPath(path))
+		parser = self.parsers.get(file_path.suffix)
+		if not hasattr(parser, 'renderPixmap'):
+			# картинка сама и есть страница
+			return file_path if file_path.is_file() else None
+
+		key = self._renderKey(file_path, page_index, zoom)
+		if key is None: return None
+		cache = self._renderCache()
+		cached = cache.get(key)
+		if cached: return cached
+
+		pix = parser.renderPixmap(file_path, page_index, zoom)
+		if pix is None: return None
+		temp_path = cache.tempPath(key)
+		pix.save(str(temp_path))
+		return cache.put(key, temp_path)
+
+	def renderPage(self, path, page_index, zoom=1.0, cache_write=RENDER_CACHE_WRITE):
+		'''
+		Страница для отправки (в highlightPage): путь к картинке из кеша или, если её там нет,
+		fitz.Pixmap, отрисованный в память - без записи и повторного чтения файла.
+		cache_write=True - отрисованная страница пишется в кеш в фоне. None - страница не отрисована
+		'''
+		file_path = Path(self._docPath(path))
+		parser = self.parsers.get(file_path.suffix)
+		if not hasattr(parser, 'renderPixmap'):
+			return file_path if file_path.is_file() else None
+
+		key = self._renderKey(file_path, page_index, zoom)
+		if key is None: return None
+		cache = self._renderCache()
+		cached = cache.get(key) or cache.getPending(key)
+		if cached is not None: return cached
+
+		pix = parser.renderPixmap(file_path, page_index, zoom)
+		if pix is None: return None
+		if cache_write:
+			# у картинки для кеша своя копия пикселей: пиксмап уходит на обводку и отправку
+			cache.putAsync(key, self._pixmapImage(pix))
+		return pix
+
+	@staticmethod
+	def _pixmapImage(pix):
+		'''
+		RGB PIL-картинка со своей копией пикселей fitz.Pixmap (пиксмап не меняется).
+		RGB PIL не отображает на чужой буфер - frombuffer копирует пиксели сам, поэтому
+		они читаются через samples_mv (без промежуточной копии в bytes, как у pix.samples)
+		'''
+		mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[pix.n]
+		img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, 'raw', mode, pix.stride, 1)
+		return img if mode == 'RGB' else img.convert('RGB')
+
+	@classmethod
+	def _pageImage(cls, page):
+		'''
+		PIL-картинка страницы, на которой можно рисовать: путь к картинке - читается,
+		PIL.Image и fitz.Pixmap - копируются один раз (исходная страница не меняется)
+		'''
+		if isinstance(page, Image.Image):
+			return page.copy() if page.mode == 'RGB' else page.convert('RGB')
+		if hasattr(page, 'samples_mv'): # fitz.Pixmap
+			return cls._pixmapImage(page)
+		return Image.open(page).convert('RGB')
+
+	@staticmethod
+	def _boxOf(coords, zoom=1.0):
+		'''(x0, y0, x1, y1) из (x0, y0, x1, y1) или ((x0,y0), (x1,y0), (x1,y1), (x0,y1)), с учётом zoom'''
+		if len(coords) == 4 and all(isinstance(c, (int, float)) for c in coords):
+			x0, y0, x1, y1 = coords
+		elif len(coords) == 4 and all(len(p) == 2 for p in coords):
+			xs, ys = [p[0] for p in coords], [p[1] for p in coords]
+			x0, y0, x1, y1 = min(xs), min(ys), max(xs), max(ys)
+		else:
+			raise ValueError(f"FileManager._boxOf {ERROR}: Некорректный формат координат. Ожидается (x0,y0,x1,y1) или [(x0,y0), (x1,y0), (x1,y1), (x0,y1)]\nПолучено: {coords=}")
+		return x0 * zoom, y0 * zoom, x1 * zoom, y1 * zoom
+
+	@staticmethod
+	def mergeBoxes(boxes, gap=HIGHLIGHT_MERGE_GAP) -> list:
+		'''
+		boxes - рамки слов одного вхождения фразы (в порядке чтения): соседние рамки на одной строке
+		и не дальше gap высот строки друг от друга сливаются в одну. Фраза на двух строках - две рамки
+		'''
+		merged = []
+		for box in boxes:
+			if merged:
+				x0, y0, x1, y1 = merged[-1]
+				height = max(y1 - y0, box[3] - box[1], 1)
+				same_line = min(y1, box[3]) - max(y0, box[1]) >= 0.5 * min(y1 - y0, box[3] - box[1])
+				distance = max(0, max(x0, box[0]) - min(x1, box[2]))
+				if same_line and distance <= gap * height:
+					merged[-1] = (min(x0, box[0]), min(y0, box[1]), max(x1, box[2]), max(y1, box[3]))
+					continue
+			merged.append(tuple(box))
+		return merged
+
+	@classmethod
+	def highlightPage(cls, page, coords_list, color=OUTLINE_COLOR, zoom=1.0, image_format='PNG', hit_size=None) -> bytes:
+		'''
+		Обводит все найденное на странице за один проход и кодирует картинку один раз.
+		page - путь к картинке, PIL.Image или fitz.Pixmap (сама страница не меняется).
+		coords_list - координаты слов (как в результатах поиска), hit_size - слов в одном вхождении
+		(поле hit_size результата): слова одного вхождения - одной рамкой, разные вхождения
+		не сливаются. Без hit_size каждое слово обводится отдельно
+		'''
+		img = cls._pageImage(page)
+		hit_size = hit_size or 1
+		boxes = []
+		for start in range(0, len(coords_list), hit_size):
+			boxes += cls.mergeBoxes([cls._boxOf(coords, zoom) for coords in coords_list[start:start + hit_size]])
+
+		draw = ImageDraw.Draw(img)
+		# вычисление целой ширины обводки не меньше 1
+		line_width = max(1, int(sqrt(img.width * img.height) * OUTLINE_FACTOR))
+		for x0, y0, x1, y1 in boxes:
+			draw.rectangle((int(x0), int(y0), int(x1), int(y1)), outline=color, width=line_width)
+
+		buffer = io.BytesIO()
+		img.save(buffer, format=image_format)
+		return buffer.getvalue()
+
 	@staticmethod
 	def drawRectangle(image_path, coords, output_path=None, color=OUTLINE_COLOR, zoom=1.0):
-		image_path = Path(image_path)
+		# image_path - путь к картинке или уже открытая PIL.Image (рисуется на ней, без сохранения)
+		in_memory = isinstance(image_path, Image.Image)
+		image_path = image_path if in_memory else Path(image_path)
 		output_path = Path(output_path) if output_path is not None else None # либо None либо Path
 		# print(f'{cb('FileManager.drawRectangle')}: {image_path}')
 
-		img = Image.open(image_path)
+		img = image_path if in_memory else Image.open(image_path)
 		draw = ImageDraw.Draw(img)
 
 		# вычисление целой ширины обводки не меньше 1
@@ -228,8 +785,9 @@ class FileManager():
 			img.save(output_path)
 			#  fact_coords = {[up_line, right_line, down_line, left_line]}
 			#print(f'FileManager.drawRectangle {OK}: {image_path.name}: {coords=}, {str(output_path)=}')
-		else:
+		elif not in_memory:
 			img.show()
+		return img
 
 SAMPLE_LECTURE = {
 
@@ -0,0 +1,244 @@
+import os, sys, time, select, struct, ctypes, ctypes.util
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .file_manager_configs import ERROR, OK, INFO, cb
+from .file_manager_configs import WATCH_BACKEND, WATCH_DEBOUNCE, WATCH_POLL_INTERVAL, WATCH_TICK
+
+
+'''
+слежение за директорией для FileManager.watchPath
+
+источник событий:
+- InotifySource - inotify ядра Linux (через ctypes, без зависимостей), рекурсивно по поддиректориям
+- PollingSource - обход директории раз в WATCH_POLL_INTERVAL и сравнение (size, mtime)
+
+DirectoryWatcher копит изменённые пути и отдаёт файл в разбор, когда он затих:
+событий не было WATCH_DEBOUNCE секунд и (size, mtime) не поменялись с прошлой проверки
+(файл ещё копируется - ждём дальше). готовые файлы идут через тот же путь, что и syncPath
+(манифест, замена документа на месте), пул разбора - постоянный, на workers процессов.
+'''
+
+
+class PollingSource:
+	def __init__(self, root, extensions, interval=WATCH_POLL_INTERVAL):
+		self.root = Path(root)
+		self.extensions = set(extensions)
+		self.interval = interval
+		self._snapshot = self._scan()
+		self._last = time.monotonic()
+
+	def _scan(self) -> dict:
+		snapshot = {}
+		for dir_path, _, names in os.walk(self.root):
+			for name in names:
+				if Path(name).suffix not in self.extensions: continue
+				path = os.path.join(dir_path, name)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				snapshot[path] = (stat.st_size, stat.st_mtime)
+		return snapshot
+
+	def poll(self, timeout):
+		'''(изменённые/появившиеся/исчезнувшие пути, нужен ли полный пересмотр)'''
+		wait = self.interval - (time.monotonic() - self._last)
+		if wait > 0:
+			time.sleep(min(wait, timeout))
+			if time.monotonic() - self._last < self.interval: return set(), False
+
+		snapshot = self._scan()
+		self._last = time.monotonic()
+		changed = {path for path, sig in snapshot.items() if self._snapshot.get(path) != sig}
+		changed |= self._snapshot.keys() - snapshot.keys()
+		self._snapshot = snapshot
+		return changed, False
+
+	def close(self):
+		pass
+
+
+class InotifySource:
+	IN_MODIFY = 0x2
+	IN_CLOSE_WRITE = 0x8
+	IN_MOVED_FROM = 0x40
+	IN_MOVED_TO = 0x80
+	IN_CREATE = 0x100
+	IN_DELETE = 0x200
+	IN_DELETE_SELF = 0x400
+	IN_Q_OVERFLOW = 0x4000
+	IN_IGNORED = 0x8000
+	IN_ISDIR = 0x40000000
+	_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+	_EVENT = struct.Struct('iIII') # wd, mask, cookie, len (+ имя длины len)
+
+	def __init__(self, root, extensions):
+		self.root = Path(root)
+		self.extensions = set(extensions)
+		self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1')
+		self.dirs = {} # wd -> директория
+		self._addTree(self.root)
+
+	@staticmethod
+	def available() -> bool:
+		return sys.platform.startswith('linux')
+
+	def _addWatch(self, directory):
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self._MASK)
+		if wd < 0:
+			print(f'InotifySource._addWatch {ERROR}: {directory} (errno {ctypes.get_errno()})')
+			return
+		self.dirs[wd] = str(directory)
+
+	def _addTree(self, directory) -> set:
+		'''следит за директорией и всеми поддиректориями, возвращает уже лежащие в них файлы'''
+		found = set()
+		for dir_path, _, names in os.walk(directory):
+			self._addWatch(dir_path)
+			found |= {os.path.join(dir_path, name) for name in names if Path(name).suffix in self.extensions}
+		return found
+
+	def poll(self, timeout):
+		'''(изменённые/появившиеся/исчезнувшие пути, нужен ли полный пересмотр)'''
+		readable, _, _ = select.select([self.fd], [], [], timeout)
+		if not readable: return set(), False
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return set(), False
+
+		changed, rescan = set(), False
+		offset = 0
+		while offset < len(data):
+			wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+			offset += self._EVENT.size
+			name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+			offset += length
+
+			if mask & self.IN_Q_OVERFLOW:
+				rescan = True # очередь ядра переполнилась - события потеряны
+				continue
+			if mask & self.IN_IGNORED:
+				self.dirs.pop(wd, None)
+				continue
+			directory = self.dirs.get(wd)
+			if directory is None or not name: continue
+
+			path = os.path.join(directory, name)
+			if mask & self.IN_ISDIR:
+				if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+					changed |= self._addTree(path) # файлы могли появиться раньше, чем мы начали следить
+				elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+					changed.add(path) # документы всех файлов внутри - на удаление
+			elif Path(name).suffix in self.extensions:
+				changed.add(path)
+		return changed, rescan
+
+	def close(self):
+		os.close(self.fd)
+
+
+class DirectoryWatcher:
+	def __init__(self, file_manager, root, workers, initializer, backend=WATCH_BACKEND):
+		self.fm = file_manager
+		self.root = Path(root)
+		self.workers = workers
+		self.initializer = initializer
+		extensions = self.fm.parsers.keys()
+
+		if backend == 'auto':
+			backend = 'inotify' if InotifySource.available() else 'polling'
+		self.source = None
+		if backend == 'inotify':
+			try:
+				self.source = InotifySource(self.root, extensions)
+			except OSError as e:
+				print(f'DirectoryWatcher {ERROR}: inotify недоступен ({e}), обход директории')
+		if self.source is None:
+			self.source = PollingSource(self.root, extensions)
+		print(f'DirectoryWatcher {INFO}: {self.root}, источник - {type(self.source).__name__}, процессов разбора - {workers}')
+
+		self.pending = {} # путь -> (время последнего события, (size, mtime) при прошлой проверке или None)
+
+	def run(self, stop_event=None):
+		'''Цикл слежения до stop_event.set() (или Ctrl+C)'''
+		pool = self._newPool()
+		try:
+			while stop_event is None or not stop_event.is_set():
+				changed, rescan = self.source.poll(WATCH_TICK)
+				now = time.monotonic()
+				for path in changed:
+					self.pending[path] = (now, None)
+				if rescan:
+					print(f'DirectoryWatcher.run {INFO}: события потеряны, полная синхронизация')
+					self.pending.clear()
+					self.fm.syncPath(self.root, self.workers)
+
+				ready, removed = self._settled(now)
+				if removed:
+					self._dropRemoved(removed)
+				if ready:
+					pool = self._syncReady(ready, pool)
+		except KeyboardInterrupt:
+			print(f'DirectoryWatcher.run {INFO}: остановлено')
+		finally:
+			pool.shutdown(cancel_futures=True)
+			self.source.close()
+
+	def _newPool(self):
+		return ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+
+	def _settled(self, now):
+		'''пути, которые затихли: (готовые файлы, исчезнувшие пути)'''
+		ready, removed = [], []
+		for path, (last_event, signature) in list(self.pending.items()):
+			if now - last_event < WATCH_DEBOUNCE: continue
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError:
+				removed.append(path)
+				del self.pending[path]
+				continue
+			current = (stat.st_size, stat.st_mtime)
+			if signature != current:
+				self.pending[path] = (now, current) # ещё пишется (или первая проверка) - ждём ещё
+				continue
+			del self.pending[path]
+			if os.path.isfile(path) and not Path(path).name.startswith(('.', '~$')):
+				ready.append(Path(path))
+		return ready, removed
+
+	def _dropRemoved(self, removed):
+		for path in removed:
+			doc_path = self.fm._docPath(path)
+			# удалённая директория - все файлы внутри неё
+			entries = self.fm.database.manifestFor([doc_path]) or self.fm.database.manifestEntries(doc_path)
+			for entry_path in entries:
+				self.fm.database.dropSynced(entry_path)
+
+	def _syncReady(self, files, pool):
+		manifest = self.fm.database.manifestFor([self.fm._docPath(file) for file in files])
+		changed, _ = self.fm._changedFiles(files, manifest)
+		if not changed: return pool
+
+		print(f"{cb('DirectoryWatcher')}: новых/изменённых файлов - {len(changed)}")
+		queue = self.fm._ingestQueue()
+		if queue is not None:
+			queue.enqueue([(file, *signature) for file, signature in changed.items()], 'sync')
+			okay_counter, error_files = self.fm._drainQueue(queue, self.root, self.workers, pool)
+		else:
+			okay_counter, error_files = self.fm._syncChanged(changed, self.workers, pool)
+		print(f'DirectoryWatcher {INFO}: <{okay_counter}/{len(error_files)}> <успешных/ошибочных> файлов')
+
+		# упавший процесс ломает пул целиком - для следующих файлов нужен новый
+		try:
+			pool.submit(os.getpid).result()
+		except BrokenProcessPool:
+			print(f'DirectoryWatcher {INFO}: пул разбора пересоздан')
+			pool = self._newPool()
+		return pool
@@ -12,7 +12,6 @@ def main():
 
 	'''
 	# TODO: переделать report_store?
-	# TODO: возможный ложный наход в kmpSearch?
 	'''
 
 
@@ -28,10 +27,10 @@ def regex_check_dir(directory):
 	
 def test_scenario():
 	'''сценарий чтобы добавить файлы в базу данных
-	выполнять 1 раз!'''
+	повторный запуск разбирает только новые и изменённые файлы'''
 	base = dao_service.DataBase(db_name='main')
 	files = file_manager.FileManager(base)
-	files.runPath('./files/')
+	files.syncPath('./files/')
 
 def cli_database():
 	database = dao_service.DataBase(db_name='cli')
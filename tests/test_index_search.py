@@ -0,0 +1,129 @@
+import copy
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+import dao_service.nosql as nosql
+from dao_service.nosql import DataBase
+
+
+def page(words) -> list:
+	# слова в одну строку слева направо - порядок чтения совпадает с порядком слов
+	return [
+		{"word": word, "coords": ((10.0 * i, 0.0), (10.0 * i + 8, 0.0), (10.0 * i + 8, 10.0), (10.0 * i, 10.0))}
+		for i, word in enumerate(words)
+	]
+
+
+def lecture(name, pages, subject='биология') -> dict:
+	return {
+		"filename": f"{name}.pdf",
+		"path": f"/files/{name}.pdf",
+		"tags": {"subject": subject, "date": "01.01.2024", "filetype": "pdf"},
+		"text": " ".join(" ".join(words) for words in pages),
+		"pages": [page(words) for words in pages],
+	}
+
+
+DOCS = [
+	lecture("a", [
+		["я", "люблю", "биологию", "очень", "сильно"],
+		["сильно", "очень", "люблю"],
+		["люблю", "биологию", "люблю", "биологию"],
+	]),
+	lecture("b", [
+		["биологию", "люблю"],
+		["очень", "очень", "очень"],
+		["я", "люблю"],                  # фраза "люблю биологию" разорвана границей страниц
+		["биологию", "и", "химию"],
+	], subject='химия'),
+	lecture("c", [["ничего", "общего"]]),
+]
+
+PHRASES = ["люблю биологию", "биологию люблю", "очень", "очень очень", "сильно очень люблю", "я люблю", "нет такого", "люблю химию"]
+
+
+@pytest.fixture
+def db(monkeypatch):
+	# mongomock 4.3 не принимает sort, который pymongo 4.13 передаёт в UpdateOne/ReplaceOne
+	for name in ('add_update', 'add_replace'):
+		original = getattr(mongomock.collection.BulkOperationBuilder, name)
+		monkeypatch.setattr(
+			mongomock.collection.BulkOperationBuilder, name,
+			(lambda original: lambda self, *args, sort=None, **kwargs: original(self, *args, **kwargs))(original)
+		)
+	monkeypatch.setattr(nosql, 'MongoClient', mongomock.MongoClient)
+	base = DataBase(db_name='test', collection_name='lectures', use_index=True, rank=False, fuzzy=False, query_cache=False, engine='python')
+	assert all(doc_id for doc_id, _ in base.insertMany(copy.deepcopy(DOCS)))
+	assert base.use_index
+	return base
+
+
+def hits(base, phrase, use_index, tag_filters=None) -> list:
+	base.use_index = use_index
+	return sorted(
+		(hit["path"], hit["page"], hit["coords"], hit["hit_size"])
+		for hit in base.search(phrase, tag_filters)
+	)
+
+
+@pytest.mark.parametrize("phrase", PHRASES)
+def test_index_matches_scan(db, phrase):
+	assert hits(db, phrase, True) == hits(db, phrase, False)
+
+
+def test_index_matches_scan_filtered(db):
+	assert hits(db, "люблю биологию", True, {"tags.subject": "химия"}) == hits(db, "люблю биологию", False, {"tags.subject": "химия"})
+
+
+def test_index_hits(db):
+	res = hits(db, "люблю биологию", True)
+	assert [(path, page, len(coords)) for path, page, coords, _ in res] == [("/files/a.pdf", 1, 2), ("/files/a.pdf", 3, 4)]
+	x = lambda i: [[10.0 * i, 0.0], [10.0 * i + 8, 0.0], [10.0 * i + 8, 10.0], [10.0 * i, 10.0]] # из базы координаты приходят списками # noqa: E731
+	assert res[1][2] == (x(0), x(1), x(2), x(3)) # оба вхождения страницы, по hit_size координат
+	assert res[1][3] == 2
+
+
+def docIds(db) -> dict:
+	return {doc["filename"]: str(doc["_id"]) for doc in db.collection.find({}, {"filename": 1})}
+
+
+def test_lookupPhrase_order(db):
+	ids = docIds(db)
+	assert db.lookupPhrase(["люблю", "биологию"]) == {ids["a.pdf"]: {0: [1], 2: [0, 2]}}
+	assert db.lookupPhrase(["биологию", "люблю"]) == {ids["a.pdf"]: {2: [1]}, ids["b.pdf"]: {0: [0]}}
+	assert db.lookupPhrase(["очень", "очень"]) == {ids["b.pdf"]: {1: [0, 1]}}
+
+
+def test_lookupPhrase_missing(db):
+	assert db.lookupPhrase(["люблю", "нет"]) == {}
+	assert db.lookupPhrase(["нет"]) == {}
+	assert db.lookupPhrase([]) == {}
+	# все слова есть, но не рядом
+	assert db.lookupPhrase(["я", "сильно"]) == {}
+
+
+def test_lookupPhrase_term_freqs(db):
+	ids = docIds(db)
+	term_freqs = {}
+	db.lookupPhrase(["люблю", "биологию"], term_freqs)
+	assert term_freqs == {
+		(ids["a.pdf"], 0): {"люблю": 1, "биологию": 1},
+		(ids["a.pdf"], 2): {"люблю": 2, "биологию": 2},
+	}
+
+
+def test_lookupPhrase_variants(db):
+	ids = docIds(db)
+	db.insertMany([lecture("ocr", [["я", "люблю", "биолопю", "и", "биологию"]])])
+	ocr = docIds(db)["ocr.pdf"]
+	assert db.lookupPhrase(["люблю", "биологию"]).get(ocr) is None
+	# вариант слова (ошибка OCR) - позиции всех вариантов объединяются
+	variants = {"биологию": ["биологию", "биолопю"]}
+	res = db.lookupPhrase(["люблю", "биологию"], variants=variants)
+	assert res[ocr] == {0: [1]}
+	assert res[ids["a.pdf"]] == {0: [1], 2: [0, 2]}
+	term_freqs = {}
+	db.lookupPhrase(["биологию"], term_freqs, variants)
+	assert term_freqs[(ocr, 0)] == {"биологию": 2}
@@ -0,0 +1,156 @@
+import time
+
+import pytest
+
+from file_manager.ingest_queue import IngestQueue, queuePath
+
+
+def makeQueue(path, owner=None, **kwargs):
+	queue = IngestQueue(path, **kwargs)
+	if owner: queue.owner = owner # другой процесс (на другом хосте - _reclaimDead его не трогает)
+	return queue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+	return tmp_path / 'ingest_queue.db'
+
+
+def job(queue, path):
+	return queue.conn.execute('SELECT state, attempts, owner, checkpoint, doc_id, error FROM jobs WHERE path = ?', (path,)).fetchone()
+
+
+def test_claim_complete(db_path):
+	queue = makeQueue(db_path)
+	assert queue.enqueue([('/data/a.pdf', 10, 1.0, None), ('/data/b.pdf', 20, 2.0, None)], 'insert') == 2
+
+	jobs = queue.claim('/data/', limit=5)
+	assert {item["path"] for item in jobs} == {'/data/a.pdf', '/data/b.pdf'}
+	assert all(item["attempts"] == 1 for item in jobs)
+	assert queue.claim('/data/') == [] # всё уже взято
+	assert queue.stats('/data/') == {'pending': 0, 'running': 2, 'done': 0, 'failed': 0}
+
+	queue.checkpoint('/data/a.pdf', 'parsed')
+	assert job(queue, '/data/a.pdf')[3] == 'parsed'
+	queue.complete('/data/a.pdf', 'doc1')
+	assert job(queue, '/data/a.pdf') == ('done', 1, None, 'written', 'doc1', None)
+
+
+def test_claim_prefix(db_path):
+	queue = makeQueue(db_path)
+	queue.enqueue([('/data/a.pdf', 1, 1.0, None), ('/other/b.pdf', 1, 1.0, None)], 'insert')
+	assert [item["path"] for item in queue.claim('/data/', limit=5)] == ['/data/a.pdf']
+
+
+def test_enqueue_done(db_path):
+	queue = makeQueue(db_path)
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert')
+	queue.claim()
+	queue.complete('/data/a.pdf', 'doc1')
+
+	# повторный runPath того же файла - выполненное задание не трогается
+	assert queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert') == 0
+	assert job(queue, '/data/a.pdf')[0] == 'done'
+	# файл изменился - снова pending, этап сброшен
+	assert queue.enqueue([('/data/a.pdf', 11, 2.0, None)], 'insert') == 1
+	assert job(queue, '/data/a.pdf')[:4] == ('pending', 0, None, None)
+
+	queue.claim()
+	queue.complete('/data/a.pdf', 'doc2')
+	# sync - решение принято по манифесту, выполненное задание снова pending
+	assert queue.enqueue([('/data/a.pdf', 11, 2.0, None)], 'sync') == 1
+	assert job(queue, '/data/a.pdf')[0] == 'pending'
+
+
+def test_enqueue_keeps_running(db_path):
+	queue = makeQueue(db_path)
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert')
+	queue.claim()
+	# задание в работе (аренда не истекла) повторным enqueue не сбрасывается
+	queue.enqueue([('/data/a.pdf', 11, 2.0, None)], 'sync')
+	assert job(queue, '/data/a.pdf')[:3] == ('running', 1, queue.owner)
+
+
+def test_fail_until_max_attempts(db_path):
+	queue = makeQueue(db_path, max_attempts=2)
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert')
+
+	queue.claim()
+	assert queue.fail('/data/a.pdf', 'битый файл') is False
+	assert job(queue, '/data/a.pdf')[:3] == ('pending', 1, None)
+
+	queue.claim()
+	assert queue.fail('/data/a.pdf', 'битый файл') is True
+	assert job(queue, '/data/a.pdf')[0] == 'failed'
+	assert queue.failed('/data/') == [('/data/a.pdf', 'битый файл')]
+	assert queue.claim() == []
+
+
+def test_fail_not_owner(db_path):
+	queue = makeQueue(db_path)
+	other = makeQueue(db_path, owner='otherhost:1')
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert')
+	queue.claim()
+	# чужое задание нельзя ни провалить, ни выполнить
+	assert other.fail('/data/a.pdf', 'ошибка') is False
+	other.complete('/data/a.pdf', 'doc1')
+	assert job(queue, '/data/a.pdf')[:3] == ('running', 1, queue.owner)
+
+
+def test_release(db_path):
+	queue = makeQueue(db_path)
+	other = makeQueue(db_path, owner='otherhost:1')
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None), ('/data/b.pdf', 10, 1.0, None)], 'insert')
+	queue.claim()
+	other.claim()
+
+	queue.release()
+	states = dict(queue.conn.execute('SELECT path, state FROM jobs').fetchall())
+	assert list(states.values()).count('pending') == 1 # задание другого процесса осталось у него
+	released = next(path for path, state in states.items() if state == 'pending')
+	assert job(queue, released)[:3] == ('pending', 0, None) # попытка не засчитана
+
+
+def test_expired_lease(db_path):
+	queue = makeQueue(db_path, lease=0.2)
+	other = makeQueue(db_path, owner='otherhost:1', lease=0.2)
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert')
+	queue.claim()
+	assert other.claim() == []
+
+	time.sleep(0.3)
+	jobs = other.claim()
+	assert [item["path"] for item in jobs] == ['/data/a.pdf']
+	assert jobs[0]["attempts"] == 2
+	# прежний владелец задание потерял
+	queue.complete('/data/a.pdf', 'doc1')
+	assert job(queue, '/data/a.pdf')[:3] == ('running', 2, other.owner)
+
+
+def test_keepAlive(db_path):
+	queue = makeQueue(db_path, lease=0.3)
+	other = makeQueue(db_path, owner='otherhost:1', lease=0.3)
+	queue.enqueue([('/data/a.pdf', 10, 1.0, None)], 'insert')
+	queue.claim()
+	with queue.keepAlive(interval=0.05):
+		time.sleep(0.6) # дольше аренды
+		assert other.claim() == []
+	assert job(queue, '/data/a.pdf')[2] == queue.owner
+
+
+def test_clear(db_path):
+	queue = makeQueue(db_path)
+	queue.enqueue([('/data/a.pdf', 1, 1.0, None), ('/data/b.pdf', 1, 1.0, None), ('/other/c.pdf', 1, 1.0, None)], 'insert')
+	for item in queue.claim(limit=5):
+		queue.complete(item["path"], 'doc')
+	queue.enqueue([('/data/b.pdf', 2, 2.0, None)], 'insert')
+
+	queue.clear('/data/')
+	assert dict(queue.conn.execute('SELECT path, state FROM jobs').fetchall()) == {
+		'/data/b.pdf': 'pending', '/other/c.pdf': 'done'
+	}
+
+
+def test_queuePath():
+	assert queuePath('main.files').name.endswith('.main.files.db')
+	assert queuePath('main/../x y').parent == queuePath('main.files').parent
@@ -0,0 +1,87 @@
+import io, gzip, json
+
+import pytest
+
+from dao_service.json_stream import DumpWriter, iterDump, dumpFormat, _iterArray
+
+
+DOCS = [
+	{"filename": "лекция.pdf", "pages": [[{"word": "очень", "coords": [[0, 0], [1, 1]]}]], "len_pages": 1},
+	{"filename": "b.png", "text": "строка с \"кавычками\", [скобками] и {фигурными}", "tags": {}},
+	{"filename": "c.docx", "nested": {"list": [1, 2, [3, 4]], "empty": []}},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 4096])
+def test_iterArray_chunk_boundaries(chunk_size):
+	# документы рвутся границами кусков в любом месте, в том числе внутри строк и чисел
+	text = json.dumps(DOCS, ensure_ascii=False, indent=4)
+	assert list(_iterArray(io.StringIO(text), chunk_size=chunk_size)) == DOCS
+
+
+@pytest.mark.parametrize("text", ["", "   \n\t ", "[]", "  [ \n ]  ", "[\n\n]\n"])
+def test_iterArray_empty(text):
+	assert list(_iterArray(io.StringIO(text), chunk_size=2)) == []
+
+
+def test_iterArray_scalars():
+	assert list(_iterArray(io.StringIO('[1, "a" ,null,\n true , 2.5]'), chunk_size=1)) == [1, "a", None, True, 2.5]
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', '[{"a": 1} {"b": 2}]', '[{"a": 1}, {"b": '])
+def test_iterArray_corrupt(text):
+	with pytest.raises(ValueError):
+		list(_iterArray(io.StringIO(text), chunk_size=3))
+
+
+@pytest.mark.parametrize("name, ndjson, compressed", [
+	("dump.json", False, False),
+	("dump.ndjson", True, False),
+	("dump.jsonl", True, False),
+	("dump.json.gz", False, True),
+	("dump.NDJSON.GZ", True, True),
+	("dump", False, False),
+])
+def test_dumpFormat(name, ndjson, compressed):
+	assert dumpFormat(name) == (ndjson, compressed)
+
+
+@pytest.mark.parametrize("name", ["dump.json", "dump.ndjson", "dump.json.gz", "dump.ndjson.gz"])
+def test_roundtrip(tmp_path, name):
+	path = tmp_path / name
+	with DumpWriter(path) as writer:
+		for doc in DOCS:
+			writer.write(doc)
+	assert writer.count == len(DOCS)
+	assert list(iterDump(path)) == DOCS
+
+
+@pytest.mark.parametrize("name", ["dump.json", "dump.ndjson", "dump.json.gz", "dump.ndjson.gz"])
+def test_roundtrip_empty(tmp_path, name):
+	path = tmp_path / name
+	DumpWriter(path).close()
+	assert list(iterDump(path)) == []
+
+
+def test_gzip_is_compressed(tmp_path):
+	path = tmp_path / "dump.json.gz"
+	with DumpWriter(path) as writer:
+		for doc in DOCS:
+			writer.write(doc)
+	with gzip.open(path, 'rt', encoding='utf-8') as file:
+		assert json.load(file) == DOCS
+
+
+def test_old_format_readable(tmp_path):
+	# дамп старого формата - массив, записанный json.dump целиком
+	path = tmp_path / "old.json"
+	path.write_text(json.dumps(DOCS, ensure_ascii=False), encoding='utf-8')
+	assert list(iterDump(path)) == DOCS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+def test_iterArray_numbers_split(chunk_size):
+	# число, разорванное границей куска, не должно читаться по частям
+	values = [12345, -6.25, 1e+30, 0, 2.5e-3, 100]
+	text = json.dumps(values)
+	assert list(_iterArray(io.StringIO(text), chunk_size=chunk_size)) == values
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from dao_service.nosql import DataBase, UtilityDBTools
+from dao_service.kmp_loader import loadKmp
+
+
+PAGES = [
+	["очень", "сильно", "люблю", "биологию", "очень"],  # фраза в начале, первое слово фразы в конце страницы
+	["сильно", "очень", "сильно"],                       # продолжение фразы с прошлой страницы не считается
+	[],
+	["очень"],
+	["а", "а", "а", "а"],                                # перекрывающиеся вхождения
+	["а", "б", "а", "б", "а", "б", "а"],
+	["сильно", "очень", "очень", "сильно", "очень", "сильно"],
+]
+
+NEEDLES = [
+	["очень", "сильно"],
+	["очень"],
+	["сильно", "очень"],
+	["а", "а"],
+	["а", "б", "а"],
+	["а", "а", "а", "а", "а"], # длиннее любой страницы
+	["нет"],
+]
+
+
+def pythonRows(pages, needle):
+	return [(row, pos) for row, words in enumerate(pages) for pos in UtilityDBTools.kmpSearch_python(words, needle, False)]
+
+
+def asRows(res) -> list:
+	return [tuple(row) for row in np.asarray(res).reshape(-1, 2).tolist()]
+
+
+class Engine(UtilityDBTools):
+	'''ровно то, что нужно DataBase._matchPages'''
+	def __init__(self, engine):
+		self.engine = engine
+
+
+def test_python_expected():
+	# опорный движок: индексы всех слов каждого вхождения, вхождения не переходят через границу страницы
+	assert pythonRows(PAGES, ["очень", "сильно"]) == [(0, 0), (0, 1), (1, 1), (1, 2), (6, 2), (6, 3), (6, 4), (6, 5)]
+	assert pythonRows(PAGES, ["а", "а"]) == [(4, 0), (4, 1), (4, 1), (4, 2), (4, 2), (4, 3)]
+
+
+@pytest.mark.parametrize("needle", NEEDLES)
+def test_numpy_matches_python(needle):
+	pages_ids = [UtilityDBTools.tokenIds(words) for words in PAGES]
+	assert asRows(UtilityDBTools.tokenSearch_batch(pages_ids, UtilityDBTools.tokenIds(needle))) == pythonRows(PAGES, needle)
+
+
+@pytest.mark.parametrize("needle", NEEDLES)
+def test_cpp_matches_python(needle):
+	if loadKmp() is None:
+		pytest.skip('C++ ядро недоступно (нет компилятора)')
+	assert asRows(UtilityDBTools.kmpSearch_batch(PAGES, needle, False)) == pythonRows(PAGES, needle)
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy", "cpp"])
+@pytest.mark.parametrize("needle", NEEDLES)
+def test_matchPages(engine, needle):
+	if engine == 'cpp' and loadKmp() is None:
+		pytest.skip('C++ ядро недоступно (нет компилятора)')
+	pages_ids = [UtilityDBTools.tokenIds(words) for words in PAGES]
+	assert asRows(DataBase._matchPages(Engine(engine), PAGES, pages_ids, needle)) == pythonRows(PAGES, needle)
+
+
+def test_matchPages_without_ids():
+	# хеши не подгружались (движок сменился на ходу) - numpy считает их сам
+	assert asRows(DataBase._matchPages(Engine('numpy'), PAGES, [], ["а", "б", "а"])) == pythonRows(PAGES, ["а", "б", "а"])
+
+
+def test_empty():
+	assert asRows(UtilityDBTools.tokenSearch_batch([], UtilityDBTools.tokenIds(["а"]))) == []
+	assert asRows(UtilityDBTools.kmpSearch_batch([], ["а"], False)) == []
+	assert asRows(UtilityDBTools.kmpSearch_batch(PAGES, [], False)) == []